@@ -0,0 +1,135 @@
+"""Request arrival processes for benchmark_serving.
+
+Every process turns a number of requests into a schedule of send times, in
+seconds from the start of the benchmark, drawn at once with NumPy's global
+random state (seeded by --seed).
+"""
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+
+def _cumulative(intervals: np.ndarray) -> np.ndarray:
+    # The first request is sent immediately and each interval delays the next.
+    arrival_times = np.zeros(len(intervals))
+    np.cumsum(intervals[:-1], out=arrival_times[1:])
+    return arrival_times
+
+
+def _unit_rate_arrivals(num_requests: int) -> np.ndarray:
+    return _cumulative(np.random.exponential(1.0, size=num_requests))
+
+
+def poisson_arrivals(num_requests: int, request_rate: float) -> np.ndarray:
+    """Exponential inter-arrival times."""
+    return _cumulative(
+        np.random.exponential(1.0 / request_rate, size=num_requests))
+
+
+def gamma_arrivals(num_requests: int,
+                   request_rate: float,
+                   burstiness: float = 1.0) -> np.ndarray:
+    """Gamma inter-arrival times with the mean of `request_rate`.
+
+    `burstiness` is the squared coefficient of variation of the intervals:
+    1 is a Poisson process, larger values cluster requests into bursts and
+    smaller ones space them more evenly.
+    """
+    shape = 1.0 / burstiness
+    return _cumulative(
+        np.random.gamma(shape, 1.0 / (request_rate * shape),
+                        size=num_requests))
+
+
+def on_off_arrivals(num_requests: int,
+                    request_rate: float,
+                    on_duration: float = 10.0,
+                    off_duration: float = 10.0) -> np.ndarray:
+    """Poisson bursts of `on_duration` seconds separated by `off_duration`
+    seconds without requests, at an average of `request_rate`."""
+    on_rate = request_rate * (on_duration + off_duration) / on_duration
+    active_times = poisson_arrivals(num_requests, on_rate)
+    return active_times + np.floor(active_times / on_duration) * off_duration
+
+
+def _piecewise_linear_intensity_arrivals(num_requests: int,
+                                         times: np.ndarray,
+                                         rates: np.ndarray) -> np.ndarray:
+    """Non-homogeneous Poisson arrivals for a rate that is linear between
+    `times` and constant after the last one, by inverting the cumulative
+    intensity at unit-rate arrivals."""
+    segment_areas = np.diff(times) * (rates[:-1] + rates[1:]) / 2
+    cumulative = np.concatenate(([0.0], np.cumsum(segment_areas)))
+    targets = _unit_rate_arrivals(num_requests)
+
+    segments = np.searchsorted(cumulative, targets, side="right") - 1
+    arrival_times = np.empty(num_requests)
+    after = segments >= len(times) - 1
+    arrival_times[after] = times[-1] + (targets[after] -
+                                        cumulative[-1]) / rates[-1]
+
+    inside = ~after
+    segment = segments[inside]
+    start, rate = times[segment], rates[segment]
+    slope = (rates[segment + 1] - rate) / (times[segment + 1] - start)
+    remaining = targets[inside] - cumulative[segment]
+    # Solve rate * dt + slope / 2 * dt^2 = remaining for dt.
+    flat = np.abs(slope) < 1e-12
+    dt = np.empty(len(segment))
+    dt[flat] = remaining[flat] / rate[flat]
+    curved = ~flat
+    dt[curved] = (np.sqrt(rate[curved]**2 + 2 * slope[curved] *
+                          remaining[curved]) - rate[curved]) / slope[curved]
+    arrival_times[inside] = start + dt
+    return arrival_times
+
+
+def ramp_arrivals(num_requests: int,
+                  request_rate: float,
+                  ramp_duration: float = 60.0,
+                  ramp_start_rate: float = 0.1) -> np.ndarray:
+    """Poisson arrivals whose rate grows linearly from `ramp_start_rate` to
+    `request_rate` over `ramp_duration` seconds and then stays there."""
+    return _piecewise_linear_intensity_arrivals(
+        num_requests, np.array([0.0, ramp_duration]),
+        np.array([ramp_start_rate, request_rate]))
+
+
+def step_arrivals(num_requests: int,
+                  request_rate: float,
+                  step_rates: List[float] = (1.0, ),
+                  step_duration: float = 60.0) -> np.ndarray:
+    """Poisson arrivals at each of `step_rates` for `step_duration` seconds in
+    turn, staying at the last rate. `request_rate` is not used."""
+    step_rates = np.asarray(step_rates, dtype=np.float64)
+    # Duplicate the breakpoints so the rate jumps instead of ramping.
+    step_starts = np.arange(len(step_rates), dtype=np.float64) * step_duration
+    times = np.repeat(step_starts, 2)[1:]
+    rates = np.repeat(step_rates, 2)[:-1]
+    # Nudge the duplicated points apart to keep every segment well defined.
+    times[2::2] += 1e-9
+    return _piecewise_linear_intensity_arrivals(num_requests, times, rates)
+
+
+ARRIVAL_PROCESSES: Dict[str, Callable[..., np.ndarray]] = {
+    "poisson": poisson_arrivals,
+    "gamma": gamma_arrivals,
+    "on-off": on_off_arrivals,
+    "ramp": ramp_arrivals,
+    "step": step_arrivals,
+}
+
+# Processes whose schedule does not depend on --request-rate.
+RATE_INDEPENDENT_PROCESSES = ("step", )
+
+
+def arrival_result_fields(arrival_process: str,
+                          arrival_params: Dict[str, Any]) -> Dict[str, Any]:
+    """Flat result JSON fields describing the arrival process, so that
+    results can be grouped by them."""
+    fields: Dict[str, Any] = {"arrival_process": arrival_process}
+    for name, value in arrival_params.items():
+        if isinstance(value, (list, tuple)):
+            value = ",".join(f"{v:g}" for v in value)
+        fields[f"arrival_{name}"] = value
+    return fields
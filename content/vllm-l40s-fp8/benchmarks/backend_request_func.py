@@ -3,8 +3,9 @@ import os
 import sys
 import time
 import traceback
+from contextlib import asynccontextmanager
 from dataclasses import dataclass, field
-from typing import List, Optional, Union
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
 
 import aiohttp
 import huggingface_hub.constants
@@ -12,8 +13,101 @@ from tqdm.asyncio import tqdm
 from transformers import (AutoTokenizer, PreTrainedTokenizer,
                           PreTrainedTokenizerFast)
 
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
 AIOHTTP_TIMEOUT = aiohttp.ClientTimeout(total=6 * 60 * 60)
 
+SSE_DONE = b"[DONE]"
+_SSE_SKIPPED_FIELDS = (b"event:", b"id:", b"retry:")
+
+
+def create_client_session(
+    max_connections: int = 0,
+    max_connections_per_host: int = 0,
+    keepalive_timeout: float = 60.0,
+    dns_cache_ttl: int = 300,
+) -> aiohttp.ClientSession:
+    """Create a pooled client session to be shared by all requests.
+
+    A limit of 0 means no limit on the number of pooled connections.
+    Connections are kept alive between requests and DNS lookups are cached
+    so that connection setup is not counted in the request latencies.
+    Must be called from within a running event loop.
+    """
+    connector = aiohttp.TCPConnector(
+        limit=max_connections,
+        limit_per_host=max_connections_per_host,
+        keepalive_timeout=keepalive_timeout,
+        ttl_dns_cache=dns_cache_ttl,
+        use_dns_cache=True,
+        enable_cleanup_closed=True,
+    )
+    return aiohttp.ClientSession(connector=connector,
+                                 timeout=AIOHTTP_TIMEOUT)
+
+
+@asynccontextmanager
+async def _session_scope(
+    session: Optional[aiohttp.ClientSession]
+) -> AsyncIterator[aiohttp.ClientSession]:
+    # Reuse the caller's pooled session if given, otherwise fall back to a
+    # one-off session that is closed when the request finishes.
+    if session is not None:
+        yield session
+        return
+    async with aiohttp.ClientSession(timeout=AIOHTTP_TIMEOUT) as session:
+        yield session
+
+
+def _sse_payload(line: bytes) -> Optional[bytes]:
+    line = line.strip()
+    # Skip blank event separators and comments, e.g. TGI's keep-alive pings.
+    if not line or line.startswith(b":"):
+        return None
+    if line.startswith(b"data:"):
+        return line[5:].lstrip()
+    if line.startswith(_SSE_SKIPPED_FIELDS):
+        return None
+    # Some servers stream bare JSON lines without the SSE framing.
+    return line
+
+
+async def iter_sse_data(
+    content: aiohttp.StreamReader,
+    output: Optional["RequestFuncOutput"] = None,
+) -> AsyncIterator[Tuple[float, bytes]]:
+    """Yield `(arrival_time, payload)` for each data line of an SSE stream.
+
+    Works on the raw response bytes. The arrival time is taken as soon as a
+    network read returns and before any decoding, so latencies measured from
+    it are not inflated by the client's parsing. Payloads are left as bytes
+    for `json_loads`, which uses orjson when it is installed. If `output` is
+    given, the time from each read until the caller has handled all of its
+    payloads is added to `output.parse_time`.
+    """
+    buffer = b""
+    timestamp = time.perf_counter()
+    async for chunk in content.iter_any():
+        timestamp = time.perf_counter()
+        if b"\n" not in chunk:
+            buffer += chunk
+        else:
+            lines = (buffer + chunk).split(b"\n")
+            buffer = lines.pop()
+            for line in lines:
+                payload = _sse_payload(line)
+                if payload is not None:
+                    yield timestamp, payload
+        if output is not None:
+            output.parse_time += time.perf_counter() - timestamp
+    payload = _sse_payload(buffer)
+    if payload is not None:
+        yield timestamp, payload
+
 
 @dataclass
 class RequestFuncInput:
@@ -24,6 +118,9 @@ class RequestFuncInput:
     model: str
     best_of: int = 1
     use_beam_search: bool = False
+    # Chat history sent instead of `prompt` by the chat completions backend,
+    # e.g. for multi-turn sessions.
+    messages: Optional[List[Dict[str, str]]] = None
 
 
 @dataclass
@@ -36,16 +133,25 @@ class RequestFuncOutput:
         default_factory=list)  # List of inter-token latencies
     prompt_len: int = 0
     error: str = ""
+    # perf_counter() when the request was sent. The benchmark driver rebases
+    # it to seconds since the start of the run.
+    start_time: float = 0.0
+    # Seconds the client spent handling the response stream, see
+    # `iter_sse_data`.
+    parse_time: float = 0.0
+    # Output tokens as counted by the server, None if it reported no usage.
+    output_tokens: Optional[int] = None
 
 
 async def async_request_tgi(
     request_func_input: RequestFuncInput,
     pbar: Optional[tqdm] = None,
+    session: Optional[aiohttp.ClientSession] = None,
 ) -> RequestFuncOutput:
     api_url = request_func_input.api_url
     assert api_url.endswith("generate_stream")
 
-    async with aiohttp.ClientSession(timeout=AIOHTTP_TIMEOUT) as session:
+    async with _session_scope(session) as session:
         assert not request_func_input.use_beam_search
         params = {
             "best_of": request_func_input.best_of,
@@ -53,6 +159,8 @@ async def async_request_tgi(
             "do_sample": True,
             "temperature": 0.01,  # TGI does not accept 0.0 temperature.
             "top_p": 0.99,  # TGI does not accept 1.0 top_p.
+            # The last event then carries the number of generated tokens.
+            "details": True,
         }
         payload = {
             "inputs": request_func_input.prompt,
@@ -63,27 +171,19 @@ async def async_request_tgi(
 
         ttft = 0.0
         st = time.perf_counter()
+        output.start_time = st
         most_recent_timestamp = st
         try:
             async with session.post(url=api_url, json=payload) as response:
                 if response.status == 200:
-                    async for chunk_bytes in response.content:
-                        chunk_bytes = chunk_bytes.strip()
-                        if not chunk_bytes:
-                            continue
-                        chunk_bytes = chunk_bytes.decode("utf-8")
-
-                        #NOTE: Sometimes TGI returns a ping response without
-                        # any data, we should skip it.
-                        if chunk_bytes.startswith(":"):
-                            continue
-                        chunk = remove_prefix(chunk_bytes, "data:")
-
-                        data = json.loads(chunk)
-                        timestamp = time.perf_counter()
+                    # NOTE: Sometimes TGI returns a ping response without
+                    # any data, iter_sse_data skips it.
+                    async for timestamp, chunk in iter_sse_data(
+                            response.content, output):
+                        data = json_loads(chunk)
                         # First token
                         if ttft == 0.0:
-                            ttft = time.perf_counter() - st
+                            ttft = timestamp - st
                             output.ttft = ttft
 
                         # Decoding phase
@@ -96,6 +196,9 @@ async def async_request_tgi(
                     output.latency = most_recent_timestamp - st
                     output.success = True
                     output.generated_text = data["generated_text"]
+                    if data.get("details"):
+                        output.output_tokens = data["details"].get(
+                            "generated_tokens")
                 else:
                     output.error = response.reason or ""
                     output.success = False
@@ -112,11 +215,12 @@ async def async_request_tgi(
 async def async_request_trt_llm(
     request_func_input: RequestFuncInput,
     pbar: Optional[tqdm] = None,
+    session: Optional[aiohttp.ClientSession] = None,
 ) -> RequestFuncOutput:
     api_url = request_func_input.api_url
     assert api_url.endswith("generate_stream")
 
-    async with aiohttp.ClientSession(timeout=AIOHTTP_TIMEOUT) as session:
+    async with _session_scope(session) as session:
         assert not request_func_input.use_beam_search
         assert request_func_input.best_of == 1
         payload = {
@@ -132,24 +236,18 @@ async def async_request_trt_llm(
 
         ttft = 0.0
         st = time.perf_counter()
+        output.start_time = st
         most_recent_timestamp = st
         try:
             async with session.post(url=api_url, json=payload) as response:
                 if response.status == 200:
-                    async for chunk_bytes in response.content:
-                        chunk_bytes = chunk_bytes.strip()
-                        if not chunk_bytes:
-                            continue
-
-                        chunk = remove_prefix(chunk_bytes.decode("utf-8"),
-                                              "data:")
-
-                        data = json.loads(chunk)
+                    async for timestamp, chunk in iter_sse_data(
+                            response.content, output):
+                        data = json_loads(chunk)
                         output.generated_text += data["text_output"]
-                        timestamp = time.perf_counter()
                         # First token
                         if ttft == 0.0:
-                            ttft = time.perf_counter() - st
+                            ttft = timestamp - st
                             output.ttft = ttft
 
                         # Decoding phase
@@ -178,8 +276,9 @@ async def async_request_trt_llm(
 async def async_request_deepspeed_mii(
     request_func_input: RequestFuncInput,
     pbar: Optional[tqdm] = None,
+    session: Optional[aiohttp.ClientSession] = None,
 ) -> RequestFuncOutput:
-    async with aiohttp.ClientSession(timeout=AIOHTTP_TIMEOUT) as session:
+    async with _session_scope(session) as session:
         assert request_func_input.best_of == 1
         assert not request_func_input.use_beam_search
 
@@ -198,6 +297,7 @@ async def async_request_deepspeed_mii(
         output.ttft = 0
 
         st = time.perf_counter()
+        output.start_time = st
         try:
             async with session.post(url=request_func_input.api_url,
                                     json=payload) as response:
@@ -222,13 +322,14 @@ async def async_request_deepspeed_mii(
 async def async_request_openai_completions(
     request_func_input: RequestFuncInput,
     pbar: Optional[tqdm] = None,
+    session: Optional[aiohttp.ClientSession] = None,
 ) -> RequestFuncOutput:
     api_url = request_func_input.api_url
     assert api_url.endswith(
         ("completions", "profile")
     ), "OpenAI Completions API URL must end with 'completions' or 'profile'."
 
-    async with aiohttp.ClientSession(timeout=AIOHTTP_TIMEOUT) as session:
+    async with _session_scope(session) as session:
         assert not request_func_input.use_beam_search
         payload = {
             "model": request_func_input.model,
@@ -237,6 +338,9 @@ async def async_request_openai_completions(
             "best_of": request_func_input.best_of,
             "max_tokens": request_func_input.output_len,
             "stream": True,
+            "stream_options": {
+                "include_usage": True,
+            },
         }
         headers = {
             "Authorization": f"Bearer {os.environ.get('OPENAI_API_KEY')}"
@@ -248,31 +352,30 @@ async def async_request_openai_completions(
         generated_text = ""
         ttft = 0.0
         st = time.perf_counter()
+        output.start_time = st
         most_recent_timestamp = st
         try:
             async with session.post(url=api_url, json=payload,
                                     headers=headers) as response:
                 if response.status == 200:
-                    async for chunk_bytes in response.content:
-                        chunk_bytes = chunk_bytes.strip()
-                        if not chunk_bytes:
-                            continue
-
-                        chunk = remove_prefix(chunk_bytes.decode("utf-8"),
-                                              "data: ")
-                        if chunk == "[DONE]":
-                            latency = time.perf_counter() - st
+                    async for timestamp, chunk in iter_sse_data(
+                            response.content, output):
+                        if chunk == SSE_DONE:
+                            latency = timestamp - st
                         else:
-                            data = json.loads(chunk)
-
-                            # NOTE: Some completion API might have a last
-                            # usage summary response without a token so we
-                            # want to check a token was generated
-                            if data["choices"][0]["text"]:
-                                timestamp = time.perf_counter()
+                            data = json_loads(chunk)
+                            if data.get("usage"):
+                                output.output_tokens = data["usage"].get(
+                                    "completion_tokens")
+
+                            # NOTE: The last usage summary response has no
+                            # choices, and others may come without a token,
+                            # so we want to check a token was generated
+                            choices = data.get("choices")
+                            if choices and choices[0]["text"]:
                                 # First token
                                 if ttft == 0.0:
-                                    ttft = time.perf_counter() - st
+                                    ttft = timestamp - st
                                     output.ttft = ttft
 
                                 # Decoding phase
@@ -302,17 +405,18 @@ async def async_request_openai_completions(
 async def async_request_openai_chat_completions(
     request_func_input: RequestFuncInput,
     pbar: Optional[tqdm] = None,
+    session: Optional[aiohttp.ClientSession] = None,
 ) -> RequestFuncOutput:
     api_url = request_func_input.api_url
     assert api_url.endswith(
         "chat/completions"
     ), "OpenAI Chat Completions API URL must end with 'chat/completions'."
 
-    async with aiohttp.ClientSession(timeout=AIOHTTP_TIMEOUT) as session:
+    async with _session_scope(session) as session:
         assert not request_func_input.use_beam_search
         payload = {
             "model": request_func_input.model,
-            "messages": [
+            "messages": request_func_input.messages or [
                 {
                     "role": "user",
                     "content": request_func_input.prompt,
@@ -321,6 +425,9 @@ async def async_request_openai_chat_completions(
             "temperature": 0.0,
             "max_tokens": request_func_input.output_len,
             "stream": True,
+            "stream_options": {
+                "include_usage": True,
+            },
         }
         headers = {
             "Content-Type": "application/json",
@@ -333,29 +440,29 @@ async def async_request_openai_chat_completions(
         generated_text = ""
         ttft = 0.0
         st = time.perf_counter()
+        output.start_time = st
         most_recent_timestamp = st
         try:
             async with session.post(url=api_url, json=payload,
                                     headers=headers) as response:
                 if response.status == 200:
-                    async for chunk_bytes in response.content:
-                        chunk_bytes = chunk_bytes.strip()
-                        if not chunk_bytes:
-                            continue
-
-                        chunk = remove_prefix(chunk_bytes.decode("utf-8"),
-                                              "data: ")
-                        if chunk == "[DONE]":
-                            latency = time.perf_counter() - st
+                    async for timestamp, chunk in iter_sse_data(
+                            response.content, output):
+                        if chunk == SSE_DONE:
+                            latency = timestamp - st
                         else:
-                            timestamp = time.perf_counter()
-                            data = json.loads(chunk)
-
-                            delta = data["choices"][0]["delta"]
+                            data = json_loads(chunk)
+                            if data.get("usage"):
+                                output.output_tokens = data["usage"].get(
+                                    "completion_tokens")
+
+                            # The last usage summary response has no choices.
+                            choices = data.get("choices")
+                            delta = choices[0]["delta"] if choices else {}
                             if delta.get("content", None):
                                 # First token
                                 if ttft == 0.0:
-                                    ttft = time.perf_counter() - st
+                                    ttft = timestamp - st
                                     output.ttft = ttft
 
                                 # Decoding phase
@@ -383,14 +490,6 @@ async def async_request_openai_chat_completions(
     return output
 
 
-# Since vllm must support Python 3.8, we can't use str.removeprefix(prefix)
-# introduced in Python 3.9
-def remove_prefix(text: str, prefix: str) -> str:
-    if text.startswith(prefix):
-        return text[len(prefix):]
-    return text
-
-
 def get_model(pretrained_model_name_or_path: str) -> str:
     if os.getenv('VLLM_USE_MODELSCOPE', 'False').lower() == 'true':
         from modelscope import snapshot_download
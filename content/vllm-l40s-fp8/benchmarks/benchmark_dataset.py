@@ -0,0 +1,629 @@
+"""Dataset sampling helpers shared by the benchmark scripts."""
+import hashlib
+import heapq
+import json
+import os
+import multiprocessing
+import random
+from concurrent.futures import ProcessPoolExecutor
+from typing import (Any, Callable, Dict, Iterator, List, Optional, Sequence,
+                    Tuple)
+
+import numpy as np
+from transformers import PreTrainedTokenizerBase
+
+DEFAULT_TOKEN_CACHE_DIR = os.environ.get(
+    "VLLM_BENCHMARK_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "vllm_benchmarks"))
+
+
+# Tokenizer of a tokenization worker process, see `get_token_lens`.
+_worker_tokenizer: Optional[PreTrainedTokenizerBase] = None
+
+
+def _init_tokenizer_worker(tokenizer: PreTrainedTokenizerBase) -> None:
+    global _worker_tokenizer
+    _worker_tokenizer = tokenizer
+
+
+def _count_tokens(
+    texts: Sequence[str],
+    add_special_tokens: bool,
+    tokenizer: Optional[PreTrainedTokenizerBase] = None,
+) -> List[int]:
+    if tokenizer is None:
+        tokenizer = _worker_tokenizer
+    if not texts:
+        return []
+    input_ids = tokenizer(list(texts),
+                          add_special_tokens=add_special_tokens).input_ids
+    return [len(ids) for ids in input_ids]
+
+
+def create_tokenizer_pool(tokenizer: PreTrainedTokenizerBase,
+                          num_workers: int) -> ProcessPoolExecutor:
+    """Create a process pool whose workers each hold a copy of `tokenizer`,
+    to be passed to `get_token_lens`."""
+    return ProcessPoolExecutor(max_workers=num_workers,
+                               mp_context=multiprocessing.get_context("spawn"),
+                               initializer=_init_tokenizer_worker,
+                               initargs=(tokenizer, ))
+
+
+def get_token_lens(
+    tokenizer: PreTrainedTokenizerBase,
+    texts: Sequence[str],
+    add_special_tokens: bool = True,
+    batch_size: int = 1024,
+    num_workers: int = 1,
+    pool: Optional[ProcessPoolExecutor] = None,
+) -> List[int]:
+    """Count the tokens of each text using batched tokenizer calls.
+
+    Fast tokenizers encode a batch in parallel natively. With
+    `num_workers` > 1, or an existing tokenizer `pool`, the batches are
+    additionally spread over worker processes, which also helps slow (pure
+    Python) tokenizers.
+    """
+    batches = [
+        texts[i:i + batch_size] for i in range(0, len(texts), batch_size)
+    ]
+    if len(batches) <= 1 or (pool is None and num_workers <= 1):
+        return [
+            n for batch in batches
+            for n in _count_tokens(batch, add_special_tokens, tokenizer)
+        ]
+
+    if pool is None:
+        with create_tokenizer_pool(tokenizer,
+                                   min(num_workers, len(batches))) as pool:
+            return get_token_lens(tokenizer, texts, add_special_tokens,
+                                  batch_size, pool=pool)
+    counts = pool.map(_count_tokens, batches,
+                      [add_special_tokens] * len(batches))
+    return [n for batch_counts in counts for n in batch_counts]
+
+
+def _file_digest(path: str, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _tokenizer_digest(tokenizer: PreTrainedTokenizerBase) -> str:
+    """Hash of what the tokenizer does rather than where it came from, so
+    that a tokenizer re-downloaded or edited in place gets fresh lengths."""
+    digest = hashlib.sha256(type(tokenizer).__name__.encode("utf-8"))
+    backend_tokenizer = getattr(tokenizer, "backend_tokenizer", None)
+    if backend_tokenizer is not None:
+        # The serialized fast tokenizer includes its vocabulary, added
+        # tokens, normalizer and post-processor.
+        digest.update(backend_tokenizer.to_str().encode("utf-8"))
+    else:
+        # Slow tokenizers are defined by their vocabulary files, e.g. a
+        # sentencepiece model, and their added tokens.
+        for name in sorted(tokenizer.vocab_files_names):
+            path = getattr(tokenizer, name, None)
+            if isinstance(path, str) and os.path.isfile(path):
+                digest.update(_file_digest(path).encode("utf-8"))
+        digest.update(
+            json.dumps(sorted(tokenizer.get_vocab().items())).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class TokenLengthCache:
+    """On-disk cache of the prompt and completion token lengths of each row
+    of a dataset, keyed by the dataset file hash and the tokenizer.
+
+    Lengths are filled in lazily as rows are tokenized, so a cache written by
+    a short run is extended by later, larger ones.
+    """
+
+    MISSING = -1
+
+    def __init__(
+        self,
+        dataset_path: str,
+        tokenizer: PreTrainedTokenizerBase,
+        cache_dir: str = DEFAULT_TOKEN_CACHE_DIR,
+    ) -> None:
+        key = hashlib.sha256(
+            (_file_digest(dataset_path) +
+             _tokenizer_digest(tokenizer)).encode("utf-8")).hexdigest()
+        self.path = os.path.join(cache_dir, f"token_lens-{key[:32]}.npy")
+        self.lens = None
+        if os.path.exists(self.path):
+            try:
+                self.lens = np.load(self.path)
+            except (OSError, ValueError):
+                # A corrupt cache is rebuilt from scratch.
+                self.lens = None
+        if self.lens is None or self.lens.ndim != 2 or self.lens.shape[1] != 2:
+            self.lens = np.full((0, 2), self.MISSING, dtype=np.int32)
+        self.dirty = False
+
+    def get(self, index: int) -> Optional[Tuple[int, int]]:
+        if index >= len(self.lens):
+            return None
+        prompt_len, completion_len = self.lens[index]
+        if prompt_len == self.MISSING:
+            return None
+        return int(prompt_len), int(completion_len)
+
+    def put(self, index: int, prompt_len: int, completion_len: int) -> None:
+        if index >= len(self.lens):
+            # Grow geometrically, since streamed datasets reveal their size
+            # one row at a time.
+            grown = np.full((max(index + 1, 2 * len(self.lens)), 2),
+                            self.MISSING,
+                            dtype=np.int32)
+            grown[:len(self.lens)] = self.lens
+            self.lens = grown
+        self.lens[index] = (prompt_len, completion_len)
+        self.dirty = True
+
+    def save(self) -> None:
+        if not self.dirty:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # Write to a temporary file first so concurrent runs never observe a
+        # partially written cache.
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, self.lens)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+
+def is_valid_sharegpt_len(prompt_len: int, output_len: int) -> bool:
+    if prompt_len < 4 or output_len < 4:
+        # Prune too short sequences.
+        return False
+    if prompt_len > 1024 or prompt_len + output_len > 2048:
+        # Prune too long sequences.
+        return False
+    return True
+
+
+def iter_json_array(path: str, chunk_size: int = 1 << 20) -> Iterator[Any]:
+    """Incrementally decode the elements of a file holding a JSON array,
+    reading `chunk_size` characters at a time."""
+    decoder = json.JSONDecoder()
+    with open(path, encoding="utf-8") as f:
+        buf = ""
+        pos = 0
+        eof = False
+        started = False
+
+        while True:
+            # Skip whitespace and the separators between elements.
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buf):
+                if not started:
+                    if buf[pos] != "[":
+                        raise ValueError(
+                            f"{path} does not contain a JSON array")
+                    started = True
+                    pos += 1
+                    continue
+                if buf[pos] == "]":
+                    return
+                try:
+                    element, pos = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    # The element continues past the end of the buffer.
+                    if eof:
+                        raise
+                else:
+                    yield element
+                    continue
+            elif eof:
+                raise ValueError(f"Unexpected end of JSON array in {path}")
+
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buf = buf[pos:] + chunk
+            pos = 0
+
+
+def iter_sharegpt_pairs(dataset_path: str) -> Iterator[Tuple[str, str]]:
+    """Stream the first two turns of every conversation in a ShareGPT file
+    that has at least two turns."""
+    for data in iter_json_array(dataset_path):
+        if len(data["conversations"]) >= 2:
+            yield (data["conversations"][0]["value"],
+                   data["conversations"][1]["value"])
+
+
+def _filter_requests(
+    rows: Sequence[Tuple[int, str, str]],
+    num_requests: int,
+    tokenizer: PreTrainedTokenizerBase,
+    fixed_output_len: Optional[int],
+    is_valid_len: Callable[[int, int], bool],
+    cache: Optional[TokenLengthCache],
+    pool: Optional[ProcessPoolExecutor],
+) -> List[Tuple[str, int, int]]:
+    """Keep the first `num_requests` of the (row index, prompt, completion)
+    rows whose token lengths pass `is_valid_len`."""
+    filtered_dataset: List[Tuple[str, int, int]] = []
+    start = 0
+    while start < len(rows) and len(filtered_dataset) < num_requests:
+        # Tokenize the rows in batches, sized so that small samples do not
+        # tokenize much more of the dataset than they need.
+        num_missing = num_requests - len(filtered_dataset)
+        chunk = rows[start:start + min(max(2 * num_missing, 64), 4096)]
+        start += len(chunk)
+
+        lens = [cache.get(i) if cache is not None else None for i, _, _ in chunk]
+        uncached = [j for j, row_lens in enumerate(lens) if row_lens is None]
+        if uncached:
+            # Tokenize the prompts and completions.
+            token_lens = get_token_lens(
+                tokenizer, [chunk[j][1] for j in uncached] +
+                [chunk[j][2] for j in uncached],
+                pool=pool)
+            for j, prompt_len, completion_len in zip(
+                    uncached, token_lens[:len(uncached)],
+                    token_lens[len(uncached):]):
+                lens[j] = (prompt_len, completion_len)
+                if cache is not None:
+                    cache.put(chunk[j][0], prompt_len, completion_len)
+
+        for (_, prompt, _), (prompt_len, completion_len) in zip(chunk, lens):
+            if len(filtered_dataset) == num_requests:
+                break
+            output_len = (completion_len
+                          if fixed_output_len is None else fixed_output_len)
+            if is_valid_len(prompt_len, output_len):
+                filtered_dataset.append((prompt, prompt_len, output_len))
+    return filtered_dataset
+
+
+def _sample_sharegpt_streaming(
+    dataset_path: str,
+    num_requests: int,
+    tokenizer: PreTrainedTokenizerBase,
+    fixed_output_len: Optional[int],
+    is_valid_len: Callable[[int, int], bool],
+    cache: Optional[TokenLengthCache],
+    pool: Optional[ProcessPoolExecutor],
+) -> List[Tuple[str, int, int]]:
+    # Every row gets a random key and a bounded reservoir keeps the rows with
+    # the smallest keys, which is a uniform sample that never holds the whole
+    # dataset in memory. The reservoir is oversampled because some rows fail
+    # the length filter, and grown with another pass if it was not enough.
+    # Keys come from a generator seeded once from `random`, so every pass and
+    # every run with the same --seed ranks the rows identically.
+    key_seed = random.getrandbits(64)
+    reservoir_size = max(2 * num_requests, 64)
+    while True:
+        key_rng = random.Random(key_seed)
+        reservoir: List[Tuple[float, int, str, str]] = []
+        num_dropped = 0
+        for i, (prompt, completion) in enumerate(
+                iter_sharegpt_pairs(dataset_path)):
+            key = key_rng.random()
+            cached_lens = cache.get(i) if cache is not None else None
+            if cached_lens is not None:
+                prompt_len, completion_len = cached_lens
+                output_len = (completion_len if fixed_output_len is None else
+                              fixed_output_len)
+                if not is_valid_len(prompt_len, output_len):
+                    continue
+            # The reservoir is a max-heap on the key.
+            if len(reservoir) < reservoir_size:
+                heapq.heappush(reservoir, (-key, i, prompt, completion))
+            else:
+                num_dropped += 1
+                if -reservoir[0][0] > key:
+                    heapq.heapreplace(reservoir, (-key, i, prompt, completion))
+
+        rows = [(i, prompt, completion) for _, i, prompt, completion in sorted(
+            reservoir, reverse=True)]
+        filtered_dataset = _filter_requests(rows, num_requests, tokenizer,
+                                            fixed_output_len, is_valid_len,
+                                            cache, pool)
+        if len(filtered_dataset) == num_requests or num_dropped == 0:
+            return filtered_dataset
+        reservoir_size *= 4
+
+
+def sample_sharegpt(
+    dataset_path: str,
+    num_requests: int,
+    tokenizer: PreTrainedTokenizerBase,
+    fixed_output_len: Optional[int],
+    is_valid_len: Callable[[int, int], bool] = is_valid_sharegpt_len,
+    token_cache_dir: Optional[str] = DEFAULT_TOKEN_CACHE_DIR,
+    tokenizer_workers: int = 1,
+    streaming: bool = False,
+) -> List[Tuple[str, int, int]]:
+    """Sample (prompt, prompt_len, output_len) requests from a ShareGPT file.
+
+    `is_valid_len` decides from the prompt and output lengths whether a
+    conversation is kept. Token lengths are cached in `token_cache_dir`
+    unless it is None. With `streaming`, the file is read incrementally and
+    the requests are picked by reservoir sampling instead of loading and
+    shuffling the whole dataset.
+    """
+    if fixed_output_len is not None and fixed_output_len < 4:
+        raise ValueError("output_len too small")
+
+    cache = None
+    if token_cache_dir is not None:
+        cache = TokenLengthCache(dataset_path, tokenizer, token_cache_dir)
+    pool = None
+    if tokenizer_workers > 1:
+        pool = create_tokenizer_pool(tokenizer, tokenizer_workers)
+
+    try:
+        if streaming:
+            return _sample_sharegpt_streaming(dataset_path, num_requests,
+                                              tokenizer, fixed_output_len,
+                                              is_valid_len, cache, pool)
+
+        # Load the dataset.
+        with open(dataset_path) as f:
+            dataset = json.load(f)
+        # Filter out the conversations with less than 2 turns.
+        dataset = [
+            data for data in dataset if len(data["conversations"]) >= 2
+        ]
+        # Only keep the first two turns of each conversation.
+        dataset = [(data["conversations"][0]["value"],
+                    data["conversations"][1]["value"]) for data in dataset]
+
+        # Shuffle the dataset. Shuffling the row indices keeps the original
+        # position of each row, which is what the token length cache is
+        # keyed on.
+        indices = list(range(len(dataset)))
+        random.shuffle(indices)
+
+        # Filter out sequences that are too long or too short
+        return _filter_requests([(i, *dataset[i]) for i in indices],
+                                num_requests, tokenizer, fixed_output_len,
+                                is_valid_len, cache, pool)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        if cache is not None:
+            cache.save()
+
+
+_SHAREGPT_USER_ROLES = ("human", "user")
+_SHAREGPT_ASSISTANT_ROLES = ("gpt", "chatgpt", "assistant")
+
+
+def iter_sharegpt_conversations(
+        dataset_path: str) -> Iterator[List[Tuple[str, str]]]:
+    """Stream the (user, assistant) turn pairs of every conversation in a
+    ShareGPT file, up to the first turn that breaks the alternation."""
+    for data in iter_json_array(dataset_path):
+        turns = data["conversations"]
+        pairs = []
+        for user, assistant in zip(turns[::2], turns[1::2]):
+            if (user["from"] not in _SHAREGPT_USER_ROLES
+                    or assistant["from"] not in _SHAREGPT_ASSISTANT_ROLES):
+                break
+            pairs.append((user["value"], assistant["value"]))
+        if pairs:
+            yield pairs
+
+
+def sample_sharegpt_sessions(
+    dataset_path: str,
+    num_sessions: int,
+    tokenizer: PreTrainedTokenizerBase,
+    fixed_output_len: Optional[int] = None,
+    min_turns: int = 2,
+    max_turns: Optional[int] = None,
+    max_context_len: int = 4096,
+    tokenizer_workers: int = 1,
+) -> List[List[Tuple[str, int]]]:
+    """Sample multi-turn sessions from a ShareGPT file.
+
+    A session is the list of (user message, output_len) turns of one
+    conversation, where `output_len` is the token length of the reference
+    reply unless `fixed_output_len` is given. Conversations are cut before
+    the turn at which the context, counting the user messages and
+    `output_len` tokens per reply, would exceed `max_context_len`, and
+    before replies shorter than 4 tokens. Only sessions with at least
+    `min_turns` turns are kept.
+    """
+    if fixed_output_len is not None and fixed_output_len < 4:
+        raise ValueError("output_len too small")
+    conversations = [
+        pairs for pairs in iter_sharegpt_conversations(dataset_path)
+        if len(pairs) >= min_turns
+    ]
+    random.shuffle(conversations)
+
+    pool = None
+    if tokenizer_workers > 1:
+        pool = create_tokenizer_pool(tokenizer, tokenizer_workers)
+    sessions: List[List[Tuple[str, int]]] = []
+    try:
+        start = 0
+        while start < len(conversations) and len(sessions) < num_sessions:
+            chunk = [
+                pairs[:max_turns]
+                for pairs in conversations[start:start +
+                                           max(2 * (num_sessions -
+                                                    len(sessions)), 64)]
+            ]
+            start += len(chunk)
+            texts = [text for pairs in chunk for pair in pairs for text in pair]
+            token_lens = iter(get_token_lens(tokenizer, texts, pool=pool))
+            for pairs in chunk:
+                session: List[Tuple[str, int]] = []
+                context_len = 0
+                truncated = False
+                for user, _ in pairs:
+                    user_len, reply_len = next(token_lens), next(token_lens)
+                    if truncated:
+                        continue
+                    output_len = (reply_len if fixed_output_len is None else
+                                  fixed_output_len)
+                    context_len += user_len + output_len
+                    if output_len < 4 or context_len > max_context_len:
+                        truncated = True
+                        continue
+                    session.append((user, output_len))
+                if len(session) >= min_turns:
+                    sessions.append(session)
+                    if len(sessions) == num_sessions:
+                        break
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return sessions
+
+
+REQUEST_SET_MAGIC = b"VLLMREQ1"
+
+
+def save_request_set(
+    path: str,
+    requests: Sequence[Tuple[str, int, int]],
+    metadata: Optional[Dict[str, Any]] = None,
+) -> None:
+    """Write (prompt, prompt_len, output_len) requests to a request set file.
+
+    The file holds a small JSON header followed by the token lengths as an
+    int32 array, an int64 offset table and the UTF-8 prompts back to back,
+    so that `load_request_set` can memory-map it instead of parsing it.
+    """
+    encoded = [prompt.encode("utf-8") for prompt, _, _ in requests]
+    lens = np.array([[prompt_len, output_len]
+                     for _, prompt_len, output_len in requests],
+                    dtype="<i4").reshape(-1, 2)
+    offsets = np.zeros(len(encoded) + 1, dtype="<i8")
+    np.cumsum([len(prompt) for prompt in encoded], out=offsets[1:])
+    header = json.dumps({
+        "num_requests": len(encoded),
+        "metadata": metadata or {},
+    }).encode("utf-8")
+    # Pad the header so that the arrays after it are 8-byte aligned.
+    header += b" " * (-(len(REQUEST_SET_MAGIC) + 8 + len(header)) % 8)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(REQUEST_SET_MAGIC)
+        f.write(np.uint64(len(header)).astype("<u8").tobytes())
+        f.write(header)
+        f.write(lens.tobytes())
+        f.write(offsets.tobytes())
+        for prompt in encoded:
+            f.write(prompt)
+    os.replace(tmp_path, path)
+
+
+class RequestSet(Sequence):
+    """Read-only view of a memory-mapped request set file.
+
+    Token lengths are read straight from the mapping and prompts are only
+    decoded when a request is accessed, so loading is independent of the
+    size of the workload.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._data = np.memmap(path, dtype=np.uint8, mode="r")
+        if bytes(self._data[:len(REQUEST_SET_MAGIC)]) != REQUEST_SET_MAGIC:
+            raise ValueError(f"{path} is not a request set file")
+        pos = len(REQUEST_SET_MAGIC)
+        header_len = int(self._data[pos:pos + 8].view("<u8")[0])
+        pos += 8
+        header = json.loads(bytes(self._data[pos:pos + header_len]))
+        pos += header_len
+        self.metadata: Dict[str, Any] = header["metadata"]
+
+        num_requests = header["num_requests"]
+        self.lens = self._data[pos:pos + 8 * num_requests].view("<i4").reshape(
+            num_requests, 2)
+        pos += 8 * num_requests
+        self.offsets = self._data[pos:pos + 8 * (num_requests + 1)].view("<i8")
+        pos += 8 * (num_requests + 1)
+        self._text = self._data[pos:]
+
+    def __len__(self) -> int:
+        return len(self.lens)
+
+    def _get(self, index: int) -> Tuple[str, int, int]:
+        start, end = self.offsets[index], self.offsets[index + 1]
+        prompt = bytes(self._text[start:end]).decode("utf-8")
+        prompt_len, output_len = self.lens[index]
+        return prompt, int(prompt_len), int(output_len)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._get(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("request set index out of range")
+        return self._get(index)
+
+
+def load_request_set(path: str) -> RequestSet:
+    return RequestSet(path)
+
+
+class RequestTrace:
+    """Lazily replayed trace of timed requests.
+
+    The trace is a JSON lines file with one request per line, e.g.
+        {"timestamp": 12.5, "prompt": "...", "output_len": 128}
+        {"timestamp": 13.1, "prompt_len": 512, "output_len": 64}
+    Timestamps are in seconds and made relative to the first record, then
+    divided by `speed`. Records without a prompt get a synthetic prompt of
+    `prompt_len` tokens; records without a `prompt_len` have their prompt
+    tokenized. The file is read again on every iteration and never held in
+    memory as a whole.
+    """
+
+    def __init__(self,
+                 path: str,
+                 tokenizer: PreTrainedTokenizerBase,
+                 speed: float = 1.0) -> None:
+        if speed <= 0:
+            raise ValueError("Trace speed must be positive")
+        self.path = path
+        self.tokenizer = tokenizer
+        self.speed = speed
+
+    def _synthetic_prompt(self, index: int, prompt_len: int) -> str:
+        vocab_size = self.tokenizer.vocab_size
+        return self.tokenizer.decode([(index + j) % vocab_size
+                                      for j in range(prompt_len)])
+
+    def __iter__(self) -> Iterator[Tuple[Tuple[str, int, int], float]]:
+        """Yield `((prompt, prompt_len, output_len), arrival_time)`."""
+        first_timestamp = None
+        with open(self.path) as f:
+            for index, line in enumerate(f):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                prompt = record.get("prompt")
+                prompt_len = record.get("prompt_len")
+                if ("timestamp" not in record or "output_len" not in record
+                        or (prompt is None and prompt_len is None)):
+                    raise ValueError(
+                        f"Invalid trace record on line {index + 1} of "
+                        f"{self.path}: expected a timestamp, an output_len "
+                        "and a prompt or prompt_len.")
+                if first_timestamp is None:
+                    first_timestamp = record["timestamp"]
+                if prompt is None:
+                    prompt = self._synthetic_prompt(index, prompt_len)
+                elif prompt_len is None:
+                    prompt_len = len(self.tokenizer(prompt).input_ids)
+                arrival_time = (record["timestamp"] -
+                                first_timestamp) / self.speed
+                yield ((prompt, int(prompt_len), int(record["output_len"])),
+                       arrival_time)
@@ -25,11 +25,12 @@ ShareGPT example usage:
         --input-length-range 128:256
 """
 
-import json
 import random
 import time
 from typing import List, Optional, Tuple
 
+from benchmark_dataset import (DEFAULT_TOKEN_CACHE_DIR, load_request_set,
+                               sample_sharegpt, save_request_set)
 from transformers import PreTrainedTokenizerBase
 
 from vllm import LLM, SamplingParams
@@ -58,45 +59,26 @@ def sample_requests(
     tokenizer: PreTrainedTokenizerBase,
     input_length_range: Tuple[int, int],
     fixed_output_len: Optional[int],
+    token_cache_dir: Optional[str] = DEFAULT_TOKEN_CACHE_DIR,
+    streaming: bool = False,
 ) -> List[Tuple[str, int, int]]:
-    if fixed_output_len is not None and fixed_output_len < 4:
-        raise ValueError("output_len too small")
-
-    # Load the dataset.
-    with open(dataset_path) as f:
-        dataset = json.load(f)
-    # Filter out the conversations with less than 2 turns.
-    dataset = [data for data in dataset if len(data["conversations"]) >= 2]
-    # Only keep the first two turns of each conversation.
-    dataset = [(data["conversations"][0]["value"],
-                data["conversations"][1]["value"]) for data in dataset]
-
-    # Shuffle the dataset.
-    random.shuffle(dataset)
-
     min_len, max_len = input_length_range
 
-    # Filter out sequences that are too long or too short
-    filtered_dataset: List[Tuple[str, int, int]] = []
-    for i in range(len(dataset)):
-        if len(filtered_dataset) == num_requests:
-            break
-
-        # Tokenize the prompts and completions.
-        prompt = dataset[i][0]
-        prompt_token_ids = tokenizer(prompt).input_ids
-        completion = dataset[i][1]
-        completion_token_ids = tokenizer(completion).input_ids
-        prompt_len = len(prompt_token_ids)
-        output_len = len(completion_token_ids
-                         ) if fixed_output_len is None else fixed_output_len
+    def is_valid_len(prompt_len: int, output_len: int) -> bool:
         if prompt_len < 4 or output_len < 4:
             # Prune too short sequences.
-            continue
-        if min_len <= prompt_len <= max_len:
-            filtered_dataset.append((prompt, prompt_len, output_len))
-
-    return filtered_dataset
+            return False
+        return min_len <= prompt_len <= max_len
+
+    return sample_sharegpt(
+        dataset_path=dataset_path,
+        num_requests=num_requests,
+        tokenizer=tokenizer,
+        fixed_output_len=fixed_output_len,
+        is_valid_len=is_valid_len,
+        token_cache_dir=token_cache_dir,
+        streaming=streaming,
+    )
 
 
 def repeat_and_sort_requests(requests: List[Tuple[str, int, int]],
@@ -114,7 +96,9 @@ def main(args):
     tokenizer = get_tokenizer(args.model, trust_remote_code=True)
     input_length_range = tuple(map(int, args.input_length_range.split(':')))
 
-    if args.dataset_path is not None:
+    if args.request_set is not None:
+        filtered_datasets = list(load_request_set(args.request_set))
+    elif args.dataset_path is not None:
         print(f"Start to sample {args.num_prompts} prompts"
               "from {args.dataset_path}")
         filtered_datasets = sample_requests(
@@ -123,12 +107,27 @@ def main(args):
             tokenizer=tokenizer,
             input_length_range=input_length_range,
             fixed_output_len=args.output_len,
+            token_cache_dir=(None if args.disable_token_cache else
+                             args.token_cache_dir),
+            streaming=args.dataset_streaming,
         )
     else:
         prompt_len = len(tokenizer(PROMPT).input_ids)
         filtered_datasets = [(PROMPT, prompt_len, args.output_len)
                              ] * args.num_prompts
 
+    if args.export_request_set is not None:
+        save_request_set(
+            args.export_request_set, filtered_datasets, {
+                "dataset_path": args.dataset_path,
+                "tokenizer_id": args.model,
+                "num_prompts": args.num_prompts,
+                "input_length_range": args.input_length_range,
+            })
+        print(f"Saved {len(filtered_datasets)} requests to "
+              f"{args.export_request_set}")
+        return
+
     llm = LLM(model=args.model,
               tokenizer_mode='auto',
               trust_remote_code=True,
@@ -170,6 +169,30 @@ if __name__ == "__main__":
                         type=str,
                         default=None,
                         help="Path to the dataset.")
+    parser.add_argument('--request-set',
+                        type=str,
+                        default=None,
+                        help='Path to a request set file written by '
+                        '--export-request-set, replayed as is.')
+    parser.add_argument('--export-request-set',
+                        type=str,
+                        default=None,
+                        help='Write the sampled requests to this request set '
+                        'file and exit without running the benchmark.')
+    parser.add_argument('--dataset-streaming',
+                        action='store_true',
+                        help='Stream the dataset from disk and '
+                        'reservoir-sample the requests instead of loading '
+                        'the whole file into memory.')
+    parser.add_argument('--token-cache-dir',
+                        type=str,
+                        default=DEFAULT_TOKEN_CACHE_DIR,
+                        help='Directory for the cache of dataset token '
+                        'lengths, keyed by dataset file hash and tokenizer.')
+    parser.add_argument('--disable-token-cache',
+                        action='store_true',
+                        help='Always re-tokenize the dataset instead of '
+                        'using the token length cache.')
     parser.add_argument('--tensor-parallel-size', '-tp', type=int, default=1)
     parser.add_argument('--output-len', type=int, default=10)
     parser.add_argument('--enable-prefix-caching',
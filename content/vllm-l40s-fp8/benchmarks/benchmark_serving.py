@@ -24,18 +24,44 @@ On the client side, run:
 """
 import argparse
 import asyncio
+import itertools
 import json
+import math
+import multiprocessing
 import os
+import queue
 import random
 import time
+import traceback
 import warnings
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple
+from typing import (Any, AsyncGenerator, Awaitable, Callable, Dict, Iterable,
+                    Iterator, List, Optional, Sequence, Tuple)
 
+import aiohttp
 import numpy as np
+from arrival_processes import (ARRIVAL_PROCESSES, RATE_INDEPENDENT_PROCESSES,
+                               arrival_result_fields)
 from backend_request_func import (ASYNC_REQUEST_FUNCS, RequestFuncInput,
-                                  RequestFuncOutput)
+                                  RequestFuncOutput, create_client_session)
+from benchmark_dataset import (DEFAULT_TOKEN_CACHE_DIR, RequestTrace,
+                               get_token_lens, load_request_set,
+                               sample_sharegpt, sample_sharegpt_sessions,
+                               save_request_set)
+from client_monitor import (ClientMonitor, client_overhead_stats,
+                            client_overhead_warnings)
+from live_metrics import LiveMetrics, start_metrics_server
+from multiturn import (Session, calculate_turn_stats, get_think_times,
+                       print_turn_stats, render_prompt, replay_conversations,
+                       run_sessions, set_prompt_lens)
+from quantile_sketch import DDSketch
+from result_io import (RESULT_FORMATS, RequestStreamWriter,
+                       read_request_streams, request_stream_base_path,
+                       request_stream_path, save_columnar_result)
+from server_metrics import (ServerMetricsScraper, print_server_metrics_summary,
+                            server_metrics_summary)
+from slo_search import parse_slos, search_max_request_rate, slo_percentiles
 from tqdm.asyncio import tqdm
 from transformers import PreTrainedTokenizerBase
 
@@ -70,6 +96,13 @@ class BenchmarkMetrics:
     median_itl_ms: float
     std_itl_ms: float
     p99_itl_ms: float
+    percentiles_ttft_ms: List[Tuple[float, float]]
+    percentiles_tpot_ms: List[Tuple[float, float]]
+    percentiles_itl_ms: List[Tuple[float, float]]
+    # Only set when per-request SLOs are given with --goodput.
+    request_goodput: Optional[float] = None
+    output_token_goodput: Optional[float] = None
+    slo_attainment_pct: Optional[float] = None
 
 
 def sample_sharegpt_requests(
@@ -77,44 +110,19 @@ def sample_sharegpt_requests(
     num_requests: int,
     tokenizer: PreTrainedTokenizerBase,
     fixed_output_len: Optional[int] = None,
+    token_cache_dir: Optional[str] = DEFAULT_TOKEN_CACHE_DIR,
+    tokenizer_workers: int = 1,
+    streaming: bool = False,
 ) -> List[Tuple[str, int, int]]:
-    if fixed_output_len is not None and fixed_output_len < 4:
-        raise ValueError("output_len too small")
-    # Load the dataset.
-    with open(dataset_path) as f:
-        dataset = json.load(f)
-    # Filter out the conversations with less than 2 turns.
-    dataset = [data for data in dataset if len(data["conversations"]) >= 2]
-    # Only keep the first two turns of each conversation.
-    dataset = [(data["conversations"][0]["value"],
-                data["conversations"][1]["value"]) for data in dataset]
-
-    # Shuffle the dataset.
-    random.shuffle(dataset)
-
-    # Filter out sequences that are too long or too short
-    filtered_dataset: List[Tuple[str, int, int]] = []
-    for i in range(len(dataset)):
-        if len(filtered_dataset) == num_requests:
-            break
-
-        # Tokenize the prompts and completions.
-        prompt = dataset[i][0]
-        prompt_token_ids = tokenizer(prompt).input_ids
-        completion = dataset[i][1]
-        completion_token_ids = tokenizer(completion).input_ids
-        prompt_len = len(prompt_token_ids)
-        output_len = len(completion_token_ids
-                         ) if fixed_output_len is None else fixed_output_len
-        if prompt_len < 4 or output_len < 4:
-            # Prune too short sequences.
-            continue
-        if prompt_len > 1024 or prompt_len + output_len > 2048:
-            # Prune too long sequences.
-            continue
-        filtered_dataset.append((prompt, prompt_len, output_len))
-
-    return filtered_dataset
+    return sample_sharegpt(
+        dataset_path=dataset_path,
+        num_requests=num_requests,
+        tokenizer=tokenizer,
+        fixed_output_len=fixed_output_len,
+        token_cache_dir=token_cache_dir,
+        tokenizer_workers=tokenizer_workers,
+        streaming=streaming,
+    )
 
 
 def sample_sonnet_requests(
@@ -212,29 +220,451 @@ def sample_random_requests(
     return input_requests
 
 
+def get_arrival_times(
+    num_requests: int,
+    request_rate: float,
+    arrival_process: str = "poisson",
+    arrival_params: Optional[Dict[str, Any]] = None,
+) -> np.ndarray:
+    """Precompute the send time of every request, in seconds from the start
+    of the benchmark, with one of `ARRIVAL_PROCESSES`."""
+    if (request_rate == float("inf")
+            and arrival_process not in RATE_INDEPENDENT_PROCESSES):
+        # If the request rate is infinity, all requests are sent at time 0.
+        return np.zeros(num_requests)
+    return ARRIVAL_PROCESSES[arrival_process](num_requests, request_rate,
+                                              **(arrival_params or {}))
+
+
 async def get_request(
+    schedule: Iterable[Tuple[Tuple[str, int, int], float]],
+    start_time: float,
+) -> AsyncGenerator[Tuple[Tuple[str, int, int], float], None]:
+    """Yield each `(request, arrival_time)` of `schedule` at its arrival
+    time.
+
+    Requests are released against absolute deadlines measured from
+    `start_time`, so event-loop lag on one request does not push back all
+    the ones that follow it. `schedule` is consumed lazily, e.g. when
+    replaying a trace.
+    """
+    for request, arrival_time in schedule:
+        delay = start_time + arrival_time - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        yield request, float(arrival_time)
+
+
+def _record_arrival_times(
+    schedule: Iterable[Tuple[Tuple[str, int, int], float]],
+    arrival_times: List[float],
+) -> Iterator[Tuple[Tuple[str, int, int], float]]:
+    for request, arrival_time in schedule:
+        arrival_times.append(arrival_time)
+        yield request, arrival_time
+
+
+def _make_request_input(
+    request: Tuple[str, int, int],
+    model_id: str,
+    api_url: str,
+    best_of: int,
+    use_beam_search: bool,
+) -> RequestFuncInput:
+    prompt, prompt_len, output_len = request
+    return RequestFuncInput(
+        model=model_id,
+        prompt=prompt,
+        api_url=api_url,
+        prompt_len=prompt_len,
+        output_len=output_len,
+        best_of=best_of,
+        use_beam_search=use_beam_search,
+    )
+
+
+async def dispatch_requests(
+    request_func: Callable[..., Awaitable[RequestFuncOutput]],
+    session: aiohttp.ClientSession,
+    schedule: Iterable[Tuple[Tuple[str, int, int], float]],
+    start_time: float,
+    model_id: str,
+    api_url: str,
+    best_of: int,
+    use_beam_search: bool,
+    pbar: Optional[Any] = None,
+    on_output: Optional[Callable[[int, RequestFuncOutput], None]] = None,
+) -> Tuple[List[RequestFuncOutput], List[float]]:
+    """Send the `(request, arrival_time)` pairs of `schedule` on time and
+    wait for all of them.
+
+    Returns the outputs and the actual send time of each request, in seconds
+    since `start_time`. `on_output(index, output)` is called as soon as each
+    request finishes, e.g. to fold its latencies into sketches.
+    """
+    actual_send_times: List[float] = []
+    tasks: List[asyncio.Task] = []
+    async for request, _ in get_request(schedule, start_time):
+        actual_send_times.append(time.perf_counter() - start_time)
+        request_func_input = _make_request_input(request, model_id, api_url,
+                                                 best_of, use_beam_search)
+        task = asyncio.create_task(
+            request_func(request_func_input=request_func_input,
+                         pbar=pbar,
+                         session=session))
+        if on_output is not None:
+            task.add_done_callback(lambda task, index=len(tasks): on_output(
+                index, task.result()))
+        tasks.append(task)
+    outputs: List[RequestFuncOutput] = await asyncio.gather(*tasks)
+    return outputs, actual_send_times
+
+
+async def run_closed_loop(
+    request_func: Callable[..., Awaitable[RequestFuncOutput]],
+    session: aiohttp.ClientSession,
     input_requests: List[Tuple[str, int, int]],
-    request_rate: float,
-) -> AsyncGenerator[Tuple[str, int, int], None]:
-    input_requests = iter(input_requests)
-    for request in input_requests:
-        yield request
+    concurrency: int,
+    start_time: float,
+    model_id: str,
+    api_url: str,
+    best_of: int,
+    use_beam_search: bool,
+    pbar: Optional[Any] = None,
+    on_output: Optional[Callable[[int, RequestFuncOutput], None]] = None,
+) -> Tuple[List[RequestFuncOutput], List[float]]:
+    """Send the requests from `concurrency` virtual users, each of which
+    sends its next request as soon as its previous one finished.
+
+    At most `concurrency` requests are in flight at any time. Returns the
+    outputs and send times in request order, like `dispatch_requests`.
+    """
+    outputs: List[Optional[RequestFuncOutput]] = [None] * len(input_requests)
+    actual_send_times = [0.0] * len(input_requests)
+    # The users share one iterator, so each request is sent exactly once.
+    next_index = iter(range(len(input_requests)))
+
+    async def virtual_user() -> None:
+        for i in next_index:
+            request_func_input = _make_request_input(input_requests[i],
+                                                     model_id, api_url,
+                                                     best_of, use_beam_search)
+            actual_send_times[i] = time.perf_counter() - start_time
+            output = await request_func(request_func_input=request_func_input,
+                                        pbar=pbar,
+                                        session=session)
+            if on_output is not None:
+                on_output(i, output)
+            outputs[i] = output
+
+    await asyncio.gather(*(virtual_user()
+                           for _ in range(min(concurrency,
+                                              len(input_requests)))))
+    return outputs, actual_send_times
+
+
+class _SharedProgress:
+    """Progress counter shared between worker processes, updated in place of
+    a tqdm bar by the request functions."""
+
+    def __init__(self, counter) -> None:
+        self.counter = counter
+
+    def update(self, n: int = 1) -> None:
+        with self.counter.get_lock():
+            self.counter.value += n
+
+
+def _shard_worker(
+    worker_id: int,
+    backend: str,
+    input_requests: List[Tuple[str, int, int]],
+    arrival_times: Optional[np.ndarray],
+    model_id: str,
+    api_url: str,
+    best_of: int,
+    use_beam_search: bool,
+    concurrency: Optional[int],
+    session_kwargs: Dict[str, Any],
+    sketch_accuracy: Optional[float],
+    stream_path: Optional[str],
+    stream_header: Dict[str, Any],
+    num_workers: int,
+    metrics_address: Optional[Tuple[str, int]],
+    ready_queue,
+    start_event,
+    start_wall_time,
+    progress_counter,
+    result_queue,
+) -> None:
+    """Entry point of a load generator worker process."""
+
+    sketches = None
+    if sketch_accuracy is not None:
+        sketches = create_latency_sketches(sketch_accuracy)
+    stream_writer = None
+    if stream_path is not None:
+        stream_writer = RequestStreamWriter(stream_path, {
+            **stream_header, "worker_id": worker_id
+        })
+
+    async def run(
+    ) -> Tuple[List[RequestFuncOutput], List[float], float, Dict[str, Any]]:
+        session = create_client_session(**session_kwargs)
+        request_func = ASYNC_REQUEST_FUNCS[backend]
+        metrics_runner = None
+        if metrics_address is not None:
+            live_metrics = LiveMetrics()
+            request_func = live_metrics.instrument(request_func)
+            metrics_runner = await start_metrics_server(
+                live_metrics, *metrics_address)
+        try:
+            ready_queue.put(worker_id)
+            await asyncio.get_running_loop().run_in_executor(
+                None, start_event.wait)
+            # perf_counter is only comparable within a process, so translate
+            # the shared wall-clock start time onto the local clock.
+            start_time = time.perf_counter() + (start_wall_time.value -
+                                                time.time())
+            monitor = ClientMonitor()
+            monitor.start()
+
+            def on_output(index: int, output: RequestFuncOutput) -> None:
+                # Written before the sketches take over and drop the ITLs.
+                if stream_writer is not None:
+                    # Records carry the index of the request in the whole run.
+                    stream_writer.write(
+                        request_record(worker_id + index * num_workers,
+                                       output, start_time))
+                if sketches is not None:
+                    observe_latencies(sketches, output)
+
+            if concurrency is not None:
+                delay = start_time - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                outputs, actual_send_times = await run_closed_loop(
+                    request_func=request_func,
+                    session=session,
+                    input_requests=input_requests,
+                    concurrency=concurrency,
+                    start_time=start_time,
+                    model_id=model_id,
+                    api_url=api_url,
+                    best_of=best_of,
+                    use_beam_search=use_beam_search,
+                    pbar=_SharedProgress(progress_counter),
+                    on_output=on_output,
+                )
+            else:
+                outputs, actual_send_times = await dispatch_requests(
+                    request_func=request_func,
+                    session=session,
+                    schedule=zip(input_requests, arrival_times),
+                    start_time=start_time,
+                    model_id=model_id,
+                    api_url=api_url,
+                    best_of=best_of,
+                    use_beam_search=use_beam_search,
+                    pbar=_SharedProgress(progress_counter),
+                    on_output=on_output,
+                )
+            # Only offsets from the shared start are comparable across
+            # processes.
+            duration = time.perf_counter() - start_time
+            monitor_samples = await monitor.stop()
+            rebase_start_times(outputs, start_time)
+            return outputs, actual_send_times, duration, monitor_samples
+        finally:
+            await session.close()
+            if stream_writer is not None:
+                stream_writer.close()
+            if metrics_runner is not None:
+                await metrics_runner.cleanup()
+
+    try:
+        outputs, actual_send_times, duration, monitor_samples = asyncio.run(
+            run())
+        result_queue.put((worker_id, outputs, actual_send_times, duration,
+                          sketches, monitor_samples, None))
+    except BaseException:
+        result_queue.put((worker_id, None, None, None, None, None,
+                          traceback.format_exc()))
+
+
+async def run_sharded_requests(
+    num_workers: int,
+    backend: str,
+    input_requests: List[Tuple[str, int, int]],
+    arrival_times: Optional[np.ndarray],
+    model_id: str,
+    api_url: str,
+    best_of: int,
+    use_beam_search: bool,
+    session_kwargs: Dict[str, Any],
+    pbar: Optional[tqdm] = None,
+    sketches: Optional[Dict[str, DDSketch]] = None,
+    concurrency: Optional[int] = None,
+    stream_base_path: Optional[str] = None,
+    stream_header: Optional[Dict[str, Any]] = None,
+    metrics_address: Optional[Tuple[str, int]] = None,
+) -> Tuple[List[RequestFuncOutput], List[float], float, List[Dict[
+        str, Any]], float]:
+    """Run the benchmark across `num_workers` load generator processes.
+
+    Requests are dealt round-robin so every worker follows its share of the
+    global arrival schedule. In closed-loop mode the arrival times are
+    ignored and the `concurrency` virtual users are split evenly across the
+    workers instead. Returns the outputs and send times merged back
+    into the original request order, the duration until the last worker
+    finished, the `ClientMonitor` samples of every worker and the shared
+    start of the workers on the local perf_counter clock. The workers'
+    latency sketches are merged into `sketches`. With `stream_base_path`,
+    every worker streams its finished requests to its own request stream.
+    With `metrics_address`, worker `i` serves its live metrics on the port
+    after the given one plus `i`.
+    """
+    loop = asyncio.get_running_loop()
+    ctx = multiprocessing.get_context("spawn")
+    ready_queue = ctx.Queue()
+    result_queue = ctx.Queue()
+    start_event = ctx.Event()
+    start_wall_time = ctx.Value("d", 0.0)
+    progress_counter = ctx.Value("i", 0)
+
+    workers = [
+        ctx.Process(
+            target=_shard_worker,
+            args=(worker_id, backend, input_requests[worker_id::num_workers],
+                  arrival_times[worker_id::num_workers]
+                  if arrival_times is not None else None, model_id, api_url,
+                  best_of, use_beam_search,
+                  len(range(worker_id, concurrency, num_workers))
+                  if concurrency is not None else None, session_kwargs,
+                  sketches["itl"].relative_accuracy
+                  if sketches is not None else None,
+                  request_stream_path(stream_base_path, worker_id)
+                  if stream_base_path is not None else None, stream_header
+                  or {}, num_workers,
+                  (metrics_address[0], metrics_address[1] + 1 + worker_id)
+                  if metrics_address is not None else None, ready_queue,
+                  start_event, start_wall_time, progress_counter,
+                  result_queue),
+            daemon=True,
+        ) for worker_id in range(num_workers)
+    ]
+    for worker in workers:
+        worker.start()
+
+    try:
+        num_ready = 0
+        while num_ready < num_workers:
+            try:
+                await loop.run_in_executor(None, ready_queue.get, True, 0.5)
+                num_ready += 1
+            except queue.Empty:
+                if not all(worker.is_alive() for worker in workers):
+                    raise RuntimeError(
+                        "Load generator worker exited during startup.")
+
+        # Give every worker a moment to wake up before the first deadline.
+        start_wall_time.value = time.time() + 0.1
+        start_time = time.perf_counter() + (start_wall_time.value -
+                                            time.time())
+        start_event.set()
+
+        outputs: List[Optional[RequestFuncOutput]] = [None] * len(
+            input_requests)
+        actual_send_times: List[float] = [0.0] * len(input_requests)
+        benchmark_duration = 0.0
+        monitor_samples: List[Dict[str, Any]] = []
+        pending = num_workers
+        while pending:
+            try:
+                (worker_id, shard_outputs, shard_send_times, duration,
+                 shard_sketches, shard_monitor_samples,
+                 error) = await loop.run_in_executor(
+                     None, result_queue.get, True, 0.5)
+            except queue.Empty:
+                pass
+            else:
+                if error is not None:
+                    raise RuntimeError(
+                        f"Load generator worker {worker_id} failed:\n{error}")
+                outputs[worker_id::num_workers] = shard_outputs
+                actual_send_times[worker_id::num_workers] = shard_send_times
+                benchmark_duration = max(benchmark_duration, duration)
+                monitor_samples.append(shard_monitor_samples)
+                if sketches is not None:
+                    for name, sketch in shard_sketches.items():
+                        sketches[name].merge(sketch)
+                pending -= 1
+            if pbar is not None:
+                pbar.update(progress_counter.value - pbar.n)
+    finally:
+        for worker in workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+
+    return (outputs, actual_send_times, benchmark_duration, monitor_samples,
+            start_time)
+
+
+def _sample_stats(samples: List[float],
+                  selected_percentiles: Sequence[float]) -> Dict[str, Any]:
+    samples_ms = np.asarray(samples or 0, dtype=np.float64) * 1000
+    return {
+        "mean": np.mean(samples_ms),
+        "median": np.median(samples_ms),
+        "std": np.std(samples_ms),
+        "p99": np.percentile(samples_ms, 99),
+        "percentiles": [(p, np.percentile(samples_ms, p))
+                        for p in selected_percentiles],
+    }
+
+
+def _sketch_stats(sketch: DDSketch,
+                  selected_percentiles: Sequence[float]) -> Dict[str, Any]:
+    if sketch.count == 0:
+        return _sample_stats([], selected_percentiles)
+    return {
+        "mean": sketch.mean * 1000,
+        "median": sketch.percentile(50) * 1000,
+        "std": sketch.std * 1000,
+        "p99": sketch.percentile(99) * 1000,
+        "percentiles": [(p, sketch.percentile(p) * 1000)
+                        for p in selected_percentiles],
+    }
+
 
-        if request_rate == float("inf"):
-            # If the request rate is infinity, then we don't need to wait.
-            continue
+def create_latency_sketches(
+        relative_accuracy: float = 0.01) -> Dict[str, DDSketch]:
+    return {
+        "ttft": DDSketch(relative_accuracy),
+        "itl": DDSketch(relative_accuracy),
+    }
 
-        # Sample the request interval from the exponential distribution.
-        interval = np.random.exponential(1.0 / request_rate)
-        # The next request will be sent after the interval.
-        await asyncio.sleep(interval)
+
+def observe_latencies(sketches: Dict[str, DDSketch],
+                      output: RequestFuncOutput) -> None:
+    """Fold a finished request into the latency sketches and drop its raw
+    inter-token latencies, so memory does not grow with the output length.
+    """
+    if output.success:
+        sketches["ttft"].add(output.ttft)
+        sketches["itl"].add_many(output.itl)
+    output.itl = []
 
 
 def calculate_metrics(
-    input_requests: List[Tuple[str, int, int]],
     outputs: List[RequestFuncOutput],
     dur_s: float,
     tokenizer: PreTrainedTokenizerBase,
+    tokenizer_workers: int = 1,
+    sketches: Optional[Dict[str, DDSketch]] = None,
+    selected_percentiles: Sequence[float] = (99, ),
+    goodput_config: Optional[Dict[str, float]] = None,
 ) -> Tuple[BenchmarkMetrics, List[int]]:
     actual_output_lens: List[int] = []
     total_input = 0
@@ -242,17 +672,28 @@ def calculate_metrics(
     itls: List[float] = []
     tpots: List[float] = []
     ttfts: List[float] = []
+    # Output tokens are counted by the server where it reports its usage,
+    # rather than looking at len(outputs[i].itl) since multiple output tokens
+    # may be bundled together in one chunk. Only the generated texts of the
+    # remaining requests are tokenized, up front in batches, which may
+    # inflate their output token count slightly.
+    generated_lens = iter(
+        get_token_lens(
+            tokenizer,
+            [
+                output.generated_text for output in outputs
+                if output.success and output.output_tokens is None
+            ],
+            add_special_tokens=False,
+            num_workers=tokenizer_workers,
+        ))
     for i in range(len(outputs)):
         if outputs[i].success:
-            # We use the tokenizer to count the number of output tokens for all
-            # serving backends instead of looking at len(outputs[i].itl) since
-            # multiple output tokens may be bundled together
-            # Note : this may inflate the output token count slightly
-            output_len = len(
-                tokenizer(outputs[i].generated_text,
-                          add_special_tokens=False).input_ids)
+            output_len = (outputs[i].output_tokens if
+                          outputs[i].output_tokens is not None else
+                          next(generated_lens))
             actual_output_lens.append(output_len)
-            total_input += input_requests[i][1]
+            total_input += outputs[i].prompt_len
             if output_len > 1:
                 tpots.append(
                     (outputs[i].latency - outputs[i].ttft) / (output_len - 1))
@@ -267,6 +708,16 @@ def calculate_metrics(
             "All requests failed. This is likely due to a misconfiguration "
             "on the benchmark arguments.",
             stacklevel=2)
+
+    # ttfts is empty if streaming is not supported by backend
+    if sketches is not None:
+        ttft_stats = _sketch_stats(sketches["ttft"], selected_percentiles)
+        itl_stats = _sketch_stats(sketches["itl"], selected_percentiles)
+    else:
+        ttft_stats = _sample_stats(ttfts, selected_percentiles)
+        itl_stats = _sample_stats(itls, selected_percentiles)
+    tpot_stats = _sample_stats(tpots, selected_percentiles)
+
     metrics = BenchmarkMetrics(
         completed=completed,
         total_input=total_input,
@@ -274,24 +725,368 @@ def calculate_metrics(
         request_throughput=completed / dur_s,
         input_throughput=total_input / dur_s,
         output_throughput=sum(actual_output_lens) / dur_s,
-        mean_ttft_ms=np.mean(ttfts or 0) *
-        1000,  # ttfts is empty if streaming is not supported by backend
-        median_ttft_ms=np.median(ttfts or 0) * 1000,
-        std_ttft_ms=np.std(ttfts or 0) * 1000,
-        p99_ttft_ms=np.percentile(ttfts or 0, 99) * 1000,
-        mean_tpot_ms=np.mean(tpots or 0) * 1000,
-        median_tpot_ms=np.median(tpots or 0) * 1000,
-        std_tpot_ms=np.std(tpots or 0) * 1000,
-        p99_tpot_ms=np.percentile(tpots or 0, 99) * 1000,
-        mean_itl_ms=np.mean(itls or 0) * 1000,
-        median_itl_ms=np.median(itls or 0) * 1000,
-        std_itl_ms=np.std(itls or 0) * 1000,
-        p99_itl_ms=np.percentile(itls or 0, 99) * 1000,
+        mean_ttft_ms=ttft_stats["mean"],
+        median_ttft_ms=ttft_stats["median"],
+        std_ttft_ms=ttft_stats["std"],
+        p99_ttft_ms=ttft_stats["p99"],
+        mean_tpot_ms=tpot_stats["mean"],
+        median_tpot_ms=tpot_stats["median"],
+        std_tpot_ms=tpot_stats["std"],
+        p99_tpot_ms=tpot_stats["p99"],
+        mean_itl_ms=itl_stats["mean"],
+        median_itl_ms=itl_stats["median"],
+        std_itl_ms=itl_stats["std"],
+        p99_itl_ms=itl_stats["p99"],
+        percentiles_ttft_ms=ttft_stats["percentiles"],
+        percentiles_tpot_ms=tpot_stats["percentiles"],
+        percentiles_itl_ms=itl_stats["percentiles"],
     )
+    if goodput_config:
+        good = meets_slos(outputs, actual_output_lens, goodput_config)
+        metrics.request_goodput = int(good.sum()) / dur_s
+        metrics.output_token_goodput = int(
+            np.asarray(actual_output_lens)[good].sum()) / dur_s
+        metrics.slo_attainment_pct = (float(good.mean()) *
+                                      100 if len(good) else 0.0)
 
     return metrics, actual_output_lens
 
 
+GOODPUT_METRICS = ("ttft", "tpot", "e2el")
+
+
+def parse_goodput(specs: List[str]) -> Dict[str, float]:
+    """Parse per-request SLOs such as `ttft:500`, in milliseconds."""
+    goodput_config = {}
+    for spec in specs:
+        name, sep, threshold = spec.partition(":")
+        if not sep or name not in GOODPUT_METRICS:
+            raise ValueError(
+                f"Invalid goodput SLO {spec!r}. Please use NAME:MS with NAME "
+                f"one of {', '.join(GOODPUT_METRICS)}.")
+        goodput_config[name] = float(threshold)
+    return goodput_config
+
+
+def meets_slos(outputs: List[RequestFuncOutput], output_lens: List[int],
+               goodput_config: Dict[str, float]) -> np.ndarray:
+    """Return a mask of the requests that succeeded and met every SLO.
+    Requests with a single output token have no TPOT and always meet it."""
+    success = np.fromiter((output.success for output in outputs),
+                          dtype=bool,
+                          count=len(outputs))
+    ttft = np.fromiter((output.ttft for output in outputs),
+                       dtype=np.float64,
+                       count=len(outputs)) * 1000
+    e2el = np.fromiter((output.latency for output in outputs),
+                       dtype=np.float64,
+                       count=len(outputs)) * 1000
+    decode_steps = np.asarray(output_lens, dtype=np.float64) - 1
+    tpot = np.zeros(len(outputs))
+    np.divide(e2el - ttft, decode_steps, out=tpot, where=decode_steps > 0)
+    values = {"ttft": ttft, "tpot": tpot, "e2el": e2el}
+    good = success
+    for name, threshold in goodput_config.items():
+        good &= values[name] <= threshold
+    return good
+
+
+def _percentile_word(p: float) -> str:
+    return str(int(p)) if int(p) == p else str(p)
+
+
+def calculate_load_stats(
+    intended_send_times: Optional[np.ndarray],
+    actual_send_times: List[float],
+) -> Dict[str, float]:
+    """Compare the intended arrival schedule with when requests were
+    actually sent, to check that the client kept up with the offered load.
+    Closed-loop runs have no schedule and only report the achieved rate.
+    """
+    actual = np.sort(actual_send_times)
+    send_span = actual[-1] - actual[0] if len(actual) > 1 else 0.0
+    load_stats = {
+        "achieved_request_rate":
+        (len(actual) - 1) / send_span if send_span > 0 else float("inf"),
+    }
+    if intended_send_times is not None:
+        send_lag = (np.asarray(actual_send_times) -
+                    intended_send_times[:len(actual)])
+        load_stats["mean_send_lag_ms"] = np.mean(send_lag) * 1000
+        load_stats["max_send_lag_ms"] = np.max(send_lag) * 1000
+    return load_stats
+
+
+def get_session_kwargs(max_connections: int, keepalive_timeout: float,
+                       dns_cache_ttl: int) -> Dict[str, Any]:
+    return dict(
+        max_connections=max_connections,
+        max_connections_per_host=max_connections,
+        keepalive_timeout=keepalive_timeout,
+        dns_cache_ttl=dns_cache_ttl,
+    )
+
+
+def rebase_start_times(outputs: List[RequestFuncOutput],
+                       start_time: float) -> None:
+    """Make the send times of `outputs` relative to the benchmark start."""
+    for output in outputs:
+        output.start_time -= start_time
+
+
+def request_record(index: int, output: RequestFuncOutput, start_time: float,
+                   **fields: Any) -> Dict[str, Any]:
+    """Compact request stream record of a finished request, with its send
+    time in seconds since `start_time`."""
+    return {
+        "index": index,
+        "start": output.start_time - start_time,
+        "success": output.success,
+        "prompt_len": output.prompt_len,
+        "ttft": output.ttft,
+        "latency": output.latency,
+        "itl": output.itl,
+        "parse_time": output.parse_time,
+        "output_tokens": output.output_tokens,
+        "text": output.generated_text,
+        "error": output.error,
+        **fields,
+    }
+
+
+def output_from_record(record: Dict[str, Any]) -> RequestFuncOutput:
+    return RequestFuncOutput(
+        generated_text=record["text"],
+        success=record["success"],
+        latency=record["latency"],
+        ttft=record["ttft"],
+        itl=record["itl"],
+        prompt_len=record["prompt_len"],
+        error=record["error"],
+        start_time=record["start"],
+        parse_time=record["parse_time"],
+        output_tokens=record.get("output_tokens"),
+    )
+
+
+def _binned_percentiles(times: np.ndarray, values: np.ndarray,
+                        edges: np.ndarray,
+                        percentiles: Sequence[float]) -> Dict[float, np.ndarray]:
+    """Nearest-rank percentiles of `values` grouped by the window of their
+    `times`, NaN for empty windows."""
+    num_windows = len(edges) - 1
+    bins = np.searchsorted(edges, times, side="right") - 1
+    in_range = (bins >= 0) & (bins < num_windows)
+    bins, values = bins[in_range], values[in_range]
+    ordered = values[np.lexsort((values, bins))]
+    counts = np.bincount(bins, minlength=num_windows)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    result = {}
+    for p in percentiles:
+        ranks = np.maximum(np.ceil(counts * p / 100).astype(np.int64) - 1, 0)
+        window_values = np.full(num_windows, np.nan)
+        has_values = counts > 0
+        window_values[has_values] = ordered[(starts + ranks)[has_values]]
+        result[p] = window_values
+    return result
+
+
+def calculate_time_series(
+    outputs: List[RequestFuncOutput],
+    output_lens: List[int],
+    window_s: float = 1.0,
+) -> Dict[str, Any]:
+    """Bin the run into windows of `window_s` seconds.
+
+    Expects send times rebased to the benchmark start. Reports per window the
+    mean number of requests in flight, completed requests and output tokens
+    per second, and p50/p99 of the TTFTs and ITLs observed in it. Output
+    tokens are spread evenly over the chunks a request received; without
+    ITLs (e.g. with --latency-sketch) they are counted at completion.
+    """
+    done = [output for output in outputs if output.success]
+    lens = np.asarray([n for n, output in zip(output_lens, outputs)
+                       if output.success],
+                      dtype=np.float64)
+    sends = np.asarray([output.start_time for output in done])
+    first_tokens = sends + np.asarray([output.ttft for output in done])
+    completions = sends + np.asarray([output.latency for output in done])
+    end = completions.max() if len(done) else 0.0
+    edges = np.arange(0.0, end + window_s, window_s)
+    if len(edges) < 2:
+        edges = np.array([0.0, window_s])
+
+    # In-flight requests form a step function over the send and completion
+    # events; its integral over each window gives the mean concurrency.
+    event_times = np.concatenate((sends, completions))
+    order = np.argsort(event_times, kind="stable")
+    event_times = event_times[order]
+    levels = np.cumsum(
+        np.concatenate((np.ones(len(sends)), -np.ones(len(completions))))
+        [order])
+    areas = np.concatenate(([0.0], np.cumsum(levels[:-1] *
+                                             np.diff(event_times))))
+    last_event = np.searchsorted(event_times, edges, side="right") - 1
+    clamped = np.maximum(last_event, 0)
+    area_at_edges = np.where(
+        last_event >= 0,
+        areas[clamped] + levels[clamped] * (edges - event_times[clamped]),
+        0.0) if len(event_times) else np.zeros(len(edges))
+    in_flight = np.diff(area_at_edges) / window_s
+
+    # Chunk i of a request arrives at its first token plus the sum of its
+    # first i ITLs, and every chunk carries an equal share of its tokens.
+    itl_counts = np.asarray([len(output.itl) for output in done],
+                            dtype=np.int64)
+    itl_values = np.concatenate([np.asarray(output.itl, dtype=np.float64)
+                                 for output in done] + [np.empty(0)])
+    cumulative_itls = np.cumsum(itl_values)
+    segment_starts = np.cumsum(itl_counts) - itl_counts
+    preceding_itls = np.concatenate(([0.0], cumulative_itls))[segment_starts]
+    chunk_times = (np.repeat(first_tokens - preceding_itls, itl_counts) +
+                   cumulative_itls)
+    tokens_per_chunk = lens / (itl_counts + 1)
+    token_times = np.concatenate(
+        (np.where(itl_counts > 0, first_tokens, completions), chunk_times))
+    token_counts = np.concatenate(
+        (tokens_per_chunk, np.repeat(tokens_per_chunk, itl_counts)))
+    output_tokens, _ = np.histogram(token_times,
+                                    bins=edges,
+                                    weights=token_counts)
+    completed, _ = np.histogram(completions, bins=edges)
+
+    ttft_percentiles = _binned_percentiles(
+        first_tokens, (first_tokens - sends) * 1000, edges, (50, 99))
+    itl_percentiles = _binned_percentiles(chunk_times, itl_values * 1000,
+                                          edges, (50, 99))
+
+    def to_list(values: np.ndarray) -> List[Optional[float]]:
+        return [None if np.isnan(value) else float(value) for value in values]
+
+    return {
+        "window_s": window_s,
+        "window_start": edges[:-1].tolist(),
+        "in_flight_requests": in_flight.tolist(),
+        "request_throughput": (completed / window_s).tolist(),
+        "output_throughput": (output_tokens / window_s).tolist(),
+        "p50_ttft_ms": to_list(ttft_percentiles[50]),
+        "p99_ttft_ms": to_list(ttft_percentiles[99]),
+        "p50_itl_ms": to_list(itl_percentiles[50]),
+        "p99_itl_ms": to_list(itl_percentiles[99]),
+    }
+
+
+def print_metrics(metrics: BenchmarkMetrics, benchmark_duration: float,
+                  goodput_config: Optional[Dict[str, float]]) -> None:
+    print("{s:{c}^{n}}".format(s=' Serving Benchmark Result ', n=50, c='='))
+    print("{:<40} {:<10}".format("Successful requests:", metrics.completed))
+    print("{:<40} {:<10.2f}".format("Benchmark duration (s):",
+                                    benchmark_duration))
+    print("{:<40} {:<10}".format("Total input tokens:", metrics.total_input))
+    print("{:<40} {:<10}".format("Total generated tokens:",
+                                 metrics.total_output))
+    print("{:<40} {:<10.2f}".format("Request throughput (req/s):",
+                                    metrics.request_throughput))
+    print("{:<40} {:<10.2f}".format("Input token throughput (tok/s):",
+                                    metrics.input_throughput))
+    print("{:<40} {:<10.2f}".format("Output token throughput (tok/s):",
+                                    metrics.output_throughput))
+    print("{s:{c}^{n}}".format(s='Time to First Token', n=50, c='-'))
+    print("{:<40} {:<10.2f}".format("Mean TTFT (ms):", metrics.mean_ttft_ms))
+    print("{:<40} {:<10.2f}".format("Median TTFT (ms):",
+                                    metrics.median_ttft_ms))
+    for p, value in metrics.percentiles_ttft_ms:
+        print("{:<40} {:<10.2f}".format(f"P{_percentile_word(p)} TTFT (ms):",
+                                        value))
+    print("{s:{c}^{n}}".format(s='Time per Output Token (excl. 1st token)',
+                               n=50,
+                               c='-'))
+    print("{:<40} {:<10.2f}".format("Mean TPOT (ms):", metrics.mean_tpot_ms))
+    print("{:<40} {:<10.2f}".format("Median TPOT (ms):",
+                                    metrics.median_tpot_ms))
+    for p, value in metrics.percentiles_tpot_ms:
+        print("{:<40} {:<10.2f}".format(f"P{_percentile_word(p)} TPOT (ms):",
+                                        value))
+    print("{s:{c}^{n}}".format(s='Inter-token Latency', n=50, c='-'))
+    print("{:<40} {:<10.2f}".format("Mean ITL (ms):", metrics.mean_itl_ms))
+    print("{:<40} {:<10.2f}".format("Median ITL (ms):", metrics.median_itl_ms))
+    for p, value in metrics.percentiles_itl_ms:
+        print("{:<40} {:<10.2f}".format(f"P{_percentile_word(p)} ITL (ms):",
+                                        value))
+    if goodput_config:
+        print("{s:{c}^{n}}".format(s='Goodput', n=50, c='-'))
+        print("{:<40} {:<10}".format(
+            "SLOs (ms):", " ".join(f"{name}:{threshold:g}"
+                                   for name, threshold in
+                                   goodput_config.items())))
+        print("{:<40} {:<10.2f}".format("Request goodput (req/s):",
+                                        metrics.request_goodput))
+        print("{:<40} {:<10.2f}".format("Output token goodput (tok/s):",
+                                        metrics.output_token_goodput))
+        print("{:<40} {:<10.2f}".format("SLO attainment (%):",
+                                        metrics.slo_attainment_pct))
+
+
+def metrics_result_fields(metrics: BenchmarkMetrics,
+                          benchmark_duration: float) -> Dict[str, Any]:
+    return {
+        "duration": benchmark_duration,
+        "completed": metrics.completed,
+        "total_input_tokens": metrics.total_input,
+        "total_output_tokens": metrics.total_output,
+        "request_throughput": metrics.request_throughput,
+        "input_throughput": metrics.input_throughput,
+        "output_throughput": metrics.output_throughput,
+        "mean_ttft_ms": metrics.mean_ttft_ms,
+        "median_ttft_ms": metrics.median_ttft_ms,
+        "std_ttft_ms": metrics.std_ttft_ms,
+        "p99_ttft_ms": metrics.p99_ttft_ms,
+        "mean_tpot_ms": metrics.mean_tpot_ms,
+        "median_tpot_ms": metrics.median_tpot_ms,
+        "std_tpot_ms": metrics.std_tpot_ms,
+        "p99_tpot_ms": metrics.p99_tpot_ms,
+        "mean_itl_ms": metrics.mean_itl_ms,
+        "median_itl_ms": metrics.median_itl_ms,
+        "std_itl_ms": metrics.std_itl_ms,
+        "p99_itl_ms": metrics.p99_itl_ms,
+        **{
+            f"p{_percentile_word(p)}_{metric}_ms": value
+            for metric, percentiles in (
+                ("ttft", metrics.percentiles_ttft_ms),
+                ("tpot", metrics.percentiles_tpot_ms),
+                ("itl", metrics.percentiles_itl_ms),
+            ) for p, value in percentiles
+        },
+    }
+
+
+def goodput_result_fields(
+        metrics: BenchmarkMetrics,
+        goodput_config: Optional[Dict[str, float]]) -> Dict[str, Any]:
+    if not goodput_config:
+        return {}
+    return {
+        "request_goodput": metrics.request_goodput,
+        "output_token_goodput": metrics.output_token_goodput,
+        "slo_attainment_pct": metrics.slo_attainment_pct,
+        "goodput_config": goodput_config,
+    }
+
+
+def per_request_result_fields(outputs: List[RequestFuncOutput],
+                              output_lens: List[int]) -> Dict[str, Any]:
+    return {
+        "input_lens": [output.prompt_len for output in outputs],
+        "output_lens": output_lens,
+        "ttfts": [output.ttft for output in outputs],
+        "latencies": [output.latency for output in outputs],
+        "parse_times": [output.parse_time for output in outputs],
+        "itls": [output.itl for output in outputs],
+        "generated_texts": [output.generated_text for output in outputs],
+        "errors": [output.error for output in outputs],
+    }
+
+
 async def benchmark(
     backend: str,
     api_url: str,
@@ -304,14 +1099,136 @@ async def benchmark(
     request_rate: float,
     disable_tqdm: bool,
     profile: bool,
+    max_connections: int = 0,
+    keepalive_timeout: float = 60.0,
+    dns_cache_ttl: int = 300,
+    num_workers: int = 1,
+    tokenizer_workers: int = 1,
+    sketch_accuracy: Optional[float] = None,
+    selected_percentiles: Sequence[float] = (99, ),
+    concurrency: Optional[int] = None,
+    session: Optional[aiohttp.ClientSession] = None,
+    goodput_config: Optional[Dict[str, float]] = None,
+    time_series_window: float = 1.0,
+    trace: Optional[RequestTrace] = None,
+    arrival_process: str = "poisson",
+    arrival_params: Optional[Dict[str, Any]] = None,
+    sessions: Optional[List[Session]] = None,
+    think_time: float = 0.0,
+    max_loop_lag_ms: float = 5.0,
+    max_client_cpu_pct: float = 80.0,
+    stream_base_path: Optional[str] = None,
+    stream_header: Optional[Dict[str, Any]] = None,
+    live_metrics: Optional[LiveMetrics] = None,
+    metrics_address: Optional[Tuple[str, int]] = None,
+    server_metrics_url: Optional[str] = None,
+    server_metrics_interval: float = 0.5,
 ):
     if backend in ASYNC_REQUEST_FUNCS:
         request_func = ASYNC_REQUEST_FUNCS[backend]
     else:
         raise ValueError(f"Unknown backend: {backend}")
 
+    # All requests share one pooled session so that TCP handshakes and DNS
+    # lookups are paid once up front instead of being counted in TTFT. A
+    # sweep passes in its session to keep the connections warm across steps.
+    session_kwargs = get_session_kwargs(max_connections, keepalive_timeout,
+                                        dns_cache_ttl)
+    owns_session = session is None
+    if owns_session:
+        session = create_client_session(**session_kwargs)
+    try:
+        return await _run_benchmark(
+            backend=backend,
+            request_func=request_func,
+            session=session,
+            session_kwargs=session_kwargs,
+            num_workers=num_workers,
+            tokenizer_workers=tokenizer_workers,
+            sketch_accuracy=sketch_accuracy,
+            selected_percentiles=selected_percentiles,
+            api_url=api_url,
+            base_url=base_url,
+            model_id=model_id,
+            tokenizer=tokenizer,
+            input_requests=input_requests,
+            best_of=best_of,
+            use_beam_search=use_beam_search,
+            request_rate=request_rate,
+            disable_tqdm=disable_tqdm,
+            profile=profile,
+            concurrency=concurrency,
+            goodput_config=goodput_config,
+            time_series_window=time_series_window,
+            trace=trace,
+            arrival_process=arrival_process,
+            arrival_params=arrival_params,
+            sessions=sessions,
+            think_time=think_time,
+            max_loop_lag_ms=max_loop_lag_ms,
+            max_client_cpu_pct=max_client_cpu_pct,
+            stream_base_path=stream_base_path,
+            stream_header=stream_header,
+            live_metrics=live_metrics,
+            metrics_address=metrics_address,
+            server_metrics_url=server_metrics_url,
+            server_metrics_interval=server_metrics_interval,
+        )
+    finally:
+        if owns_session:
+            await session.close()
+
+
+async def _run_benchmark(
+    backend: str,
+    request_func: Callable[..., Awaitable[RequestFuncOutput]],
+    session: aiohttp.ClientSession,
+    session_kwargs: Dict[str, Any],
+    num_workers: int,
+    tokenizer_workers: int,
+    sketch_accuracy: Optional[float],
+    selected_percentiles: Sequence[float],
+    api_url: str,
+    base_url: str,
+    model_id: str,
+    tokenizer: PreTrainedTokenizerBase,
+    input_requests: List[Tuple[str, int, int]],
+    best_of: int,
+    use_beam_search: bool,
+    request_rate: float,
+    disable_tqdm: bool,
+    profile: bool,
+    concurrency: Optional[int] = None,
+    goodput_config: Optional[Dict[str, float]] = None,
+    time_series_window: float = 1.0,
+    trace: Optional[RequestTrace] = None,
+    arrival_process: str = "poisson",
+    arrival_params: Optional[Dict[str, Any]] = None,
+    sessions: Optional[List[Session]] = None,
+    think_time: float = 0.0,
+    max_loop_lag_ms: float = 5.0,
+    max_client_cpu_pct: float = 80.0,
+    stream_base_path: Optional[str] = None,
+    stream_header: Optional[Dict[str, Any]] = None,
+    live_metrics: Optional[LiveMetrics] = None,
+    metrics_address: Optional[Tuple[str, int]] = None,
+    server_metrics_url: Optional[str] = None,
+    server_metrics_interval: float = 0.5,
+):
+
     print("Starting initial single prompt test run...")
-    test_prompt, test_prompt_len, test_output_len = input_requests[0]
+    use_chat_messages = backend == "openai-chat"
+    if sessions is not None:
+        first_message, test_output_len = sessions[0][0]
+        test_prompt = (first_message if use_chat_messages else render_prompt(
+            tokenizer, [{
+                "role": "user",
+                "content": first_message
+            }]))
+        test_prompt_len = 0
+    else:
+        test_prompt, test_prompt_len, test_output_len = (
+            next(iter(trace))[0] if trace is not None else input_requests[0])
     test_input = RequestFuncInput(
         model=model_id,
         prompt=test_prompt,
@@ -321,7 +1238,8 @@ async def benchmark(
         best_of=best_of,
         use_beam_search=use_beam_search,
     )
-    test_output = await request_func(request_func_input=test_input)
+    test_output = await request_func(request_func_input=test_input,
+                                     session=session)
     if not test_output.success:
         raise ValueError(
             "Initial test run failed - Please make sure benchmark arguments "
@@ -340,32 +1258,190 @@ async def benchmark(
             best_of=best_of,
             use_beam_search=use_beam_search,
         )
-        profile_output = await request_func(request_func_input=profile_input)
+        profile_output = await request_func(
+            request_func_input=profile_input, session=session)
         if profile_output.success:
             print("Profiler started")
 
-    print(f"Traffic request rate: {request_rate}")
-
-    pbar = None if disable_tqdm else tqdm(total=len(input_requests))
-
+    if live_metrics is not None:
+        live_metrics.set_load(request_rate, concurrency)
+        request_func = live_metrics.instrument(request_func)
+
+    if sessions is not None:
+        # Only the start of each session is scheduled, its turns follow
+        # the replies.
+        arrival_times = None
+        session_arrival_times = None
+        if concurrency is not None:
+            print(f"Multi-turn sessions with {concurrency} concurrent users")
+        else:
+            print(f"Multi-turn session rate: {request_rate}, arrival "
+                  f"process: {arrival_process} {arrival_params or ''}")
+            session_arrival_times = get_arrival_times(len(sessions),
+                                                      request_rate,
+                                                      arrival_process,
+                                                      arrival_params)
+        print(f"Mean think time between turns: {think_time}s")
+    elif concurrency is not None:
+        print(f"Closed loop with {concurrency} concurrent users")
+        arrival_times = None
+    elif trace is not None:
+        print(f"Replaying trace {trace.path} at {trace.speed}x speed")
+        arrival_times = None
+    else:
+        print(f"Traffic request rate: {request_rate}, arrival process: "
+              f"{arrival_process} {arrival_params or ''}")
+        arrival_times = get_arrival_times(len(input_requests), request_rate,
+                                          arrival_process, arrival_params)
+
+    if sessions is not None:
+        num_requests = sum(len(session) for session in sessions)
+    elif trace is None:
+        num_requests = len(input_requests)
+    else:
+        num_requests = None
+    pbar = None if disable_tqdm else tqdm(total=num_requests)
+
+    sketches = None
+    if sketch_accuracy is not None:
+        sketches = create_latency_sketches(sketch_accuracy)
+
+    # Every finished request is appended to the request stream right away,
+    # so that an interrupted run can still be evaluated with
+    # --finalize-stream. Sharded workers each write their own stream.
+    stream_writer = None
+    if stream_base_path is not None and num_workers == 1:
+        stream_writer = RequestStreamWriter(
+            request_stream_path(stream_base_path), stream_header or {})
+    stream_index = itertools.count()
+
+    def on_output(index: int, output: RequestFuncOutput,
+                  **fields: Any) -> None:
+        # Written before the sketches take over and drop the ITLs.
+        if stream_writer is not None:
+            stream_writer.write(
+                request_record(index, output, benchmark_start_time, **fields))
+        if sketches is not None:
+            observe_latencies(sketches, output)
+
+    def on_session_output(session_index: int, turn: int,
+                          output: RequestFuncOutput) -> None:
+        # Prompt lengths are only counted after the run, so the record
+        # keeps the user message to rebuild the conversation from.
+        on_output(next(stream_index),
+                  output,
+                  session=session_index,
+                  turn=turn,
+                  message=sessions[session_index][turn][0])
+
+    # Watch the client for overhead that would inflate the latencies, and
+    # the server's scheduler to explain them.
+    monitor = ClientMonitor()
+    monitor.start()
+    scraper = None
+    if server_metrics_url is not None:
+        scraper = ServerMetricsScraper(server_metrics_url,
+                                       server_metrics_interval)
+        scraper.start()
+    turn_indices = None
     benchmark_start_time = time.perf_counter()
-    tasks: List[asyncio.Task] = []
-    async for request in get_request(input_requests, request_rate):
-        prompt, prompt_len, output_len = request
-        request_func_input = RequestFuncInput(
-            model=model_id,
-            prompt=prompt,
-            api_url=api_url,
-            prompt_len=prompt_len,
-            output_len=output_len,
-            best_of=best_of,
-            use_beam_search=use_beam_search,
-        )
-        tasks.append(
-            asyncio.create_task(
-                request_func(request_func_input=request_func_input,
-                             pbar=pbar)))
-    outputs: List[RequestFuncOutput] = await asyncio.gather(*tasks)
+    # Sharded workers start together once they are all up.
+    run_start_time = benchmark_start_time
+    try:
+        if sessions is not None:
+            (outputs, actual_send_times, session_indices, turn_indices,
+             conversations) = await run_sessions(
+                 request_func=request_func,
+                 session=session,
+                 sessions=sessions,
+                 think_times=get_think_times(sessions, think_time),
+                 start_time=benchmark_start_time,
+                 tokenizer=tokenizer,
+                 model_id=model_id,
+                 api_url=api_url,
+                 best_of=best_of,
+                 use_beam_search=use_beam_search,
+                 use_chat_messages=use_chat_messages,
+                 arrival_times=session_arrival_times,
+                 concurrency=concurrency,
+                 pbar=pbar,
+                 on_output=on_session_output,
+             )
+            benchmark_duration = time.perf_counter() - benchmark_start_time
+            rebase_start_times(outputs, benchmark_start_time)
+            set_prompt_lens(tokenizer, outputs, conversations,
+                            tokenizer_workers)
+        elif num_workers > 1:
+            print(f"Sharding requests across {num_workers} worker processes")
+            (outputs, actual_send_times, benchmark_duration, monitor_samples,
+             run_start_time) = await run_sharded_requests(
+                 num_workers=num_workers,
+                 backend=backend,
+                 input_requests=input_requests,
+                 arrival_times=arrival_times,
+                 model_id=model_id,
+                 api_url=api_url,
+                 best_of=best_of,
+                 use_beam_search=use_beam_search,
+                 session_kwargs=session_kwargs,
+                 pbar=pbar,
+                 sketches=sketches,
+                 concurrency=concurrency,
+                 stream_base_path=stream_base_path,
+                 stream_header=stream_header,
+                 metrics_address=metrics_address,
+             )
+        elif concurrency is not None:
+            outputs, actual_send_times = await run_closed_loop(
+                request_func=request_func,
+                session=session,
+                input_requests=input_requests,
+                concurrency=concurrency,
+                start_time=benchmark_start_time,
+                model_id=model_id,
+                api_url=api_url,
+                best_of=best_of,
+                use_beam_search=use_beam_search,
+                pbar=pbar,
+                on_output=on_output,
+            )
+            benchmark_duration = time.perf_counter() - benchmark_start_time
+            rebase_start_times(outputs, benchmark_start_time)
+        else:
+            if trace is not None:
+                # The trace is streamed, so its schedule is only known once
+                # it has been replayed.
+                replayed_arrival_times: List[float] = []
+                schedule = _record_arrival_times(trace,
+                                                 replayed_arrival_times)
+            else:
+                schedule = zip(input_requests, arrival_times)
+            outputs, actual_send_times = await dispatch_requests(
+                request_func=request_func,
+                session=session,
+                schedule=schedule,
+                start_time=benchmark_start_time,
+                model_id=model_id,
+                api_url=api_url,
+                best_of=best_of,
+                use_beam_search=use_beam_search,
+                pbar=pbar,
+                on_output=on_output,
+            )
+            benchmark_duration = time.perf_counter() - benchmark_start_time
+            rebase_start_times(outputs, benchmark_start_time)
+            if trace is not None:
+                arrival_times = np.asarray(replayed_arrival_times)
+    finally:
+        if stream_writer is not None:
+            stream_writer.close()
+    if num_workers > 1:
+        # The coordinating process only waits on the workers.
+        await monitor.stop()
+    else:
+        monitor_samples = [await monitor.stop()]
+    server_samples = (await scraper.stop(run_start_time)
+                      if scraper is not None else None)
 
     if profile:
         print("Stopping profiler...")
@@ -378,83 +1454,189 @@ async def benchmark(
             best_of=best_of,
             use_beam_search=use_beam_search,
         )
-        profile_output = await request_func(request_func_input=profile_input)
+        profile_output = await request_func(
+            request_func_input=profile_input, session=session)
         if profile_output.success:
             print("Profiler stopped")
 
     if pbar is not None:
         pbar.close()
 
-    benchmark_duration = time.perf_counter() - benchmark_start_time
-
     metrics, actual_output_lens = calculate_metrics(
-        input_requests=input_requests,
         outputs=outputs,
         dur_s=benchmark_duration,
         tokenizer=tokenizer,
+        tokenizer_workers=tokenizer_workers,
+        sketches=sketches,
+        selected_percentiles=selected_percentiles,
+        goodput_config=goodput_config,
     )
+    load_stats = calculate_load_stats(arrival_times, actual_send_times)
+    time_series = calculate_time_series(outputs, actual_output_lens,
+                                        time_series_window)
+    turn_stats = (calculate_turn_stats(outputs, turn_indices)
+                  if turn_indices is not None else None)
+    client_stats = client_overhead_stats(
+        monitor_samples, [output.parse_time for output in outputs],
+        benchmark_duration)
+    overhead_warnings = client_overhead_warnings(client_stats,
+                                                 max_loop_lag_ms,
+                                                 max_client_cpu_pct)
+    server_stats = (server_metrics_summary(server_samples, outputs,
+                                           benchmark_duration)
+                    if server_samples is not None else {})
+
+    print_metrics(metrics, benchmark_duration, goodput_config)
+    if turn_stats is not None:
+        print_turn_stats(turn_stats)
+    print("{s:{c}^{n}}".format(s='Load Generation', n=50, c='-'))
+    if concurrency is not None:
+        print("{:<40} {:<10}".format("Concurrent users:", concurrency))
+    print("{:<40} {:<10.2f}".format("Achieved request rate (req/s):",
+                                    load_stats["achieved_request_rate"]))
+    if arrival_times is not None:
+        print("{:<40} {:<10.2f}".format("Mean send lag (ms):",
+                                        load_stats["mean_send_lag_ms"]))
+        print("{:<40} {:<10.2f}".format("Max send lag (ms):",
+                                        load_stats["max_send_lag_ms"]))
+    print("{s:{c}^{n}}".format(s='Client Overhead', n=50, c='-'))
+    print("{:<40} {:<10.2f}".format("Client CPU utilization (%):",
+                                    client_stats["client_cpu_pct"]))
+    print("{:<40} {:<10.2f}".format("P99 event loop lag (ms):",
+                                    client_stats["loop_lag_p99_ms"]))
+    print("{:<40} {:<10.2f}".format("Max event loop lag (ms):",
+                                    client_stats["loop_lag_max_ms"]))
+    print("{:<40} {:<10.3f}".format("Mean parse time (ms/req):",
+                                    client_stats["parse_time_mean_ms"]))
+    if server_samples is not None:
+        print_server_metrics_summary(server_stats)
+    print("=" * 50)
+    if overhead_warnings:
+        warnings.warn(
+            "The client may have limited this benchmark, its latencies "
+            "include client-side delay: " + "; ".join(overhead_warnings) +
+            ". Consider --num-workers or a faster client machine.",
+            stacklevel=2)
 
-    print("{s:{c}^{n}}".format(s=' Serving Benchmark Result ', n=50, c='='))
-    print("{:<40} {:<10}".format("Successful requests:", metrics.completed))
-    print("{:<40} {:<10.2f}".format("Benchmark duration (s):",
-                                    benchmark_duration))
-    print("{:<40} {:<10}".format("Total input tokens:", metrics.total_input))
-    print("{:<40} {:<10}".format("Total generated tokens:",
-                                 metrics.total_output))
-    print("{:<40} {:<10.2f}".format("Request throughput (req/s):",
-                                    metrics.request_throughput))
-    print("{:<40} {:<10.2f}".format("Input token throughput (tok/s):",
-                                    metrics.input_throughput))
-    print("{:<40} {:<10.2f}".format("Output token throughput (tok/s):",
-                                    metrics.output_throughput))
-    print("{s:{c}^{n}}".format(s='Time to First Token', n=50, c='-'))
-    print("{:<40} {:<10.2f}".format("Mean TTFT (ms):", metrics.mean_ttft_ms))
-    print("{:<40} {:<10.2f}".format("Median TTFT (ms):",
-                                    metrics.median_ttft_ms))
-    print("{:<40} {:<10.2f}".format("P99 TTFT (ms):", metrics.p99_ttft_ms))
-    print("{s:{c}^{n}}".format(s='Time per Output Token (excl. 1st token)',
-                               n=50,
-                               c='-'))
-    print("{:<40} {:<10.2f}".format("Mean TPOT (ms):", metrics.mean_tpot_ms))
-    print("{:<40} {:<10.2f}".format("Median TPOT (ms):",
-                                    metrics.median_tpot_ms))
-    print("{:<40} {:<10.2f}".format("P99 TPOT (ms):", metrics.p99_tpot_ms))
-    print("{s:{c}^{n}}".format(s='Inter-token Latency', n=50, c='-'))
-    print("{:<40} {:<10.2f}".format("Mean ITL (ms):", metrics.mean_itl_ms))
-    print("{:<40} {:<10.2f}".format("Median ITL (ms):", metrics.median_itl_ms))
-    print("{:<40} {:<10.2f}".format("P99 ITL (ms):", metrics.p99_itl_ms))
+    result = {
+        **metrics_result_fields(metrics, benchmark_duration),
+        "concurrency": concurrency,
+        **load_stats,
+        **client_stats,
+        "client_limited": bool(overhead_warnings),
+        **server_stats,
+    }
+    if sessions is not None:
+        result["num_sessions"] = len(sessions)
+        result["think_time"] = think_time
+    if trace is not None:
+        result["trace_path"] = trace.path
+        result["trace_speed"] = trace.speed
+    elif concurrency is None:
+        result.update(
+            arrival_result_fields(arrival_process, arrival_params or {}))
+    result.update(goodput_result_fields(metrics, goodput_config))
+    if turn_stats is not None:
+        result["turn_stats"] = turn_stats
+    result["time_series"] = time_series
+    if server_samples is not None:
+        result["server_metrics"] = server_samples
+    result["client_overhead_warnings"] = overhead_warnings
+    if arrival_times is not None:
+        result["intended_send_times"] = arrival_times.tolist()
+    result.update({
+        "actual_send_times": actual_send_times,
+        "request_start_times": [output.start_time for output in outputs],
+    })
+    if turn_indices is not None:
+        result["session_indices"] = session_indices
+        result["turn_indices"] = turn_indices
+    result.update(per_request_result_fields(outputs, actual_output_lens))
+    return result
+
+
+def finalize_request_stream(
+    stream_paths: Sequence[str],
+    tokenizer: PreTrainedTokenizerBase,
+    tokenizer_workers: int = 1,
+    selected_percentiles: Sequence[float] = (99, ),
+    goodput_config: Optional[Dict[str, float]] = None,
+    time_series_window: float = 1.0,
+) -> Dict[str, Any]:
+    """Compute the result of a run from its request streams, e.g. of a run
+    that was interrupted. The duration of a partial run ends with its last
+    streamed request."""
+    header, records = read_request_streams(stream_paths)
+    outputs = [output_from_record(record) for record in records]
+    if records and "message" in records[0]:
+        conversations = replay_conversations(
+            [record["session"] for record in records],
+            [record["message"] for record in records],
+            [record["text"] for record in records])
+        set_prompt_lens(tokenizer, outputs, conversations, tokenizer_workers)
+    benchmark_duration = max(
+        (output.start_time + output.latency for output in outputs),
+        default=0.0)
+    metrics, actual_output_lens = calculate_metrics(
+        outputs=outputs,
+        dur_s=benchmark_duration,
+        tokenizer=tokenizer,
+        tokenizer_workers=tokenizer_workers,
+        sketches=None,
+        selected_percentiles=selected_percentiles,
+        goodput_config=goodput_config,
+    )
+    num_requests = header.get("num_requests")
+    partial = num_requests is not None and len(records) < num_requests
+    print(f"Finalized {len(records)} streamed requests"
+          f"{f' of {num_requests}' if num_requests is not None else ''}")
+    print_metrics(metrics, benchmark_duration, goodput_config)
     print("=" * 50)
 
+    config = {
+        key: value
+        for key, value in header.items()
+        if key not in ("type", "worker_id", "num_requests")
+    }
     result = {
-        "duration": benchmark_duration,
-        "completed": metrics.completed,
-        "total_input_tokens": metrics.total_input,
-        "total_output_tokens": metrics.total_output,
-        "request_throughput": metrics.request_throughput,
-        "input_throughput": metrics.input_throughput,
-        "output_throughput": metrics.output_throughput,
-        "mean_ttft_ms": metrics.mean_ttft_ms,
-        "median_ttft_ms": metrics.median_ttft_ms,
-        "std_ttft_ms": metrics.std_ttft_ms,
-        "p99_ttft_ms": metrics.p99_ttft_ms,
-        "mean_tpot_ms": metrics.mean_tpot_ms,
-        "median_tpot_ms": metrics.median_tpot_ms,
-        "std_tpot_ms": metrics.std_tpot_ms,
-        "p99_tpot_ms": metrics.p99_tpot_ms,
-        "mean_itl_ms": metrics.mean_itl_ms,
-        "median_itl_ms": metrics.median_itl_ms,
-        "std_itl_ms": metrics.std_itl_ms,
-        "p99_itl_ms": metrics.p99_itl_ms,
-        "input_lens": [output.prompt_len for output in outputs],
-        "output_lens": actual_output_lens,
-        "ttfts": [output.ttft for output in outputs],
-        "itls": [output.itl for output in outputs],
-        "generated_texts": [output.generated_text for output in outputs],
-        "errors": [output.error for output in outputs],
+        **config,
+        "num_prompts": len(records),
+        "partial": partial,
+        **metrics_result_fields(metrics, benchmark_duration),
+        **goodput_result_fields(metrics, goodput_config),
+        "time_series": calculate_time_series(outputs, actual_output_lens,
+                                             time_series_window),
+        "request_start_times": [output.start_time for output in outputs],
     }
+    if records and "session" in records[0]:
+        result["session_indices"] = [record["session"] for record in records]
+        result["turn_indices"] = [record["turn"] for record in records]
+    result.update(per_request_result_fields(outputs, actual_output_lens))
     return result
 
 
+def print_sweep_summary(steps: List[Tuple[float, Optional[int]]],
+                        results: List[Dict[str, Any]]) -> None:
+    """Print throughput and latency of every sweep step by its offered load,
+    the request rate or the number of closed-loop users."""
+    header = ("Load", "Req/s", "Out tok/s", "Med TTFT", "P99 TTFT",
+              "Med TPOT", "P99 TPOT")
+    print("{s:{c}^{n}}".format(s=' Sweep Summary ', n=82, c='='))
+    print("{:>10} {:>9} {:>11} {:>11} {:>11} {:>11} {:>11}".format(*header))
+    for (request_rate, concurrency), result in zip(steps, results):
+        load = (f"{concurrency} users"
+                if concurrency is not None else f"{request_rate} qps")
+        print("{:>10} {:>9.2f} {:>11.2f} {:>11.2f} {:>11.2f} {:>11.2f} "
+              "{:>11.2f}".format(load, result["request_throughput"],
+                                 result["output_throughput"],
+                                 result["median_ttft_ms"],
+                                 result["p99_ttft_ms"],
+                                 result["median_tpot_ms"],
+                                 result["p99_tpot_ms"]))
+    print("Latencies in ms.")
+    print("=" * 82)
+
+
 def main(args: argparse.Namespace):
     print(args)
     random.seed(args.seed)
@@ -470,10 +1652,74 @@ def main(args: argparse.Namespace):
     else:
         api_url = f"http://{args.host}:{args.port}{args.endpoint}"
         base_url = f"http://{args.host}:{args.port}"
+    server_metrics_url = None
+    if args.server_metrics_interval > 0:
+        server_metrics_url = (args.server_metrics_url
+                              if args.server_metrics_url is not None else
+                              f"{base_url}/metrics")
+
+    # Each step of the sweep runs at one request rate or concurrency level.
+    if args.concurrency:
+        steps = [(float("inf"), concurrency)
+                 for concurrency in args.concurrency]
+    elif args.request_rates:
+        steps = [(request_rate, None) for request_rate in args.request_rates]
+    else:
+        steps = [(args.request_rate, None)]
+    if args.sweep_duration is not None:
+        if any(request_rate == float("inf") for request_rate, _ in steps):
+            raise ValueError("--sweep-duration requires finite request rates "
+                             "and cannot be used with --concurrency.")
+        step_num_prompts = [
+            math.ceil(args.sweep_duration * request_rate)
+            for request_rate, _ in steps
+        ]
+    else:
+        step_num_prompts = [args.num_prompts] * len(steps)
+    slos = parse_slos(args.slo) if args.slo else None
+    goodput_config = parse_goodput(args.goodput) if args.goodput else None
+    if slos is not None:
+        # The search picks the request rate and duration of every probe.
+        if (args.concurrency or args.request_rates
+                or args.sweep_duration is not None):
+            raise ValueError(
+                "--slo cannot be combined with --concurrency, "
+                "--request-rates or --sweep-duration.")
+        # Probes may run at up to the maximum rate for the longest duration.
+        step_num_prompts = [
+            math.ceil(args.slo_max_probe_duration * args.slo_max_rate)
+        ]
+    # All steps draw their requests from the front of one shared pool.
+    num_prompts = max(step_num_prompts)
 
     tokenizer = get_tokenizer(tokenizer_id,
                               trust_remote_code=args.trust_remote_code)
-
+    token_cache_dir = (None
+                       if args.disable_token_cache else args.token_cache_dir)
+
+    if args.finalize_stream:
+        # Evaluate the request streams of an earlier, possibly interrupted,
+        # run instead of running a benchmark.
+        result_json = finalize_request_stream(
+            args.finalize_stream,
+            tokenizer,
+            tokenizer_workers=args.tokenizer_workers,
+            selected_percentiles=[
+                float(p) for p in args.metric_percentiles.split(",")
+            ],
+            goodput_config=goodput_config,
+            time_series_window=args.time_series_window,
+        )
+        # Never replace the full result a completed run saved next to its
+        # streams.
+        file_name = (request_stream_base_path(args.finalize_stream[0]) +
+                     ".finalized.json")
+        write_result(args, result_json, file_name)
+        print(f"Saved the finalized result to {file_name}")
+        return
+
+    trace = None
+    sessions = None
     if args.dataset is not None:
         warnings.warn(
             "The '--dataset' argument will be deprecated in the next "
@@ -482,17 +1728,23 @@ def main(args: argparse.Namespace):
             stacklevel=2)
         input_requests = sample_sharegpt_requests(
             dataset_path=args.dataset,
-            num_requests=args.num_prompts,
+            num_requests=num_prompts,
             tokenizer=tokenizer,
             fixed_output_len=args.sharegpt_output_len,
+            token_cache_dir=token_cache_dir,
+            tokenizer_workers=args.tokenizer_workers,
+            streaming=args.dataset_streaming,
         )
 
     elif args.dataset_name == "sharegpt":
         input_requests = sample_sharegpt_requests(
             dataset_path=args.dataset_path,
-            num_requests=args.num_prompts,
+            num_requests=num_prompts,
             tokenizer=tokenizer,
             fixed_output_len=args.sharegpt_output_len,
+            token_cache_dir=token_cache_dir,
+            tokenizer_workers=args.tokenizer_workers,
+            streaming=args.dataset_streaming,
         )
 
     elif args.dataset_name == "sonnet":
@@ -500,7 +1752,7 @@ def main(args: argparse.Namespace):
         if args.backend == "openai-chat":
             input_requests = sample_sonnet_requests(
                 dataset_path=args.dataset_path,
-                num_requests=args.num_prompts,
+                num_requests=num_prompts,
                 input_len=args.sonnet_input_len,
                 output_len=args.sonnet_output_len,
                 prefix_len=args.sonnet_prefix_len,
@@ -515,7 +1767,7 @@ def main(args: argparse.Namespace):
             ), "Tokenizer/model must have chat template for sonnet dataset."
             input_requests = sample_sonnet_requests(
                 dataset_path=args.dataset_path,
-                num_requests=args.num_prompts,
+                num_requests=num_prompts,
                 input_len=args.sonnet_input_len,
                 output_len=args.sonnet_output_len,
                 prefix_len=args.sonnet_prefix_len,
@@ -529,70 +1781,386 @@ def main(args: argparse.Namespace):
         input_requests = sample_random_requests(
             input_len=args.random_input_len,
             output_len=args.random_output_len,
-            num_prompts=args.num_prompts,
+            num_prompts=num_prompts,
             range_ratio=args.random_range_ratio,
             tokenizer=tokenizer,
         )
 
+    elif args.dataset_name == "request-set":
+        # Replay a previously exported workload as is, --num-prompts and
+        # the sampling options do not apply.
+        input_requests = load_request_set(args.dataset_path)
+        print(f"Loaded {len(input_requests)} requests from "
+              f"{args.dataset_path}")
+
+    elif args.dataset_name == "trace":
+        # The trace brings its own arrival times and is streamed from disk
+        # while it is replayed.
+        if (args.concurrency or args.request_rates or args.slo
+                or args.num_workers > 1):
+            raise ValueError(
+                "The trace dataset cannot be combined with --concurrency, "
+                "--request-rates, --slo or --num-workers.")
+        trace = RequestTrace(args.dataset_path, tokenizer, args.trace_speed)
+        input_requests = None
+
+    elif args.dataset_name == "sharegpt-multiturn":
+        # Every session replays one conversation and counts as one of
+        # --num-prompts.
+        if args.num_workers > 1 or args.export_request_set:
+            raise ValueError(
+                "The sharegpt-multiturn dataset cannot be combined with "
+                "--num-workers or --export-request-set.")
+        if backend != "openai-chat" and not tokenizer.chat_template:
+            raise ValueError("Tokenizer/model must have a chat template for "
+                             "the sharegpt-multiturn dataset.")
+        sessions = sample_sharegpt_sessions(
+            dataset_path=args.dataset_path,
+            num_sessions=num_prompts,
+            tokenizer=tokenizer,
+            fixed_output_len=args.sharegpt_output_len,
+            min_turns=args.multiturn_min_turns,
+            max_turns=args.multiturn_max_turns,
+            max_context_len=args.multiturn_max_context_len,
+            tokenizer_workers=args.tokenizer_workers,
+        )
+        input_requests = None
+        print(f"Sampled {len(sessions)} sessions with "
+              f"{sum(len(session) for session in sessions)} turns")
+
     else:
         raise ValueError(f"Unknown dataset: {args.dataset_name}")
 
-    benchmark_result = asyncio.run(
-        benchmark(
-            backend=backend,
-            api_url=api_url,
-            base_url=base_url,
-            model_id=model_id,
-            tokenizer=tokenizer,
-            input_requests=input_requests,
-            best_of=args.best_of,
-            use_beam_search=args.use_beam_search,
-            request_rate=args.request_rate,
-            disable_tqdm=args.disable_tqdm,
-            profile=args.profile,
-        ))
+    if args.export_request_set:
+        if trace is not None:
+            input_requests = [request for request, _ in trace]
+        save_request_set(
+            args.export_request_set, input_requests, {
+                "dataset_name": args.dataset_name,
+                "dataset_path": args.dataset_path or args.dataset,
+                "backend": backend,
+                "tokenizer_id": tokenizer_id,
+                "num_prompts": num_prompts,
+                "seed": args.seed,
+            })
+        print(f"Saved {len(input_requests)} requests to "
+              f"{args.export_request_set}")
+        return
+
+    selected_percentiles = [
+        float(p) for p in args.metric_percentiles.split(",")
+    ]
+    if args.concurrency and args.num_workers > min(args.concurrency):
+        raise ValueError("--num-workers must not exceed the --concurrency "
+                         "levels, every worker needs at least one user.")
+
+    if slos is not None:
+        selected_percentiles = sorted(
+            set(selected_percentiles) | set(slo_percentiles(slos)))
+
+    async def run_benchmarks() -> None:
+        # One warm connection pool is shared by all steps of a sweep or
+        # probes of an SLO search.
+        session = create_client_session(**get_session_kwargs(
+            args.max_connections, args.keepalive_timeout, args.dns_cache_ttl))
+        live_metrics = None
+        metrics_address = None
+        metrics_runner = None
+        if args.metrics_port is not None:
+            live_metrics = LiveMetrics()
+            metrics_address = (args.metrics_host, args.metrics_port)
+            metrics_runner = await start_metrics_server(
+                live_metrics, *metrics_address)
+            print(f"Serving live metrics at http://{args.metrics_host}:"
+                  f"{args.metrics_port}/metrics")
+
+        async def run_step(request_rate: float,
+                           concurrency: Optional[int],
+                           step_prompts: int,
+                           current_dt: Optional[str] = None) -> Dict[str, Any]:
+            # Every step draws its arrival schedule and think times from a
+            # fresh seed, like a standalone run at the same load, instead of
+            # continuing the random state of the steps before it.
+            np.random.seed(args.seed)
+            step_requests = (input_requests[:step_prompts]
+                             if input_requests is not None else None)
+            step_sessions = (sessions[:step_prompts]
+                             if sessions is not None else None)
+            stream_base_path = None
+            stream_header = None
+            if args.stream_results and current_dt is not None:
+                stream_base_path = os.path.splitext(
+                    result_file_name(args, backend, model_id, request_rate,
+                                     concurrency, args.trace_speed
+                                     if trace is not None else None,
+                                     current_dt, len(steps) > 1))[0]
+                if step_sessions is not None:
+                    num_requests = sum(map(len, step_sessions))
+                elif step_requests is not None:
+                    num_requests = len(step_requests)
+                else:
+                    num_requests = None
+                stream_header = {
+                    **result_config(args, backend, model_id, tokenizer_id,
+                                    request_rate, trace is not None,
+                                    current_dt),
+                    "concurrency": concurrency,
+                    "num_requests": num_requests,
+                }
+            return await benchmark(
+                backend=backend,
+                api_url=api_url,
+                base_url=base_url,
+                model_id=model_id,
+                tokenizer=tokenizer,
+                input_requests=step_requests,
+                best_of=args.best_of,
+                use_beam_search=args.use_beam_search,
+                request_rate=request_rate,
+                disable_tqdm=args.disable_tqdm,
+                profile=args.profile,
+                max_connections=args.max_connections,
+                keepalive_timeout=args.keepalive_timeout,
+                dns_cache_ttl=args.dns_cache_ttl,
+                num_workers=args.num_workers,
+                tokenizer_workers=args.tokenizer_workers,
+                sketch_accuracy=(args.sketch_relative_accuracy
+                                 if args.latency_sketch else None),
+                selected_percentiles=selected_percentiles,
+                concurrency=concurrency,
+                session=session,
+                goodput_config=goodput_config,
+                time_series_window=args.time_series_window,
+                trace=trace,
+                arrival_process=args.arrival_process,
+                arrival_params=get_arrival_params(args),
+                sessions=step_sessions,
+                think_time=args.multiturn_think_time,
+                max_loop_lag_ms=args.max_loop_lag_ms,
+                max_client_cpu_pct=args.max_client_cpu_pct,
+                stream_base_path=stream_base_path,
+                stream_header=stream_header,
+                live_metrics=live_metrics,
+                metrics_address=metrics_address,
+                server_metrics_url=server_metrics_url,
+                server_metrics_interval=args.server_metrics_interval,
+            )
 
-    # Save config and results to json
-    if args.save_result:
-        result_json: Dict[str, Any] = {}
+        try:
+            if slos is not None:
+                search_result = await search_max_request_rate(
+                    run_probe=lambda request_rate, duration: run_step(
+                        request_rate, None,
+                        math.ceil(request_rate * duration)),
+                    slos=slos,
+                    initial_rate=args.slo_initial_rate,
+                    max_rate=args.slo_max_rate,
+                    duration=args.slo_probe_duration,
+                    max_duration=args.slo_max_probe_duration,
+                    tolerance=args.slo_tolerance,
+                    max_probes=args.slo_max_probes,
+                    confidence=args.slo_confidence,
+                )
+                print_slo_search(search_result)
+                if args.save_result:
+                    save_slo_search(args, search_result, backend, model_id,
+                                    tokenizer_id)
+                return
+
+            results = []
+            for step, ((request_rate, concurrency), step_prompts) in enumerate(
+                    zip(steps, step_num_prompts)):
+                if step > 0 and args.sweep_cool_down > 0:
+                    print(f"Cooling down for {args.sweep_cool_down}s...")
+                    await asyncio.sleep(args.sweep_cool_down)
+                current_dt = datetime.now().strftime("%Y%m%d-%H%M%S")
+                benchmark_result = await run_step(request_rate, concurrency,
+                                                  step_prompts, current_dt)
+                results.append(benchmark_result)
+                # Save every step as it finishes so that an interrupted sweep
+                # keeps its completed steps.
+                if args.save_result:
+                    save_result(args,
+                                benchmark_result,
+                                backend,
+                                model_id,
+                                tokenizer_id,
+                                request_rate=request_rate,
+                                concurrency=concurrency,
+                                is_sweep=len(steps) > 1,
+                                current_dt=current_dt)
+            if len(steps) > 1:
+                print_sweep_summary(steps, results)
+        finally:
+            await session.close()
+            if metrics_runner is not None:
+                await metrics_runner.cleanup()
+
+    asyncio.run(run_benchmarks())
+
+
+def print_slo_search(search_result: Dict[str, Any]) -> None:
+    print("{s:{c}^{n}}".format(s=' SLO Search Result ', n=50, c='='))
+    for key, threshold in search_result["slos"].items():
+        print("{:<40} {:<10.2f}".format(f"SLO {key}:", threshold))
+    print("{:<40} {:<10}".format("Probes:", len(search_result["probes"])))
+    print("{:<40} {:<10.3f}".format("Max request rate (req/s):",
+                                    search_result["max_request_rate"]))
+    upper_bound = search_result["upper_bound"]
+    print("{:<40} {:<10}".format(
+        "Bounds (req/s):", f"[{search_result['lower_bound']:.3f}, " +
+        (f"{upper_bound:.3f}]" if upper_bound is not None else "not found]")))
+    print("=" * 50)
 
-        # Setup
-        current_dt = datetime.now().strftime("%Y%m%d-%H%M%S")
-        result_json["date"] = current_dt
-        result_json["backend"] = backend
-        result_json["model_id"] = model_id
-        result_json["tokenizer_id"] = tokenizer_id
-        result_json["best_of"] = args.best_of
-        result_json["use_beam_search"] = args.use_beam_search
-        result_json["num_prompts"] = args.num_prompts
-
-        # Metadata
-        if args.metadata:
-            for item in args.metadata:
-                if "=" in item:
-                    kvstring = item.split("=")
-                    result_json[kvstring[0].strip()] = kvstring[1].strip()
-                else:
-                    raise ValueError(
-                        "Invalid metadata format. Please use KEY=VALUE format."
-                    )
-
-        # Traffic
-        result_json["request_rate"] = (
-            args.request_rate if args.request_rate < float("inf") else "inf")
-
-        # Merge with benchmark result
-        result_json = {**result_json, **benchmark_result}
-
-        # Save to file
-        base_model_id = model_id.split("/")[-1]
-        file_name = f"{backend}-{args.request_rate}qps-{base_model_id}-{current_dt}.json"  #noqa
-        if args.result_filename:
-            file_name = args.result_filename
-        if args.result_dir:
-            file_name = os.path.join(args.result_dir, file_name)
+
+def save_slo_search(args: argparse.Namespace, search_result: Dict[str, Any],
+                    backend: str, model_id: str, tokenizer_id: str) -> None:
+    current_dt = datetime.now().strftime("%Y%m%d-%H%M%S")
+    result_json = {
+        "date": current_dt,
+        "backend": backend,
+        "model_id": model_id,
+        "tokenizer_id": tokenizer_id,
+        **search_result,
+    }
+    base_model_id = model_id.split("/")[-1]
+    file_name = f"{backend}-slo-search-{base_model_id}-{current_dt}.json"
+    if args.result_filename:
+        file_name = args.result_filename
+    if args.result_dir:
+        file_name = os.path.join(args.result_dir, file_name)
+    with open(file_name, "w") as outfile:
+        json.dump(result_json, outfile)
+
+
+def get_arrival_params(args: argparse.Namespace) -> Dict[str, Any]:
+    """Parameters of the selected --arrival-process."""
+    if args.arrival_process == "gamma":
+        if args.burstiness <= 0:
+            raise ValueError("--burstiness must be positive.")
+        return {"burstiness": args.burstiness}
+    if args.arrival_process == "on-off":
+        return {
+            "on_duration": args.on_duration,
+            "off_duration": args.off_duration,
+        }
+    if args.arrival_process == "ramp":
+        return {
+            "ramp_duration": args.ramp_duration,
+            "ramp_start_rate": args.ramp_start_rate,
+        }
+    if args.arrival_process == "step":
+        return {
+            "step_rates": args.step_rates,
+            "step_duration": args.step_duration,
+        }
+    return {}
+
+
+def result_config(args: argparse.Namespace, backend: str, model_id: str,
+                  tokenizer_id: str, request_rate: float, is_trace: bool,
+                  current_dt: str) -> Dict[str, Any]:
+    """Setup, metadata and traffic fields of a result."""
+    result_json: Dict[str, Any] = {}
+
+    # Setup
+    result_json["date"] = current_dt
+    result_json["backend"] = backend
+    result_json["model_id"] = model_id
+    result_json["tokenizer_id"] = tokenizer_id
+    result_json["best_of"] = args.best_of
+    result_json["use_beam_search"] = args.use_beam_search
+
+    # Metadata
+    if args.metadata:
+        for item in args.metadata:
+            if "=" in item:
+                kvstring = item.split("=")
+                result_json[kvstring[0].strip()] = kvstring[1].strip()
+            else:
+                raise ValueError(
+                    "Invalid metadata format. Please use KEY=VALUE format.")
+
+    # Traffic
+    if is_trace:
+        result_json["request_rate"] = "trace"
+    else:
+        result_json["request_rate"] = (request_rate if
+                                       request_rate < float("inf") else "inf")
+    return result_json
+
+
+def result_file_name(args: argparse.Namespace,
+                     backend: str,
+                     model_id: str,
+                     request_rate: float,
+                     concurrency: Optional[int],
+                     trace_speed: Optional[float],
+                     current_dt: str,
+                     is_sweep: bool = False) -> str:
+    """Path of the result JSON of a run. The default file name names the load
+    of the run, e.g. `vllm-5.0qps-...` or `vllm-32users-...` for closed-loop
+    runs."""
+    base_model_id = model_id.split("/")[-1]
+    if trace_speed is not None:
+        traffic_label = f"trace{trace_speed}x"
+    elif concurrency is not None:
+        traffic_label = f"{concurrency}users"
+    else:
+        traffic_label = f"{request_rate}qps"
+    file_name = f"{backend}-{traffic_label}-{base_model_id}-{current_dt}.json"
+    if args.result_filename:
+        file_name = args.result_filename
+        if is_sweep:
+            # Keep one file per step of the sweep.
+            root, ext = os.path.splitext(file_name)
+            file_name = f"{root}-{traffic_label}{ext}"
+
+    if args.result_dir:
+        file_name = os.path.join(args.result_dir, file_name)
+    return file_name
+
+
+def write_result(args: argparse.Namespace, result_json: Dict[str, Any],
+                 file_name: str) -> None:
+    """Write a result to json, or to a columnar result with
+    --result-format."""
+    if args.result_format == "json":
         with open(file_name, "w") as outfile:
             json.dump(result_json, outfile)
+    else:
+        save_columnar_result(result_json,
+                             os.path.splitext(file_name)[0],
+                             result_format=args.result_format,
+                             save_text=args.save_generated_text)
+
+
+def save_result(args: argparse.Namespace,
+                benchmark_result: Dict[str, Any],
+                backend: str,
+                model_id: str,
+                tokenizer_id: str,
+                request_rate: float,
+                concurrency: Optional[int],
+                is_sweep: bool = False,
+                current_dt: Optional[str] = None) -> None:
+    """Save config and results, see `result_file_name` for the file name."""
+    if current_dt is None:
+        current_dt = datetime.now().strftime("%Y%m%d-%H%M%S")
+    result_json = result_config(args, backend, model_id, tokenizer_id,
+                                request_rate, "trace_path" in benchmark_result,
+                                current_dt)
+    result_json["num_prompts"] = len(benchmark_result["input_lens"])
+
+    # Merge with benchmark result
+    result_json = {**result_json, **benchmark_result}
+
+    # Save to file
+    file_name = result_file_name(args, backend, model_id, request_rate,
+                                 concurrency,
+                                 benchmark_result.get("trace_speed"),
+                                 current_dt, is_sweep)
+    write_result(args, result_json, file_name)
 
 
 if __name__ == "__main__":
@@ -629,8 +2197,25 @@ if __name__ == "__main__":
         "--dataset-name",
         type=str,
         default="sharegpt",
-        choices=["sharegpt", "sonnet", "random"],
-        help="Name of the dataset to benchmark on.",
+        choices=[
+            "sharegpt", "sharegpt-multiturn", "sonnet", "random",
+            "request-set", "trace"
+        ],
+        help="Name of the dataset to benchmark on. 'request-set' replays a "
+        "file written by --export-request-set. 'trace' replays a JSON lines "
+        "file of {timestamp, prompt or prompt_len, output_len} records with "
+        "their original arrival times, see --trace-speed. "
+        "'sharegpt-multiturn' runs --num-prompts multi-turn chat sessions "
+        "from a ShareGPT file, each sending its next turn with the full "
+        "history once the previous reply arrived; --request-rate and "
+        "--concurrency then apply to the sessions.",
+    )
+    parser.add_argument(
+        "--trace-speed",
+        type=float,
+        default=1.0,
+        help="Replay the trace dataset this many times faster than it was "
+        "recorded, e.g. 60 to replay an hour of traffic in a minute.",
     )
     parser.add_argument("--dataset-path",
                         type=str,
@@ -662,12 +2247,71 @@ if __name__ == "__main__":
         default=1000,
         help="Number of prompts to process.",
     )
+    parser.add_argument(
+        "--export-request-set",
+        type=str,
+        default=None,
+        help="Write the sampled requests to this request set file and exit "
+        "without running the benchmark. Replay it on any machine with "
+        "--dataset-name request-set --dataset-path <file>.",
+    )
+    parser.add_argument(
+        "--dataset-streaming",
+        action="store_true",
+        help="Stream the ShareGPT dataset from disk and reservoir-sample the "
+        "requests instead of loading the whole file into memory. Samples "
+        "are deterministic under --seed but differ from the default "
+        "shuffle.",
+    )
+    parser.add_argument(
+        "--token-cache-dir",
+        type=str,
+        default=DEFAULT_TOKEN_CACHE_DIR,
+        help="Directory for the cache of dataset token lengths, keyed by "
+        "dataset file hash and tokenizer.",
+    )
+    parser.add_argument(
+        "--disable-token-cache",
+        action="store_true",
+        help="Always re-tokenize the dataset instead of using the token "
+        "length cache.",
+    )
     parser.add_argument(
         "--sharegpt-output-len",
         type=int,
         default=None,
         help="Output length for each request. Overrides the output length "
         "from the ShareGPT dataset.")
+    parser.add_argument(
+        "--multiturn-min-turns",
+        type=int,
+        default=2,
+        help="Minimum number of turns of a session, used only for the "
+        "sharegpt-multiturn dataset.",
+    )
+    parser.add_argument(
+        "--multiturn-max-turns",
+        type=int,
+        default=None,
+        help="Maximum number of turns of a session, used only for the "
+        "sharegpt-multiturn dataset.",
+    )
+    parser.add_argument(
+        "--multiturn-max-context-len",
+        type=int,
+        default=4096,
+        help="Sessions are cut before the turn that would make the "
+        "conversation longer than this many tokens, used only for the "
+        "sharegpt-multiturn dataset.",
+    )
+    parser.add_argument(
+        "--multiturn-think-time",
+        type=float,
+        default=1.0,
+        help="Mean of the exponentially distributed seconds a user waits "
+        "between receiving a reply and sending the next turn, used only for "
+        "the sharegpt-multiturn dataset.",
+    )
     parser.add_argument(
         "--sonnet-input-len",
         type=int,
@@ -717,7 +2361,223 @@ if __name__ == "__main__":
         help="Number of requests per second. If this is inf, "
         "then all the requests are sent at time 0. "
         "Otherwise, we use Poisson process to synthesize "
-        "the request arrival times.",
+        "the request arrival times. The arrival schedule is computed "
+        "up front and requests are sent against absolute deadlines.",
+    )
+    parser.add_argument(
+        "--max-loop-lag-ms",
+        type=float,
+        default=5.0,
+        help="Warn and mark the result as client_limited if the P99 lag of "
+        "the client's event loop exceeds this many milliseconds.",
+    )
+    parser.add_argument(
+        "--max-client-cpu-pct",
+        type=float,
+        default=80.0,
+        help="Warn and mark the result as client_limited if the CPU "
+        "utilization of a load generator process exceeds this percentage.",
+    )
+    parser.add_argument(
+        "--arrival-process",
+        type=str,
+        default="poisson",
+        choices=list(ARRIVAL_PROCESSES),
+        help="Process that generates the request arrival times at "
+        "--request-rate. 'gamma' draws intervals with a --burstiness, "
+        "'on-off' alternates --on-duration bursts with --off-duration "
+        "pauses, 'ramp' raises the rate from --ramp-start-rate over "
+        "--ramp-duration and 'step' runs each of --step-rates for "
+        "--step-duration. The process and its parameters are saved in the "
+        "result as arrival_* fields.",
+    )
+    parser.add_argument(
+        "--burstiness",
+        type=float,
+        default=1.0,
+        help="Squared coefficient of variation of the gamma arrival "
+        "intervals. 1 is Poisson, larger values are burstier.",
+    )
+    parser.add_argument("--on-duration",
+                        type=float,
+                        default=10.0,
+                        help="Seconds of each on-off burst.")
+    parser.add_argument("--off-duration",
+                        type=float,
+                        default=10.0,
+                        help="Seconds of each on-off pause.")
+    parser.add_argument("--ramp-duration",
+                        type=float,
+                        default=60.0,
+                        help="Seconds until the ramp reaches --request-rate.")
+    parser.add_argument("--ramp-start-rate",
+                        type=float,
+                        default=0.1,
+                        help="Request rate at the start of the ramp.")
+    parser.add_argument("--step-rates",
+                        type=float,
+                        nargs="+",
+                        default=[1.0],
+                        help="Request rates of the steps of the step process.")
+    parser.add_argument("--step-duration",
+                        type=float,
+                        default=60.0,
+                        help="Seconds of each step of the step process.")
+    parser.add_argument(
+        "--request-rates",
+        type=float,
+        nargs="+",
+        default=None,
+        help="Sweep over several request rates in one process, reusing the "
+        "tokenizer, the sampled requests and the connection pool. Each rate "
+        "is saved to its own {backend}-{rate}qps-... result file. Overrides "
+        "--request-rate.",
+    )
+    parser.add_argument(
+        "--sweep-duration",
+        type=float,
+        default=None,
+        help="Run each request rate for about this many seconds, i.e. send "
+        "duration * rate requests per step instead of --num-prompts.",
+    )
+    parser.add_argument(
+        "--sweep-cool-down",
+        type=float,
+        default=0.0,
+        help="Seconds to wait between the steps of a sweep, so that the "
+        "server drains before the next load level.",
+    )
+    parser.add_argument(
+        "--goodput",
+        metavar="NAME:MS",
+        nargs="+",
+        default=None,
+        help="Per-request SLOs for goodput, e.g. --goodput ttft:500 tpot:50 "
+        "e2el:2000, with NAME one of ttft, tpot or e2el (end-to-end "
+        "latency) in ms. Reports the requests and output tokens per second "
+        "of requests that met all of them, and the percentage of requests "
+        "that did.",
+    )
+    parser.add_argument(
+        "--slo",
+        metavar="KEY:THRESHOLD",
+        nargs="+",
+        default=None,
+        help="Search for the highest request rate that meets these latency "
+        "SLOs instead of running at fixed rates, e.g. "
+        "--slo p99_ttft_ms:500 median_tpot_ms:50. Keys are "
+        "mean/median/p<N> of ttft, tpot or itl in ms. With --save-result "
+        "the search is saved to {backend}-slo-search-... . Cannot be "
+        "combined with --concurrency, --request-rates or --sweep-duration.",
+    )
+    parser.add_argument("--slo-initial-rate",
+                        type=float,
+                        default=1.0,
+                        help="Request rate of the first SLO search probe.")
+    parser.add_argument("--slo-max-rate",
+                        type=float,
+                        default=64.0,
+                        help="Highest request rate the SLO search tries.")
+    parser.add_argument("--slo-probe-duration",
+                        type=float,
+                        default=20.0,
+                        help="Duration of one SLO search probe in seconds.")
+    parser.add_argument(
+        "--slo-max-probe-duration",
+        type=float,
+        default=80.0,
+        help="Probes whose SLO metrics are too close to the thresholds to "
+        "decide are repeated with twice the duration up to this limit.")
+    parser.add_argument(
+        "--slo-tolerance",
+        type=float,
+        default=0.05,
+        help="Stop the SLO search once the bracket around the maximum rate "
+        "is narrower than this fraction of its lower end.")
+    parser.add_argument("--slo-max-probes",
+                        type=int,
+                        default=12,
+                        help="Maximum number of SLO search probes.")
+    parser.add_argument(
+        "--slo-confidence",
+        type=float,
+        default=0.95,
+        help="Confidence level of the intervals used to judge the probes.")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        nargs="+",
+        default=None,
+        help="Run in closed-loop mode instead of following --request-rate: "
+        "each of N virtual users sends its next request as soon as its "
+        "previous one finished. Several values run one benchmark per "
+        "concurrency level, saved to {backend}-{N}users-... files, and "
+        "print throughput and latency by concurrency.",
+    )
+    parser.add_argument(
+        "--max-connections",
+        type=int,
+        default=0,
+        help="Maximum number of pooled connections shared by all requests. "
+        "0 means no limit, so every in-flight request gets its own "
+        "keep-alive connection.",
+    )
+    parser.add_argument(
+        "--keepalive-timeout",
+        type=float,
+        default=60.0,
+        help="Seconds an idle pooled connection is kept open for reuse.",
+    )
+    parser.add_argument(
+        "--dns-cache-ttl",
+        type=int,
+        default=300,
+        help="Seconds a resolved server address is cached by the client.",
+    )
+    parser.add_argument(
+        "--num-workers",
+        type=int,
+        default=1,
+        help="Number of client processes to shard the requests across. "
+        "Each worker runs its own event loop and connection pool against a "
+        "shared start time, for request rates that a single event loop "
+        "cannot sustain.",
+    )
+    parser.add_argument(
+        "--tokenizer-workers",
+        type=int,
+        default=1,
+        help="Number of processes used to tokenize the dataset and the "
+        "generated texts. Tokenization is always batched; extra workers "
+        "mainly help with large runs and slow tokenizers.",
+    )
+    parser.add_argument(
+        "--metric-percentiles",
+        type=str,
+        default="99",
+        help="Comma-separated list of percentiles to report for TTFT, TPOT "
+        "and ITL, e.g. \"50,90,95,99,99.9\".",
+    )
+    parser.add_argument(
+        "--latency-sketch",
+        action="store_true",
+        help="Summarize TTFT and ITL with a mergeable quantile sketch that "
+        "is updated as requests finish, instead of keeping every raw "
+        "inter-token latency. Bounds client memory on long runs; per-request "
+        "ITLs are then not saved.",
+    )
+    parser.add_argument(
+        "--time-series-window",
+        type=float,
+        default=1.0,
+        help="Width in seconds of the windows of the throughput and latency "
+        "time series saved with the results.",
+    )
+    parser.add_argument(
+        "--sketch-relative-accuracy",
+        type=float,
+        default=0.01,
+        help="Relative accuracy of the percentiles from --latency-sketch.",
     )
     parser.add_argument("--seed", type=int, default=0)
     parser.add_argument(
@@ -741,6 +2601,57 @@ if __name__ == "__main__":
         action="store_true",
         help="Specify to save benchmark results to a json file",
     )
+    parser.add_argument(
+        "--server-metrics-url",
+        type=str,
+        default=None,
+        help="Prometheus metrics endpoint of the server, scraped during the "
+        "run for running and waiting requests, KV cache usage and "
+        "preemptions. Defaults to /metrics of the server.",
+    )
+    parser.add_argument(
+        "--server-metrics-interval",
+        type=float,
+        default=0.5,
+        help="Seconds between scrapes of the server metrics. The samples "
+        "are saved with the result and used to attribute the P99 E2E "
+        "latency to queueing, KV cache exhaustion or preemption. 0 disables "
+        "scraping.",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=None,
+        help="Serve live Prometheus metrics of the client, such as requests "
+        "in flight, completed and failed requests, token counts and TTFT "
+        "and ITL histograms, at http://<metrics host>:<port>/metrics. With "
+        "--num-workers, worker i serves its own requests on port + 1 + i.",
+    )
+    parser.add_argument(
+        "--metrics-host",
+        type=str,
+        default="0.0.0.0",
+        help="Address of the live metrics endpoint, see --metrics-port.",
+    )
+    parser.add_argument(
+        "--stream-results",
+        action="store_true",
+        help="Append every finished request to "
+        "<result name>.requests.jsonl as soon as it completes, one file per "
+        "worker with --num-workers. If the run is interrupted, compute its "
+        "result from the streamed requests with --finalize-stream.",
+    )
+    parser.add_argument(
+        "--finalize-stream",
+        type=str,
+        nargs="+",
+        default=None,
+        metavar="STREAM",
+        help="Compute and save the result of a run from its request "
+        "streams written by --stream-results, e.g. after it was "
+        "interrupted, instead of running a benchmark. The result is saved "
+        "next to the stream as <result name>.finalized.json.",
+    )
     parser.add_argument(
         "--metadata",
         metavar="KEY=VALUE",
@@ -765,6 +2676,21 @@ if __name__ == "__main__":
         "{backend}-{args.request_rate}qps-{base_model_id}-{current_dt}.json"
         " format.",
     )
+    parser.add_argument(
+        "--result-format",
+        type=str,
+        default="json",
+        choices=RESULT_FORMATS,
+        help="Format of the saved results. 'npz' and 'parquet' save a small "
+        "JSON summary plus the per-request data in a columnar file next to "
+        "it. 'parquet' requires pyarrow.",
+    )
+    parser.add_argument(
+        "--save-generated-text",
+        action="store_true",
+        help="With a columnar --result-format, also save the generated texts "
+        "to a <result>.text.jsonl file.",
+    )
 
     args = parser.parse_args()
     main(args)
@@ -6,6 +6,8 @@ import time
 from typing import List, Optional, Tuple
 
 import torch
+from benchmark_dataset import (DEFAULT_TOKEN_CACHE_DIR, load_request_set,
+                               sample_sharegpt, save_request_set)
 from tqdm import tqdm
 from transformers import (AutoModelForCausalLM, AutoTokenizer,
                           PreTrainedTokenizerBase)
@@ -20,45 +22,17 @@ def sample_requests(
     num_requests: int,
     tokenizer: PreTrainedTokenizerBase,
     fixed_output_len: Optional[int],
+    token_cache_dir: Optional[str] = DEFAULT_TOKEN_CACHE_DIR,
+    streaming: bool = False,
 ) -> List[Tuple[str, int, int]]:
-    if fixed_output_len is not None and fixed_output_len < 4:
-        raise ValueError("output_len too small")
-
-    # Load the dataset.
-    with open(dataset_path) as f:
-        dataset = json.load(f)
-    # Filter out the conversations with less than 2 turns.
-    dataset = [data for data in dataset if len(data["conversations"]) >= 2]
-    # Only keep the first two turns of each conversation.
-    dataset = [(data["conversations"][0]["value"],
-                data["conversations"][1]["value"]) for data in dataset]
-
-    # Shuffle the dataset.
-    random.shuffle(dataset)
-
-    # Filter out sequences that are too long or too short
-    filtered_dataset: List[Tuple[str, int, int]] = []
-    for i in range(len(dataset)):
-        if len(filtered_dataset) == num_requests:
-            break
-
-        # Tokenize the prompts and completions.
-        prompt = dataset[i][0]
-        prompt_token_ids = tokenizer(prompt).input_ids
-        completion = dataset[i][1]
-        completion_token_ids = tokenizer(completion).input_ids
-        prompt_len = len(prompt_token_ids)
-        output_len = len(completion_token_ids
-                         ) if fixed_output_len is None else fixed_output_len
-        if prompt_len < 4 or output_len < 4:
-            # Prune too short sequences.
-            continue
-        if prompt_len > 1024 or prompt_len + output_len > 2048:
-            # Prune too long sequences.
-            continue
-        filtered_dataset.append((prompt, prompt_len, output_len))
-
-    return filtered_dataset
+    return sample_sharegpt(
+        dataset_path=dataset_path,
+        num_requests=num_requests,
+        tokenizer=tokenizer,
+        fixed_output_len=fixed_output_len,
+        token_cache_dir=token_cache_dir,
+        streaming=streaming,
+    )
 
 
 def run_vllm(
@@ -220,14 +194,29 @@ def main(args: argparse.Namespace):
     # Sample the requests.
     tokenizer = AutoTokenizer.from_pretrained(
         args.tokenizer, trust_remote_code=args.trust_remote_code)
-    if args.dataset is None:
+    if args.request_set is not None:
+        requests = load_request_set(args.request_set)
+    elif args.dataset is None:
         # Synthesize a prompt with the given input length.
         prompt = "hi" * (args.input_len - 1)
         requests = [(prompt, args.input_len, args.output_len)
                     for _ in range(args.num_prompts)]
     else:
+        token_cache_dir = (None if args.disable_token_cache else
+                           args.token_cache_dir)
         requests = sample_requests(args.dataset, args.num_prompts, tokenizer,
-                                   args.output_len)
+                                   args.output_len, token_cache_dir,
+                                   args.dataset_streaming)
+    if args.export_request_set is not None:
+        save_request_set(
+            args.export_request_set, requests, {
+                "dataset_path": args.dataset,
+                "tokenizer_id": args.tokenizer,
+                "num_prompts": args.num_prompts,
+                "seed": args.seed,
+            })
+        print(f"Saved {len(requests)} requests to {args.export_request_set}")
+        return
 
     if args.backend == "vllm":
         elapsed_time = run_vllm(
@@ -279,6 +268,30 @@ if __name__ == "__main__":
                         type=str,
                         default=None,
                         help="Path to the dataset.")
+    parser.add_argument("--request-set",
+                        type=str,
+                        default=None,
+                        help="Path to a request set file written by "
+                        "--export-request-set, replayed as is.")
+    parser.add_argument("--export-request-set",
+                        type=str,
+                        default=None,
+                        help="Write the sampled requests to this request set "
+                        "file and exit without running the benchmark.")
+    parser.add_argument("--dataset-streaming",
+                        action="store_true",
+                        help="Stream the dataset from disk and "
+                        "reservoir-sample the requests instead of loading "
+                        "the whole file into memory.")
+    parser.add_argument("--token-cache-dir",
+                        type=str,
+                        default=DEFAULT_TOKEN_CACHE_DIR,
+                        help="Directory for the cache of dataset token "
+                        "lengths, keyed by dataset file hash and tokenizer.")
+    parser.add_argument("--disable-token-cache",
+                        action="store_true",
+                        help="Always re-tokenize the dataset instead of "
+                        "using the token length cache.")
     parser.add_argument("--input-len",
                         type=int,
                         default=None,
@@ -429,7 +442,10 @@ if __name__ == "__main__":
     args = parser.parse_args()
     if args.tokenizer is None:
         args.tokenizer = args.model
-    if args.dataset is None:
+    if args.request_set is not None:
+        assert args.dataset is None
+        assert args.input_len is None
+    elif args.dataset is None:
         assert args.input_len is not None
         assert args.output_len is not None
     else:
@@ -0,0 +1,102 @@
+"""Client overhead instrumentation for benchmark_serving.
+
+A saturated client shows up as higher TTFT and ITL although the server is
+not to blame: timestamps are only taken once the event loop gets around to
+a response. `ClientMonitor` measures how late the event loop wakes up from
+short sleeps and how busy the client process is, and `client_overhead_stats`
+combines that with the time every request spent parsing its response.
+"""
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+class ClientMonitor:
+    """Samples event loop lag and CPU time of the current process.
+
+    Every `interval` seconds a task sleeps and records how much later than
+    requested it woke up. The lag is the time other callbacks held the loop.
+    """
+
+    def __init__(self, interval: float = 0.01) -> None:
+        self.interval = interval
+        self.lags: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+        self._start_wall_time = 0.0
+        self._start_cpu_time = 0.0
+        self._samples: Optional[Dict[str, Any]] = None
+
+    def start(self) -> None:
+        """Start sampling, from within the running event loop."""
+        self._start_wall_time = time.perf_counter()
+        self._start_cpu_time = time.process_time()
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(time.perf_counter() - expected, 0.0))
+
+    async def stop(self) -> Dict[str, Any]:
+        """Stop sampling and return the samples, which can be sent between
+        processes and are combined by `client_overhead_stats`."""
+        if self._samples is None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._samples = {
+                "lags": np.asarray(self.lags, dtype=np.float64),
+                "wall_time": time.perf_counter() - self._start_wall_time,
+                "cpu_time": time.process_time() - self._start_cpu_time,
+            }
+        return self._samples
+
+
+def client_overhead_stats(monitor_samples: Sequence[Dict[str, Any]],
+                          parse_times: Sequence[float],
+                          duration: float) -> Dict[str, Any]:
+    """Summarize the samples of one or more load generator processes.
+
+    The CPU utilization is that of the busiest process, since a single event
+    loop is limited by one core. The parse time share is the fraction of the
+    processes' time spent handling response streams.
+    """
+    lags = np.concatenate([samples["lags"] for samples in monitor_samples])
+    if len(lags) == 0:
+        lags = np.zeros(1)
+    lags_ms = lags * 1000
+    cpu_pct = max(samples["cpu_time"] / max(samples["wall_time"], 1e-9) * 100
+                  for samples in monitor_samples)
+    parse_times = np.asarray(parse_times, dtype=np.float64)
+    total_parse_time = float(parse_times.sum())
+    return {
+        "client_cpu_pct": float(cpu_pct),
+        "loop_lag_mean_ms": float(np.mean(lags_ms)),
+        "loop_lag_p99_ms": float(np.percentile(lags_ms, 99)),
+        "loop_lag_max_ms": float(np.max(lags_ms)),
+        "parse_time_mean_ms":
+        (total_parse_time / len(parse_times) * 1000 if len(parse_times) else
+         0.0),
+        "parse_time_pct":
+        total_parse_time / max(duration * len(monitor_samples), 1e-9) * 100,
+    }
+
+
+def client_overhead_warnings(stats: Dict[str, Any], max_loop_lag_ms: float,
+                             max_cpu_pct: float) -> List[str]:
+    """Reasons why the client may have limited the measured latencies."""
+    warnings = []
+    if stats["loop_lag_p99_ms"] > max_loop_lag_ms:
+        warnings.append(
+            f"P99 event loop lag of {stats['loop_lag_p99_ms']:.2f} ms "
+            f"exceeds {max_loop_lag_ms:g} ms")
+    if stats["client_cpu_pct"] > max_cpu_pct:
+        warnings.append(
+            f"client CPU utilization of {stats['client_cpu_pct']:.1f}% "
+            f"exceeds {max_cpu_pct:g}%")
+    return warnings
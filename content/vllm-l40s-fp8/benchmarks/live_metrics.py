@@ -0,0 +1,175 @@
+"""Live Prometheus metrics of a running benchmark_serving client.
+
+`LiveMetrics` counts the requests of a run as they are sent and finished
+and `start_metrics_server` serves them in the Prometheus text exposition
+format, e.g. for
+    scrape_configs:
+      - job_name: 'benchmark_client'
+        scrape_interval: 1s
+        static_configs:
+          - targets: ['<client host>:9091']
+Counters keep counting across the steps of a sweep, like those of any other
+long-running process.
+"""
+import bisect
+import math
+from typing import Awaitable, Callable, List, Optional, Sequence
+
+from aiohttp import web
+from backend_request_func import RequestFuncInput, RequestFuncOutput
+
+TTFT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0,
+                20.0, 40.0, 80.0)
+ITL_BUCKETS = (0.001, 0.005, 0.01, 0.02, 0.03, 0.04, 0.05, 0.075, 0.1, 0.25,
+               0.5, 1.0, 2.5)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class Histogram:
+    """Cumulative Prometheus histogram with fixed bucket bounds."""
+
+    def __init__(self, name: str, help_text: str,
+                 buckets: Sequence[float]) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} histogram",
+        ]
+        cumulative = 0
+        for bound, count in zip(self.buckets + [math.inf], self.counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{_format_value(bound)}"}} '
+                         f"{cumulative}")
+        lines.append(f"{self.name}_sum {_format_value(self.sum)}")
+        lines.append(f"{self.name}_count {cumulative}")
+        return lines
+
+
+class LiveMetrics:
+    """Counters, gauges and latency histograms of the requests of a run."""
+
+    def __init__(self) -> None:
+        self.requests_sent = 0
+        self.requests_completed = 0
+        self.requests_failed = 0
+        self.in_flight = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        # Only known to the process that drives the run, see `set_load`.
+        self.request_rate: Optional[float] = None
+        self.concurrency: Optional[int] = None
+        self.ttft = Histogram("benchmark_time_to_first_token_seconds",
+                              "Time to first token of completed requests.",
+                              TTFT_BUCKETS)
+        self.itl = Histogram("benchmark_inter_token_latency_seconds",
+                             "Inter-token latency of completed requests.",
+                             ITL_BUCKETS)
+
+    def set_load(self, request_rate: float,
+                 concurrency: Optional[int]) -> None:
+        """Offered load of the current run or sweep step."""
+        self.request_rate = request_rate
+        self.concurrency = concurrency
+
+    def observe(self, output: RequestFuncOutput) -> None:
+        if not output.success:
+            self.requests_failed += 1
+            return
+        self.requests_completed += 1
+        self.input_tokens += output.prompt_len
+        if output.output_tokens is not None:
+            self.output_tokens += output.output_tokens
+        else:
+            # One token per streamed chunk, the first one ends the TTFT.
+            self.output_tokens += len(output.itl) + 1
+        self.ttft.observe(output.ttft)
+        for itl in output.itl:
+            self.itl.observe(itl)
+
+    def instrument(
+        self, request_func: Callable[..., Awaitable[RequestFuncOutput]]
+    ) -> Callable[..., Awaitable[RequestFuncOutput]]:
+        """Wrap a request function to count its requests."""
+
+        async def instrumented(request_func_input: RequestFuncInput,
+                               **kwargs) -> RequestFuncOutput:
+            self.requests_sent += 1
+            self.in_flight += 1
+            try:
+                output = await request_func(
+                    request_func_input=request_func_input, **kwargs)
+            finally:
+                self.in_flight -= 1
+            self.observe(output)
+            return output
+
+        return instrumented
+
+    def render(self) -> str:
+        lines: List[str] = []
+
+        def add(name: str, metric_type: str, help_text: str,
+                value: float) -> None:
+            lines.extend([
+                f"# HELP {name} {help_text}",
+                f"# TYPE {name} {metric_type}",
+                f"{name} {_format_value(value)}",
+            ])
+
+        add("benchmark_requests_sent_total", "counter",
+            "Requests sent to the server.", self.requests_sent)
+        add("benchmark_requests_completed_total", "counter",
+            "Requests that completed successfully.", self.requests_completed)
+        add("benchmark_requests_failed_total", "counter",
+            "Requests that failed.", self.requests_failed)
+        add("benchmark_requests_in_flight", "gauge",
+            "Requests sent and not yet finished.", self.in_flight)
+        add("benchmark_input_tokens_total", "counter",
+            "Prompt tokens of completed requests.", self.input_tokens)
+        add("benchmark_output_tokens_total", "counter",
+            "Output tokens of completed requests as reported by the server, "
+            "or else counted as streamed chunks.", self.output_tokens)
+        if self.request_rate is not None:
+            add("benchmark_target_request_rate", "gauge",
+                "Request rate of the current run, +Inf for closed-loop runs.",
+                self.request_rate)
+            add("benchmark_concurrency", "gauge",
+                "Closed-loop users of the current run, 0 for open-loop runs.",
+                self.concurrency or 0)
+        lines.extend(self.ttft.render())
+        lines.extend(self.itl.render())
+        return "\n".join(lines) + "\n"
+
+
+async def start_metrics_server(metrics: LiveMetrics, host: str,
+                               port: int) -> web.AppRunner:
+    """Serve `metrics` at http://<host>:<port>/metrics from the running event
+    loop. Stop it with `await runner.cleanup()`."""
+
+    async def handle_metrics(request: web.Request) -> web.Response:
+        return web.Response(text=metrics.render(),
+                            headers={"Content-Type": CONTENT_TYPE})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
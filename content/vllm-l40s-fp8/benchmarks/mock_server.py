@@ -0,0 +1,345 @@
+"""Mock inference server for running the serving benchmarks without a GPU.
+
+Speaks the wire formats of every backend in `ASYNC_REQUEST_FUNCS`:
+    OpenAI completions      POST /v1/completions
+    OpenAI chat completions POST /v1/chat/completions
+    TGI                     POST /generate_stream
+    TensorRT-LLM            POST /v2/models/<model>/generate_stream
+    DeepSpeed-MII           POST /mii/<deployment>
+    vLLM scheduler metrics  GET  /metrics
+
+Every request waits for one of --max-concurrency slots, then spends a
+prefill time proportional to its prompt length and streams its tokens with
+a per-token decode time that grows with the number of running requests.
+The generated text is a repeated filler word, and tokens are approximated
+from the prompt length in characters.
+
+Run:
+    python benchmarks/mock_server.py --port 8000 \
+        --prefill-ms-per-token 0.1 \
+        --decode-ms-per-token 20 \
+        --batch-slowdown 0.01 \
+        --max-concurrency 256
+
+and point benchmark_serving.py at it with the usual --backend, --port and
+--endpoint options. With --decode-ms-per-token 0 the server answers as
+fast as it can, which measures the ceiling of the client itself.
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, List
+
+from aiohttp import web
+
+FILLER_WORD = " hello"
+
+
+class MockEngine:
+    """Simulated token timing shared by all endpoints."""
+
+    def __init__(
+        self,
+        prefill_ms_per_token: float,
+        prefill_base_ms: float,
+        decode_ms_per_token: float,
+        batch_slowdown: float,
+        max_concurrency: int,
+        chars_per_token: float,
+    ) -> None:
+        self.prefill_ms_per_token = prefill_ms_per_token
+        self.prefill_base_ms = prefill_base_ms
+        self.decode_ms_per_token = decode_ms_per_token
+        self.batch_slowdown = batch_slowdown
+        self.chars_per_token = chars_per_token
+        self.max_concurrency = max_concurrency
+        self.slots = asyncio.Semaphore(max_concurrency)
+        self.num_running = 0
+        self.num_waiting = 0
+
+    def count_tokens(self, text: str) -> int:
+        return max(1, round(len(text) / self.chars_per_token))
+
+    def decode_step_s(self) -> float:
+        # Every request in the batch beyond the first slows down the step.
+        slowdown = 1 + self.batch_slowdown * max(self.num_running - 1, 0)
+        return self.decode_ms_per_token * slowdown / 1000
+
+    async def generate(self, prompt_len: int,
+                       max_tokens: int) -> AsyncIterator[str]:
+        """Yield `max_tokens` tokens on the simulated schedule."""
+        self.num_waiting += 1
+        async with self.slots:
+            self.num_waiting -= 1
+            self.num_running += 1
+            try:
+                await asyncio.sleep(
+                    (self.prefill_base_ms +
+                     self.prefill_ms_per_token * prompt_len) / 1000)
+                for i in range(max_tokens):
+                    if i > 0:
+                        await asyncio.sleep(self.decode_step_s())
+                    yield FILLER_WORD
+            finally:
+                self.num_running -= 1
+
+
+async def _start_sse(request: web.Request) -> web.StreamResponse:
+    response = web.StreamResponse(
+        headers={
+            "Content-Type": "text/event-stream",
+            "Cache-Control": "no-cache",
+        })
+    await response.prepare(request)
+    return response
+
+
+async def _send_event(response: web.StreamResponse, data: Any) -> None:
+    payload = data if isinstance(data, str) else json.dumps(data)
+    await response.write(f"data: {payload}\n\n".encode("utf-8"))
+
+
+def _chat_prompt(messages: List[Dict[str, Any]]) -> str:
+    return "\n".join(str(message.get("content") or "") for message in messages)
+
+
+async def openai_completions(request: web.Request) -> web.StreamResponse:
+    engine: MockEngine = request.app["engine"]
+    body = await request.json()
+    chat = request.path.endswith("chat/completions")
+    prompt = (_chat_prompt(body.get("messages", []))
+              if chat else str(body.get("prompt", "")))
+    prompt_len = engine.count_tokens(prompt)
+    max_tokens = int(body.get("max_tokens") or 16)
+    request_id = f"{'chatcmpl' if chat else 'cmpl'}-{uuid.uuid4().hex}"
+    created = int(time.time())
+    base = {
+        "id": request_id,
+        "object": "chat.completion.chunk" if chat else "text_completion",
+        "created": created,
+        "model": body.get("model", "mock"),
+    }
+    usage = {
+        "prompt_tokens": prompt_len,
+        "completion_tokens": max_tokens,
+        "total_tokens": prompt_len + max_tokens,
+    }
+
+    if not body.get("stream"):
+        text = "".join([
+            token async for token in engine.generate(prompt_len, max_tokens)
+        ])
+        choice: Dict[str, Any] = {"index": 0, "finish_reason": "length"}
+        if chat:
+            choice["message"] = {"role": "assistant", "content": text}
+        else:
+            choice.update(text=text, logprobs=None)
+        return web.json_response({
+            **base,
+            "object": "chat.completion" if chat else "text_completion",
+            "choices": [choice],
+            "usage": usage,
+        })
+
+    response = await _start_sse(request)
+    if chat:
+        await _send_event(
+            response, {
+                **base, "choices": [{
+                    "index": 0,
+                    "delta": {
+                        "role": "assistant",
+                        "content": ""
+                    },
+                    "finish_reason": None
+                }]
+            })
+    i = 0
+    async for token in engine.generate(prompt_len, max_tokens):
+        i += 1
+        finish_reason = "length" if i == max_tokens else None
+        if chat:
+            choice = {"index": 0, "delta": {"content": token}}
+        else:
+            choice = {"index": 0, "text": token, "logprobs": None}
+        choice["finish_reason"] = finish_reason
+        await _send_event(response, {**base, "choices": [choice]})
+    if (body.get("stream_options") or {}).get("include_usage"):
+        await _send_event(response, {**base, "choices": [], "usage": usage})
+    await _send_event(response, "[DONE]")
+    await response.write_eof()
+    return response
+
+
+async def tgi_generate_stream(request: web.Request) -> web.StreamResponse:
+    engine: MockEngine = request.app["engine"]
+    body = await request.json()
+    params = body.get("parameters") or {}
+    prompt_len = engine.count_tokens(str(body.get("inputs", "")))
+    max_tokens = int(params.get("max_new_tokens") or 20)
+
+    response = await _start_sse(request)
+    generated_text = ""
+    i = 0
+    async for token in engine.generate(prompt_len, max_tokens):
+        i += 1
+        generated_text += token
+        last = i == max_tokens
+        await _send_event(
+            response, {
+                "index": i,
+                "token": {
+                    "id": i,
+                    "text": token,
+                    "logprob": 0.0,
+                    "special": False
+                },
+                "generated_text": generated_text if last else None,
+                "details": {
+                    "finish_reason": "length",
+                    "generated_tokens": max_tokens,
+                    "seed": None,
+                } if last else None,
+            })
+    await response.write_eof()
+    return response
+
+
+async def trt_llm_generate_stream(request: web.Request) -> web.StreamResponse:
+    engine: MockEngine = request.app["engine"]
+    body = await request.json()
+    prompt_len = engine.count_tokens(str(body.get("text_input", "")))
+    max_tokens = int(body.get("max_tokens") or 16)
+
+    response = await _start_sse(request)
+    async for token in engine.generate(prompt_len, max_tokens):
+        await _send_event(
+            response, {
+                "model_name": request.match_info["model"],
+                "model_version": "1",
+                "sequence_end": False,
+                "sequence_id": 0,
+                "sequence_start": False,
+                "text_output": token,
+            })
+    await response.write_eof()
+    return response
+
+
+async def deepspeed_mii(request: web.Request) -> web.Response:
+    engine: MockEngine = request.app["engine"]
+    body = await request.json()
+    prompt_len = engine.count_tokens(str(body.get("prompt", "")))
+    max_tokens = int(body.get("max_tokens") or 16)
+    text = "".join(
+        [token async for token in engine.generate(prompt_len, max_tokens)])
+    return web.json_response({"text": [text]})
+
+
+async def metrics(request: web.Request) -> web.Response:
+    """The vLLM scheduler gauges. Every slot stands for an equal share of
+    the KV cache, and requests are never preempted."""
+    engine: MockEngine = request.app["engine"]
+    values = (
+        ("vllm:num_requests_running", "gauge", engine.num_running),
+        ("vllm:num_requests_waiting", "gauge", engine.num_waiting),
+        ("vllm:gpu_cache_usage_perc", "gauge",
+         engine.num_running / engine.max_concurrency),
+        ("vllm:num_preemptions_total", "counter", 0),
+    )
+    lines = []
+    for name, metric_type, value in values:
+        lines.append(f"# TYPE {name} {metric_type}")
+        lines.append(f'{name}{{model_name="mock"}} {float(value)}')
+    return web.Response(text="\n".join(lines) + "\n")
+
+
+async def health(request: web.Request) -> web.Response:
+    return web.Response(text="OK")
+
+
+def create_app(args: argparse.Namespace) -> web.Application:
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app["engine"] = MockEngine(
+        prefill_ms_per_token=args.prefill_ms_per_token,
+        prefill_base_ms=args.prefill_base_ms,
+        decode_ms_per_token=args.decode_ms_per_token,
+        batch_slowdown=args.batch_slowdown,
+        max_concurrency=args.max_concurrency,
+        chars_per_token=args.chars_per_token,
+    )
+    app.router.add_post("/v1/completions", openai_completions)
+    app.router.add_post("/v1/chat/completions", openai_completions)
+    app.router.add_post("/generate_stream", tgi_generate_stream)
+    app.router.add_post("/v2/models/{model}/generate_stream",
+                        trt_llm_generate_stream)
+    app.router.add_post("/mii/{deployment}", deepspeed_mii)
+    app.router.add_get("/metrics", metrics)
+    app.router.add_get("/health", health)
+    return app
+
+
+def main(args: argparse.Namespace):
+    print(args)
+    web.run_app(create_app(args),
+                host=args.host,
+                port=args.port,
+                backlog=args.backlog,
+                access_log=None)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Mock inference server with configurable token timing.")
+    parser.add_argument("--host", type=str, default="localhost")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--prefill-ms-per-token",
+        type=float,
+        default=0.1,
+        help="Prefill time per prompt token in milliseconds.",
+    )
+    parser.add_argument(
+        "--prefill-base-ms",
+        type=float,
+        default=5.0,
+        help="Fixed prefill time of every request in milliseconds.",
+    )
+    parser.add_argument(
+        "--decode-ms-per-token",
+        type=float,
+        default=20.0,
+        help="Time per output token in milliseconds with a single running "
+        "request. 0 streams tokens as fast as possible.",
+    )
+    parser.add_argument(
+        "--batch-slowdown",
+        type=float,
+        default=0.01,
+        help="Relative increase of the decode time per token for every "
+        "running request beyond the first, e.g. 0.01 makes a batch of 101 "
+        "decode at half the speed.",
+    )
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=256,
+        help="Maximum number of running requests. Further requests wait in "
+        "a queue for a free slot.",
+    )
+    parser.add_argument(
+        "--chars-per-token",
+        type=float,
+        default=4.0,
+        help="Characters per token used to estimate prompt lengths.",
+    )
+    parser.add_argument(
+        "--backlog",
+        type=int,
+        default=4096,
+        help="Listen backlog of the server socket.",
+    )
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,258 @@
+"""Multi-turn chat sessions for benchmark_serving.
+
+Each session replays the user turns of one conversation. A turn is sent
+once the reply to the previous one has arrived and the user has thought for
+a while, with the whole conversation so far as its prompt, including the
+replies the model actually generated. Consecutive turns therefore share a
+growing prefix that the server's prefix cache can reuse, which shows up in
+the TTFT by turn.
+"""
+import asyncio
+import time
+from typing import (Any, Awaitable, Callable, Dict, List, Optional, Sequence,
+                    Tuple)
+
+import aiohttp
+import numpy as np
+from backend_request_func import RequestFuncInput, RequestFuncOutput
+from benchmark_dataset import get_token_lens
+from transformers import PreTrainedTokenizerBase
+
+# The (user message, output_len) turns of one session.
+Session = List[Tuple[str, int]]
+Messages = List[Dict[str, str]]
+
+
+def get_think_times(sessions: Sequence[Session],
+                    mean_think_time: float) -> List[np.ndarray]:
+    """Draw exponential think times before every turn of every session. The
+    first turn of a session is sent without one."""
+    think_times = []
+    for session in sessions:
+        times = np.zeros(len(session))
+        if mean_think_time > 0:
+            times[1:] = np.random.exponential(mean_think_time,
+                                              size=len(session) - 1)
+        think_times.append(times)
+    return think_times
+
+
+def render_prompt(tokenizer: PreTrainedTokenizerBase,
+                  messages: Messages) -> str:
+    """Format a conversation as the completion prompt for its next reply."""
+    return tokenizer.apply_chat_template(messages,
+                                         tokenize=False,
+                                         add_generation_prompt=True)
+
+
+def make_turn_input(
+    tokenizer: PreTrainedTokenizerBase,
+    messages: Messages,
+    output_len: int,
+    model_id: str,
+    api_url: str,
+    best_of: int,
+    use_beam_search: bool,
+    use_chat_messages: bool,
+) -> RequestFuncInput:
+    """Request for the next reply of a conversation. Chat backends get the
+    messages as is, all other backends the rendered chat template."""
+    return RequestFuncInput(
+        model=model_id,
+        prompt=(messages[-1]["content"]
+                if use_chat_messages else render_prompt(tokenizer, messages)),
+        api_url=api_url,
+        # Counted in bulk after the run, see `set_prompt_lens`.
+        prompt_len=0,
+        output_len=output_len,
+        best_of=best_of,
+        use_beam_search=use_beam_search,
+        messages=messages if use_chat_messages else None,
+    )
+
+
+async def run_sessions(
+    request_func: Callable[..., Awaitable[RequestFuncOutput]],
+    session: aiohttp.ClientSession,
+    sessions: Sequence[Session],
+    think_times: Sequence[np.ndarray],
+    start_time: float,
+    tokenizer: PreTrainedTokenizerBase,
+    model_id: str,
+    api_url: str,
+    best_of: int,
+    use_beam_search: bool,
+    use_chat_messages: bool,
+    arrival_times: Optional[np.ndarray] = None,
+    concurrency: Optional[int] = None,
+    pbar: Optional[Any] = None,
+    on_output: Optional[Callable[[int, int, RequestFuncOutput], None]] = None,
+) -> Tuple[List[RequestFuncOutput], List[float], List[int], List[int],
+           List[Messages]]:
+    """Run every session turn by turn.
+
+    Sessions start at their `arrival_times`, in seconds since `start_time`,
+    or are picked up by `concurrency` users that start the next session as
+    soon as their previous one ended. A session ends early if a turn fails,
+    since there is no reply to continue the conversation with.
+
+    `on_output(session_index, turn, output)` is called as soon as each turn
+    finishes. Returns the outputs, send times in seconds since `start_time`,
+    session and turn indices and the conversation sent with each request,
+    ordered by session and turn.
+    """
+    results: List[List[Tuple[RequestFuncOutput, float, Messages]]] = [
+        [] for _ in sessions
+    ]
+
+    async def run_session(index: int) -> None:
+        messages: Messages = []
+        for turn, (user_message, output_len) in enumerate(sessions[index]):
+            if think_times[index][turn] > 0:
+                await asyncio.sleep(think_times[index][turn])
+            messages = messages + [{"role": "user", "content": user_message}]
+            request_func_input = make_turn_input(tokenizer, messages,
+                                                 output_len, model_id,
+                                                 api_url, best_of,
+                                                 use_beam_search,
+                                                 use_chat_messages)
+            send_time = time.perf_counter() - start_time
+            output = await request_func(request_func_input=request_func_input,
+                                        pbar=pbar,
+                                        session=session)
+            if on_output is not None:
+                on_output(index, turn, output)
+            results[index].append((output, send_time, messages))
+            if not output.success:
+                if pbar is not None:
+                    pbar.update(len(sessions[index]) - turn - 1)
+                return
+            messages = messages + [{
+                "role": "assistant",
+                "content": output.generated_text
+            }]
+
+    if concurrency is not None:
+        # The users share one iterator, so each session runs exactly once.
+        next_index = iter(range(len(sessions)))
+
+        async def virtual_user() -> None:
+            for index in next_index:
+                await run_session(index)
+
+        await asyncio.gather(*(virtual_user()
+                               for _ in range(min(concurrency,
+                                                  len(sessions)))))
+    else:
+
+        async def scheduled_session(index: int) -> None:
+            delay = start_time + arrival_times[index] - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await run_session(index)
+
+        await asyncio.gather(*(scheduled_session(index)
+                               for index in range(len(sessions))))
+
+    outputs, send_times, session_indices, turn_indices, conversations = (
+        [], [], [], [], [])
+    for index, session_results in enumerate(results):
+        for turn, (output, send_time, messages) in enumerate(session_results):
+            outputs.append(output)
+            send_times.append(send_time)
+            session_indices.append(index)
+            turn_indices.append(turn)
+            conversations.append(messages)
+    return outputs, send_times, session_indices, turn_indices, conversations
+
+
+def replay_conversations(session_indices: Sequence[int],
+                         user_messages: Sequence[str],
+                         replies: Sequence[str]) -> List[Messages]:
+    """Rebuild the conversation sent with each request from the user message
+    and reply of every turn, ordered by session and turn."""
+    conversations = []
+    messages: Messages = []
+    for i, (user_message, reply) in enumerate(zip(user_messages, replies)):
+        if i == 0 or session_indices[i] != session_indices[i - 1]:
+            messages = []
+        messages = messages + [{"role": "user", "content": user_message}]
+        conversations.append(messages)
+        messages = messages + [{"role": "assistant", "content": reply}]
+    return conversations
+
+
+def set_prompt_lens(
+    tokenizer: PreTrainedTokenizerBase,
+    outputs: List[RequestFuncOutput],
+    conversations: List[Messages],
+    tokenizer_workers: int = 1,
+) -> None:
+    """Count the prompt tokens of every turn from its rendered conversation,
+    in bulk once the run is over rather than while requests are timed.
+    Without a chat template, e.g. for a chat backend whose server formats
+    the conversation, the messages are counted joined by newlines."""
+    if tokenizer.chat_template:
+        prompts = [
+            render_prompt(tokenizer, messages) for messages in conversations
+        ]
+    else:
+        prompts = [
+            "\n".join(message["content"] for message in messages)
+            for messages in conversations
+        ]
+    prompt_lens = get_token_lens(tokenizer,
+                                 prompts,
+                                 add_special_tokens=False,
+                                 num_workers=tokenizer_workers)
+    for output, prompt_len in zip(outputs, prompt_lens):
+        output.prompt_len = prompt_len
+
+
+def calculate_turn_stats(outputs: List[RequestFuncOutput],
+                         turn_indices: List[int]) -> Dict[str, List[Any]]:
+    """TTFT and prompt length of the successful requests by turn number,
+    starting at 1."""
+    turns = np.asarray(turn_indices, dtype=np.int64)
+    success = np.array([output.success for output in outputs], dtype=bool)
+    ttfts = np.array([output.ttft for output in outputs]) * 1000
+    input_lens = np.array([output.prompt_len for output in outputs])
+
+    stats: Dict[str, List[Any]] = {
+        "turn": [],
+        "completed": [],
+        "mean_input_len": [],
+        "mean_ttft_ms": [],
+        "median_ttft_ms": [],
+        "p99_ttft_ms": [],
+    }
+    for turn in range(int(turns.max()) + 1 if len(turns) else 0):
+        mask = success & (turns == turn)
+        completed = int(mask.sum())
+        stats["turn"].append(turn + 1)
+        stats["completed"].append(completed)
+        if completed == 0:
+            for key in ("mean_input_len", "mean_ttft_ms", "median_ttft_ms",
+                        "p99_ttft_ms"):
+                stats[key].append(None)
+            continue
+        stats["mean_input_len"].append(float(np.mean(input_lens[mask])))
+        stats["mean_ttft_ms"].append(float(np.mean(ttfts[mask])))
+        stats["median_ttft_ms"].append(float(np.median(ttfts[mask])))
+        stats["p99_ttft_ms"].append(float(np.percentile(ttfts[mask], 99)))
+    return stats
+
+
+def print_turn_stats(stats: Dict[str, List[Any]]) -> None:
+    print("{s:{c}^{n}}".format(s='TTFT by Turn', n=50, c='-'))
+    print("{:>5} {:>9} {:>10} {:>11} {:>11}".format("Turn", "Completed",
+                                                    "Input len", "Med TTFT",
+                                                    "P99 TTFT"))
+    for turn, completed, input_len, median, p99 in zip(
+            stats["turn"], stats["completed"], stats["mean_input_len"],
+            stats["median_ttft_ms"], stats["p99_ttft_ms"]):
+        if completed == 0:
+            print("{:>5} {:>9}".format(turn, completed))
+            continue
+        print("{:>5} {:>9} {:>10.1f} {:>11.2f} {:>11.2f}".format(
+            turn, completed, input_len, median, p99))
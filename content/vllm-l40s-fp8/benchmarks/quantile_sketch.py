@@ -0,0 +1,131 @@
+"""Mergeable streaming quantile sketch for latency metrics."""
+import math
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+
+class DDSketch:
+    """Quantile sketch with bounded relative error, after DDSketch
+    (Masson et al., VLDB 2019).
+
+    Positive values are counted in logarithmically sized bins, so any
+    quantile is estimated within `relative_accuracy` of its true value while
+    memory only grows with the log of the value range, not with the number
+    of samples. Sketches with the same accuracy can be merged, e.g. across
+    load generator processes. When more than `max_bins` bins are used the
+    lowest ones are collapsed, which only affects the accuracy of the
+    smallest quantiles.
+    """
+
+    def __init__(self,
+                 relative_accuracy: float = 0.01,
+                 max_bins: int = 2048) -> None:
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be in (0, 1)")
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        # Values below this are counted as zero.
+        self._min_indexable = 1e-9
+        self.bins: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.sum_sq = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float) -> None:
+        if value < 0:
+            raise ValueError("DDSketch only accepts non-negative values")
+        if value < self._min_indexable:
+            self.zero_count += 1
+        else:
+            key = math.ceil(math.log(value) / self._log_gamma)
+            self.bins[key] = self.bins.get(key, 0) + 1
+            if len(self.bins) > self.max_bins:
+                self._collapse()
+        self.count += 1
+        self.sum += value
+        self.sum_sq += value * value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def add_many(self, values: Iterable[float]) -> None:
+        values = np.asarray(values, dtype=np.float64)
+        if values.size == 0:
+            return
+        if values.min() < 0:
+            raise ValueError("DDSketch only accepts non-negative values")
+        positive = values[values >= self._min_indexable]
+        self.zero_count += values.size - positive.size
+        if positive.size:
+            keys, counts = np.unique(np.ceil(
+                np.log(positive) / self._log_gamma).astype(np.int64),
+                                     return_counts=True)
+            for key, count in zip(keys.tolist(), counts.tolist()):
+                self.bins[key] = self.bins.get(key, 0) + count
+            if len(self.bins) > self.max_bins:
+                self._collapse()
+        self.count += values.size
+        self.sum += float(values.sum())
+        self.sum_sq += float(np.dot(values, values))
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+    def merge(self, other: "DDSketch") -> None:
+        if other.gamma != self.gamma:
+            raise ValueError("Cannot merge sketches of different accuracy")
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.sum_sq += other.sum_sq
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def _collapse(self) -> None:
+        keys = sorted(self.bins)
+        num_collapsed = len(keys) - self.max_bins + 1
+        target = keys[num_collapsed]
+        self.bins[target] += sum(self.bins.pop(key)
+                                 for key in keys[:num_collapsed])
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate the `q` quantile, with `q` in [0, 1]."""
+        if self.count == 0:
+            return None
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if rank < seen:
+                value = 2 * self.gamma**key / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Estimate the `p` percentile, with `p` in [0, 100]."""
+        return self.quantile(p / 100)
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.sum / self.count if self.count else None
+
+    @property
+    def std(self) -> Optional[float]:
+        if not self.count:
+            return None
+        variance = self.sum_sq / self.count - (self.sum / self.count)**2
+        return math.sqrt(max(variance, 0.0))
@@ -0,0 +1,287 @@
+"""Compact columnar storage for benchmark_serving results.
+
+A result saved by `save_columnar_result` is split into
+    <name>.json        the run configuration and summary metrics, i.e. every
+                       field of the regular result JSON except the
+                       per-request lists, so sweeps can be indexed without
+                       touching the per-request data
+    <name>.npz or      the per-request columns, with the inter-token
+    <name>.parquet     latencies flattened into one array plus offsets
+    <name>.text.jsonl  optionally, the generated text and error per request
+
+While a benchmark runs, `RequestStreamWriter` can additionally append every
+finished request to <name>.requests.jsonl, so that an interrupted run can
+still be evaluated from the records that made it to disk.
+"""
+import asyncio
+import glob
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Per-request fields of the benchmark_serving result JSON.
+NUMERIC_COLUMNS = {
+    "input_lens": np.int32,
+    "output_lens": np.int32,
+    "ttfts": np.float64,
+    "latencies": np.float64,
+    "parse_times": np.float64,
+    "intended_send_times": np.float64,
+    "actual_send_times": np.float64,
+    "request_start_times": np.float64,
+    "session_indices": np.int32,
+    "turn_indices": np.int32,
+}
+RAGGED_COLUMNS = ("itls", )
+TEXT_COLUMNS = ("generated_texts", "errors")
+PER_REQUEST_FIELDS = (tuple(NUMERIC_COLUMNS) + RAGGED_COLUMNS + TEXT_COLUMNS)
+
+RESULT_FORMATS = ("json", "npz", "parquet")
+
+
+def _flatten(lists: List[List[float]]) -> Dict[str, np.ndarray]:
+    lens = np.fromiter((len(values) for values in lists),
+                       dtype=np.int64,
+                       count=len(lists))
+    offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+    np.cumsum(lens, out=offsets[1:])
+    values = np.fromiter((value for values in lists for value in values),
+                         dtype=np.float64,
+                         count=int(offsets[-1]))
+    return {"values": values, "offsets": offsets}
+
+
+def save_columnar_result(
+    result_json: Dict[str, Any],
+    base_path: str,
+    result_format: str = "npz",
+    save_text: bool = False,
+) -> None:
+    """Save `result_json` in columnar form next to a small JSON summary.
+
+    `base_path` is the result path without extension. Errors of failed
+    requests are kept in the summary; generated texts are only written when
+    `save_text` is set.
+    """
+    if result_format not in ("npz", "parquet"):
+        raise ValueError(f"Unknown columnar result format: {result_format}")
+
+    summary = {
+        key: value
+        for key, value in result_json.items() if key not in PER_REQUEST_FIELDS
+    }
+    errors = result_json.get("errors", [])
+    summary["errors"] = [{
+        "index": i,
+        "error": error
+    } for i, error in enumerate(errors) if error]
+    summary["columns_file"] = os.path.basename(f"{base_path}.{result_format}")
+
+    columns = {
+        name: np.asarray(result_json[name], dtype=dtype)
+        for name, dtype in NUMERIC_COLUMNS.items() if name in result_json
+    }
+    if result_format == "npz":
+        for name in RAGGED_COLUMNS:
+            if name in result_json:
+                flat = _flatten(result_json[name])
+                columns[f"{name}_values"] = flat["values"]
+                columns[f"{name}_offsets"] = flat["offsets"]
+        np.savez(f"{base_path}.npz", **columns)
+    else:
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as err:
+            raise ImportError("Please install pyarrow to save results in the "
+                              "parquet format.") from err
+        arrays = {name: pa.array(values) for name, values in columns.items()}
+        for name in RAGGED_COLUMNS:
+            if name in result_json:
+                flat = _flatten(result_json[name])
+                arrays[name] = pa.ListArray.from_arrays(
+                    pa.array(flat["offsets"].astype(np.int32)),
+                    pa.array(flat["values"]))
+        pq.write_table(pa.table(arrays), f"{base_path}.parquet")
+
+    if save_text:
+        summary["text_file"] = os.path.basename(f"{base_path}.text.jsonl")
+        texts = result_json.get("generated_texts", [])
+        with open(f"{base_path}.text.jsonl", "w") as f:
+            for text, error in zip(texts, errors):
+                f.write(
+                    json.dumps({
+                        "generated_text": text,
+                        "error": error
+                    }) + "\n")
+
+    with open(f"{base_path}.json", "w") as f:
+        json.dump(summary, f)
+
+
+def load_columnar_result(summary_path: str,
+                         load_text: bool = False) -> Dict[str, Any]:
+    """Load a result saved by `save_columnar_result` back into the layout of
+    the regular result JSON, with NumPy arrays for the per-request columns.
+    """
+    with open(summary_path) as f:
+        result: Dict[str, Any] = json.load(f)
+    directory = os.path.dirname(summary_path)
+    columns_path = os.path.join(directory, result["columns_file"])
+
+    if columns_path.endswith(".npz"):
+        with np.load(columns_path) as columns:
+            for name in NUMERIC_COLUMNS:
+                if name in columns:
+                    result[name] = columns[name]
+            for name in RAGGED_COLUMNS:
+                if f"{name}_values" in columns:
+                    offsets = columns[f"{name}_offsets"]
+                    result[name] = np.split(columns[f"{name}_values"],
+                                            offsets[1:-1])
+    else:
+        import pyarrow.parquet as pq
+        table = pq.read_table(columns_path)
+        for name in table.column_names:
+            column = table.column(name).combine_chunks()
+            if name in RAGGED_COLUMNS:
+                offsets = column.offsets.to_numpy()
+                values = column.values.to_numpy()
+                result[name] = np.split(values, offsets[1:-1])
+            else:
+                result[name] = column.to_numpy()
+
+    errors = [""] * len(result.get("input_lens", []))
+    for entry in result["errors"]:
+        errors[entry["index"]] = entry["error"]
+    result["errors"] = errors
+
+    text_file: Optional[str] = result.get("text_file")
+    if load_text and text_file is not None:
+        with open(os.path.join(directory, text_file)) as f:
+            result["generated_texts"] = [
+                json.loads(line)["generated_text"] for line in f
+            ]
+    return result
+
+
+class RequestStreamWriter:
+    """Append-only JSON lines log of finished requests.
+
+    The first line is a header with the run configuration, every further
+    line one compact request record. Records are buffered and written out
+    once `max_buffered` are pending or at the latest `flush_interval`
+    seconds after the first of them, so at most that much is lost if the
+    process dies. Used from a running event loop, the deadline is kept by a
+    timer even when no further records arrive.
+    """
+
+    def __init__(self,
+                 path: str,
+                 header: Dict[str, Any],
+                 max_buffered: int = 256,
+                 flush_interval: float = 1.0) -> None:
+        self.path = path
+        self.max_buffered = max_buffered
+        self.flush_interval = flush_interval
+        self._buffer: List[str] = []
+        self._last_flush = time.monotonic()
+        self._flush_timer: Optional[asyncio.TimerHandle] = None
+        self._file = open(path, "w", encoding="utf-8")
+        self._file.write(_dump_record({"type": "header", **header}) + "\n")
+        self._file.flush()
+
+    def write(self, record: Dict[str, Any]) -> None:
+        self._buffer.append(_dump_record(record))
+        if (len(self._buffer) >= self.max_buffered
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+        elif self._flush_timer is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                return
+            self._flush_timer = loop.call_later(self.flush_interval,
+                                                self.flush)
+
+    def flush(self) -> None:
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        if self._file.closed:
+            return
+        if self._buffer:
+            self._file.write("\n".join(self._buffer) + "\n")
+            self._buffer.clear()
+        self._file.flush()
+        self._last_flush = time.monotonic()
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+
+def _dump_record(record: Dict[str, Any]) -> str:
+    return json.dumps(record, separators=(",", ":"))
+
+
+def request_stream_path(base_path: str,
+                        worker_id: Optional[int] = None) -> str:
+    """Path of the request stream of a result, one per worker process if
+    the load is sharded."""
+    if worker_id is None:
+        return f"{base_path}.requests.jsonl"
+    return f"{base_path}.requests.{worker_id}.jsonl"
+
+
+def request_stream_base_path(stream_path: str) -> str:
+    """Result path without extension that a request stream belongs to."""
+    root = stream_path[:-len(".jsonl")]
+    root, worker = os.path.splitext(root)
+    if worker != ".requests":
+        root = os.path.splitext(root)[0]
+    return root
+
+
+def read_request_streams(
+        paths: Sequence[str]) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """Read the header and the request records of one or more streams, e.g.
+    the per-worker streams of a sharded run, sorted by request index.
+
+    A stream path without worker suffix also picks up the worker streams
+    next to it. A truncated last line, left by a crash in the middle of a
+    write, is skipped.
+    """
+    stream_paths: List[str] = []
+    for path in paths:
+        if os.path.exists(path):
+            stream_paths.append(path)
+        base_path = request_stream_base_path(path)
+        if path == request_stream_path(base_path):
+            stream_paths.extend(
+                sorted(glob.glob(f"{glob.escape(base_path)}.requests.*.jsonl")))
+    if not stream_paths:
+        raise FileNotFoundError(f"No request streams found at {paths}")
+
+    header: Dict[str, Any] = {}
+    records: List[Dict[str, Any]] = []
+    for path in stream_paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                if record.get("type") == "header":
+                    header = header or record
+                else:
+                    records.append(record)
+    # Multi-turn records are ordered by session and turn, like the result.
+    records.sort(key=lambda record: (record.get("session", 0),
+                                     record.get("turn", 0), record["index"]))
+    return header, records
@@ -0,0 +1,250 @@
+"""Server-side metrics scraped while benchmark_serving runs.
+
+vLLM and TGI expose their scheduler state at /metrics in the Prometheus
+text format. `ServerMetricsScraper` polls it in the background on the same
+perf_counter clock as the request timings, and `server_metrics_summary`
+relates the samples to the slowest requests of the run to tell whether
+their latency came from queueing, KV cache exhaustion or preemption.
+"""
+import asyncio
+import re
+import time
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+import numpy as np
+from backend_request_func import RequestFuncOutput
+
+# Prometheus names of every sampled quantity, the first one a server
+# exposes is used. Labelled series of the same name are summed.
+SERVER_METRICS = {
+    "num_running": ("vllm:num_requests_running", "tgi_batch_current_size"),
+    "num_waiting": ("vllm:num_requests_waiting", "tgi_queue_size"),
+    "kv_cache_usage": ("vllm:gpu_cache_usage_perc",
+                       "vllm:kv_cache_usage_perc"),
+    "num_preemptions": ("vllm:num_preemptions_total", ),
+}
+
+# KV cache usage, as a fraction, from which new requests are likely held
+# back or running ones preempted.
+KV_CACHE_FULL = 0.95
+
+_SAMPLE_LINE = re.compile(r"^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{.*\})?\s+(\S+)")
+
+
+def parse_prometheus_text(text: str) -> Dict[str, float]:
+    """Values of all samples in a Prometheus text exposition, summed over
+    the label sets of each metric name."""
+    values: Dict[str, float] = {}
+    for line in text.splitlines():
+        match = _SAMPLE_LINE.match(line)
+        if match is None:
+            continue
+        try:
+            value = float(match.group(3))
+        except ValueError:
+            continue
+        name = match.group(1)
+        values[name] = values.get(name, 0.0) + value
+    return values
+
+
+class ServerMetricsScraper:
+    """Polls a server's metrics endpoint every `interval` seconds.
+
+    Each sample is timestamped halfway between sending the scrape and
+    receiving its response. A server without the endpoint only costs a
+    warning.
+    """
+
+    def __init__(self, url: str, interval: float = 1.0) -> None:
+        self.url = url
+        self.interval = interval
+        self.times: List[float] = []
+        self.values: Dict[str, List[Optional[float]]] = {
+            name: []
+            for name in SERVER_METRICS
+        }
+        self.num_failed = 0
+        self.error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Start scraping, from within the running event loop."""
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        # A separate session keeps scrapes out of the benchmark's connection
+        # pool and its connection limit.
+        timeout = aiohttp.ClientTimeout(total=max(self.interval, 1.0))
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            next_time = time.perf_counter()
+            while True:
+                await self._scrape(session)
+                next_time += self.interval
+                delay = next_time - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    next_time = time.perf_counter()
+
+    async def _scrape(self, session: aiohttp.ClientSession) -> None:
+        sent = time.perf_counter()
+        try:
+            async with session.get(self.url) as response:
+                response.raise_for_status()
+                text = await response.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.num_failed += 1
+            if self.error is None:
+                self.error = f"{type(e).__name__}: {e}"
+                print(f"Failed to scrape server metrics from {self.url}: "
+                      f"{self.error}")
+            return
+        received = time.perf_counter()
+        values = parse_prometheus_text(text)
+        self.times.append((sent + received) / 2)
+        for name, candidates in SERVER_METRICS.items():
+            self.values[name].append(
+                next((values[candidate]
+                      for candidate in candidates if candidate in values),
+                     None))
+
+    async def stop(self, start_time: float) -> Dict[str, Any]:
+        """Stop scraping and return the samples with their times in seconds
+        since `start_time`. Metrics the server does not expose are left
+        out."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        samples: Dict[str, Any] = {
+            "url": self.url,
+            "interval_s": self.interval,
+            "num_failed": self.num_failed,
+            "time": [t - start_time for t in self.times],
+        }
+        for name, values in self.values.items():
+            if any(value is not None for value in values):
+                samples[name] = values
+        return samples
+
+
+def _tail_mask(times: np.ndarray, outputs: List[RequestFuncOutput],
+               tail_percentile: float) -> np.ndarray:
+    """Samples taken while any request at or above `tail_percentile` of the
+    E2E latency was in flight."""
+    done = [output for output in outputs if output.success]
+    mask = np.zeros(len(times), dtype=bool)
+    if not done:
+        return mask
+    latencies = np.asarray([output.latency for output in done])
+    threshold = np.percentile(latencies, tail_percentile)
+    for output in done:
+        if output.latency >= threshold:
+            mask |= ((times >= output.start_time) &
+                     (times <= output.start_time + output.latency))
+    return mask
+
+
+def server_metrics_summary(samples: Dict[str, Any],
+                           outputs: List[RequestFuncOutput],
+                           duration: float,
+                           tail_percentile: float = 99) -> Dict[str, Any]:
+    """Summarize the samples scraped during the `duration` of a run.
+
+    Expects send times rebased to the benchmark start. Besides the averages
+    and peaks over the run, reports the share of samples taken during the
+    slowest requests that saw a queue or a nearly full KV cache, and the
+    preemptions in that time. `tail_latency_cause` names the first of
+    preemption, KV cache exhaustion and queueing that applies, "other" if
+    none does and None if no sample was taken during the slowest requests.
+    """
+    times = np.asarray(samples["time"], dtype=np.float64)
+    # Samples from before the first and after the last request show an idle
+    # server.
+    in_run = (times >= 0) & (times <= duration)
+    times = times[in_run]
+    stats: Dict[str, Any] = {"server_metrics_samples": len(times)}
+    if len(times) == 0:
+        stats["tail_latency_cause"] = None
+        return stats
+
+    def column(name: str) -> Optional[np.ndarray]:
+        if name not in samples:
+            return None
+        return np.asarray(
+            [np.nan if value is None else value for value in samples[name]],
+            dtype=np.float64)[in_run]
+
+    running = column("num_running")
+    waiting = column("num_waiting")
+    kv_cache_usage = column("kv_cache_usage")
+    preemptions = column("num_preemptions")
+    tail = _tail_mask(times, outputs, tail_percentile)
+    num_tail = int(tail.sum())
+
+    def tail_pct(condition: np.ndarray) -> Optional[float]:
+        if num_tail == 0:
+            return None
+        return float(np.sum(condition & tail) / num_tail * 100)
+
+    if running is not None:
+        stats["mean_server_running"] = float(np.nanmean(running))
+        stats["max_server_running"] = float(np.nanmax(running))
+    if waiting is not None:
+        stats["mean_server_waiting"] = float(np.nanmean(waiting))
+        stats["max_server_waiting"] = float(np.nanmax(waiting))
+        stats["tail_queueing_pct"] = tail_pct(waiting > 0)
+    if kv_cache_usage is not None:
+        stats["mean_kv_cache_usage"] = float(np.nanmean(kv_cache_usage))
+        stats["max_kv_cache_usage"] = float(np.nanmax(kv_cache_usage))
+        stats["tail_kv_cache_full_pct"] = tail_pct(
+            kv_cache_usage >= KV_CACHE_FULL)
+    if preemptions is not None:
+        # The counter grew between the previous sample and this one, which
+        # is 0 for the first sample and samples without the counter.
+        increments = np.zeros(len(preemptions))
+        valid = np.flatnonzero(~np.isnan(preemptions))
+        increments[valid[1:]] = np.maximum(np.diff(preemptions[valid]), 0)
+        stats["server_preemptions"] = float(increments.sum())
+        stats["tail_preemptions"] = float(increments[tail].sum())
+
+    if num_tail == 0:
+        # No scrape fell within the slowest requests, e.g. requests shorter
+        # than the scrape interval, so there is nothing to attribute.
+        cause = None
+    elif stats.get("tail_preemptions"):
+        cause = "preemption"
+    elif (stats.get("tail_kv_cache_full_pct") or 0) >= 50:
+        cause = "kv_cache"
+    elif (stats.get("tail_queueing_pct") or 0) >= 50:
+        cause = "queueing"
+    else:
+        cause = "other"
+    stats["tail_latency_cause"] = cause
+    return stats
+
+
+def print_server_metrics_summary(stats: Dict[str, Any],
+                                 tail_percentile: float = 99) -> None:
+    print("{s:{c}^{n}}".format(s='Server Metrics', n=50, c='-'))
+    print("{:<40} {:<10}".format("Samples:", stats["server_metrics_samples"]))
+    rows = (
+        ("Mean running requests:", "mean_server_running", 1),
+        ("Max running requests:", "max_server_running", 1),
+        ("Mean waiting requests:", "mean_server_waiting", 1),
+        ("Max waiting requests:", "max_server_waiting", 1),
+        ("Mean KV cache usage (%):", "mean_kv_cache_usage", 100),
+        ("Max KV cache usage (%):", "max_kv_cache_usage", 100),
+        ("Preemptions:", "server_preemptions", 1),
+    )
+    for label, key, scale in rows:
+        if stats.get(key) is not None:
+            print("{:<40} {:<10.2f}".format(label, stats[key] * scale))
+    if stats.get("tail_latency_cause") is not None:
+        print("{:<40} {:<10}".format(
+            f"P{tail_percentile:g} E2EL cause:", stats["tail_latency_cause"]))
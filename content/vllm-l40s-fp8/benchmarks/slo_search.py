@@ -0,0 +1,211 @@
+"""Search for the highest request rate that still meets latency SLOs.
+
+SLOs are upper bounds on result metrics such as `p99_ttft_ms` or
+`median_tpot_ms`. The search brackets the knee of the latency curve by
+doubling or halving the request rate, then bisects it with short benchmark
+runs. Each run is judged on a confidence interval of the SLO metrics, and
+runs that are too short to tell are repeated with a longer duration.
+"""
+import math
+import re
+from statistics import NormalDist
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+SLO_KEY_PATTERN = re.compile(
+    r"^(?P<stat>mean|median|p(?P<percentile>\d+(?:\.\d+)?))_"
+    r"(?P<metric>ttft|tpot|itl)_ms$")
+
+# A run fails outright if more than this fraction of its requests failed.
+MAX_FAILED_FRACTION = 0.01
+
+PASS = "pass"
+FAIL = "fail"
+INCONCLUSIVE = "inconclusive"
+
+
+def parse_slos(specs: List[str]) -> Dict[str, float]:
+    """Parse `key:threshold` pairs such as `p99_ttft_ms:500`."""
+    slos = {}
+    for spec in specs:
+        key, sep, threshold = spec.partition(":")
+        if not sep or SLO_KEY_PATTERN.match(key) is None:
+            raise ValueError(
+                f"Invalid SLO {spec!r}. Please use KEY:THRESHOLD with KEY "
+                "like p99_ttft_ms, median_tpot_ms or mean_itl_ms.")
+        slos[key] = float(threshold)
+    return slos
+
+
+def slo_percentiles(slos: Dict[str, float]) -> List[float]:
+    """Percentiles that the benchmark needs to report for `slos`."""
+    return sorted({
+        float(match.group("percentile"))
+        for match in map(SLO_KEY_PATTERN.match, slos)
+        if match.group("percentile") is not None
+    })
+
+
+def _latency_samples(result: Dict[str, Any]) -> Dict[str, np.ndarray]:
+    latencies = np.asarray(result["latencies"], dtype=np.float64)
+    ttfts = np.asarray(result["ttfts"], dtype=np.float64)
+    output_lens = np.asarray(result["output_lens"], dtype=np.float64)
+    success = latencies > 0
+    decoding = success & (output_lens > 1)
+    itls = [itl for itl, ok in zip(result["itls"], success) if ok]
+    return {
+        "ttft":
+        ttfts[success] * 1000,
+        "tpot": (latencies[decoding] - ttfts[decoding]) /
+        (output_lens[decoding] - 1) * 1000,
+        "itl":
+        np.concatenate(itls) * 1000 if itls else np.empty(0),
+    }
+
+
+def _confidence_interval(samples: np.ndarray, stat: str,
+                         percentile: Optional[float],
+                         z: float) -> Tuple[float, float, float]:
+    """Point estimate and confidence interval of a mean or percentile."""
+    n = len(samples)
+    if stat == "mean":
+        mean = float(np.mean(samples))
+        half_width = z * float(np.std(samples)) / math.sqrt(n)
+        return mean, mean - half_width, mean + half_width
+    q = 0.5 if stat == "median" else percentile / 100
+    # Distribution-free interval from the order statistics, using the
+    # normal approximation of the binomial rank distribution.
+    ordered = np.sort(samples)
+    half_width = z * math.sqrt(n * q * (1 - q))
+    lower = ordered[max(math.floor(n * q - half_width), 0)]
+    upper = ordered[min(math.ceil(n * q + half_width), n - 1)]
+    return float(np.percentile(samples, q * 100)), float(lower), float(upper)
+
+
+def evaluate_slos(result: Dict[str, Any], slos: Dict[str, float],
+                  confidence: float) -> Tuple[str, Dict[str, Any]]:
+    """Judge one benchmark result against `slos`.
+
+    A run passes if the upper confidence bound of every SLO metric is within
+    its threshold, and fails if any lower bound exceeds it. When latencies
+    were only kept in a sketch, the reported value is used as is.
+    """
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    samples = _latency_samples(result)
+    num_requests = len(result["latencies"])
+    failed_fraction = 1 - result["completed"] / max(num_requests, 1)
+
+    details: Dict[str, Any] = {"failed_fraction": failed_fraction}
+    verdicts = [FAIL if failed_fraction > MAX_FAILED_FRACTION else PASS]
+    for key, threshold in slos.items():
+        match = SLO_KEY_PATTERN.match(key)
+        metric_samples = samples[match.group("metric")]
+        if len(metric_samples):
+            percentile = match.group("percentile")
+            value, lower, upper = _confidence_interval(
+                metric_samples, match.group("stat"),
+                float(percentile) if percentile is not None else None, z)
+        else:
+            value = lower = upper = result[key]
+        if upper <= threshold:
+            verdicts.append(PASS)
+        elif lower > threshold:
+            verdicts.append(FAIL)
+        else:
+            verdicts.append(INCONCLUSIVE)
+        details[key] = {
+            "value": value,
+            "lower": lower,
+            "upper": upper,
+            "threshold": threshold,
+        }
+
+    if FAIL in verdicts:
+        return FAIL, details
+    if INCONCLUSIVE in verdicts:
+        return INCONCLUSIVE, details
+    return PASS, details
+
+
+async def search_max_request_rate(
+    run_probe: Callable[[float, float], Awaitable[Dict[str, Any]]],
+    slos: Dict[str, float],
+    initial_rate: float,
+    max_rate: float,
+    duration: float,
+    max_duration: float,
+    tolerance: float = 0.05,
+    max_probes: int = 12,
+    confidence: float = 0.95,
+    min_rate: Optional[float] = None,
+) -> Dict[str, Any]:
+    """Find the highest request rate that meets `slos`.
+
+    `run_probe(request_rate, duration)` runs one benchmark and returns its
+    result. Inconclusive probes are repeated with twice the duration, up to
+    `max_duration`, and otherwise count as failed. The search stops once the
+    bracket is narrower than `tolerance` relative to its lower end or after
+    `max_probes` probes. The maximum rate lies between the returned
+    `lower_bound`, the highest rate that passed, and `upper_bound`, the
+    lowest rate that did not, which is None if even `max_rate` passed.
+    """
+    if min_rate is None:
+        min_rate = initial_rate / 64
+    probes: List[Dict[str, Any]] = []
+
+    async def passes(request_rate: float) -> bool:
+        probe_duration = duration
+        while True:
+            result = await run_probe(request_rate, probe_duration)
+            verdict, details = evaluate_slos(result, slos, confidence)
+            probes.append({
+                "request_rate": request_rate,
+                "duration": probe_duration,
+                "verdict": verdict,
+                "achieved_request_rate": result["achieved_request_rate"],
+                **details,
+            })
+            print(f"SLO search: {request_rate:.3f} qps for "
+                  f"{probe_duration:g}s -> {verdict}")
+            if verdict != INCONCLUSIVE or probe_duration * 2 > max_duration:
+                return verdict == PASS
+            probe_duration *= 2
+
+    lower: float = 0.0
+    upper: Optional[float] = None
+    request_rate = min(initial_rate, max_rate)
+    if await passes(request_rate):
+        lower = request_rate
+        while lower < max_rate and len(probes) < max_probes:
+            request_rate = min(lower * 2, max_rate)
+            if not await passes(request_rate):
+                upper = request_rate
+                break
+            lower = request_rate
+    else:
+        upper = request_rate
+        while upper / 2 >= min_rate and len(probes) < max_probes:
+            request_rate = upper / 2
+            if await passes(request_rate):
+                lower = request_rate
+                break
+            upper = request_rate
+
+    while (upper is not None and lower > 0
+           and upper - lower > tolerance * lower
+           and len(probes) < max_probes):
+        request_rate = (lower + upper) / 2
+        if await passes(request_rate):
+            lower = request_rate
+        else:
+            upper = request_rate
+
+    return {
+        "max_request_rate": lower,
+        "lower_bound": lower,
+        "upper_bound": upper,
+        "slos": slos,
+        "confidence": confidence,
+        "probes": probes,
+    }
@@ -1,72 +1,323 @@
+import argparse
 import json
 import os
 import re
 import matplotlib.pyplot as plt
 import numpy as np
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+FILENAME_PATTERN = re.compile(
+    r'(?P<backend>[^-]+)-(?:(?P<qps>\d+\.\d+|inf)qps|(?P<concurrency>\d+)users)'
+    r'-(?P<model>.+)-(?P<date>\d{8}-\d{6})\.json$')
+INDEX_FILENAME = '.plot_index.json'
+INDEX_VERSION = 3
+X_AXIS_LABELS = {
+    'qps': 'QPS (Queries Per Second)',
+    'concurrency': 'Concurrent Users',
+}
+# Result files above this size are only read up to their per-request lists.
+FULL_LOAD_MAX_BYTES = 1 << 20
+METRIC_ACRONYMS = {'ttft', 'tpot', 'itl', 'e2el', 'qps', 'slo'}
+METRIC_UNITS = {'ms': 'ms', 's': 's', 'pct': '%'}
+# Charted by default when the results contain them.
+DEFAULT_METRICS = ['median_tpot_ms', 'median_ttft_ms', 'request_goodput', 'slo_attainment_pct']
 
 def extract_info_from_filename(filename):
-    pattern = r'(?P<backend>[^-]+)-(?P<qps>\d+\.\d+)qps-(?P<model>.+)-(?P<date>\d{8}-\d{6})\.json'
-    match = re.match(pattern, filename)
+    match = FILENAME_PATTERN.match(filename)
     if match:
         return {
-            'qps': float(match.group('qps')),
-            'model': match.group('model')
+            'backend': match.group('backend'),
+            'qps': float(match.group('qps')) if match.group('qps') else None,
+            'concurrency': int(match.group('concurrency')) if match.group('concurrency') else None,
+            'model': match.group('model'),
+            'date': match.group('date'),
         }
     return None
 
-def read_json_files(directory):
-    data_tpot = defaultdict(list)
-    data_ttft = defaultdict(list)
-    for filename in os.listdir(directory):
-        if filename.endswith('.json'):
-            filepath = os.path.join(directory, filename)
-            file_info = extract_info_from_filename(filename)
-            if file_info:
-                with open(filepath, 'r') as file:
-                    json_data = json.load(file)
-                    median_tpot = json_data.get('median_tpot_ms')
-                    std_tpot = json_data.get('std_tpot_ms')
-                    median_ttft = json_data.get('median_ttft_ms')
-                    std_ttft = json_data.get('std_ttft_ms')
-                    if all(v is not None for v in [median_tpot, std_tpot, median_ttft, std_ttft]):
-                        data_tpot[file_info['model']].append((file_info['qps'], median_tpot, std_tpot))
-                        data_ttft[file_info['model']].append((file_info['qps'], median_ttft, std_ttft))
-    return {
-        'tpot': {model: sorted(points) for model, points in data_tpot.items()},
-        'ttft': {model: sorted(points) for model, points in data_ttft.items()}
-    }
-
-def create_chart(data, metric, filename):
+def _is_scalar(value):
+    return value is None or isinstance(value, (str, int, float, bool))
+
+def read_summary_prefix(filepath, chunk_size=1 << 16):
+    """Read the top-level scalar fields of a result JSON, stopping at the first
+    list value. benchmark_serving writes all summary metrics before the
+    per-request lists, so this skips the bulk of large result files. Small
+    nested objects such as the time series are read and skipped."""
+    decoder = json.JSONDecoder()
+    summary = {}
+    with open(filepath, 'r') as file:
+        buffer = file.read(chunk_size)
+        pos = 0
+        eof = False
+
+        def next_char():
+            nonlocal buffer, pos, eof
+            while True:
+                while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    return buffer[pos] if pos < len(buffer) else ''
+                more = file.read(chunk_size)
+                eof = not more
+                buffer = buffer[pos:] + more
+                pos = 0
+
+        def decode():
+            nonlocal buffer, pos, eof
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                    # A number at the end of the buffer may be truncated.
+                    if eof or (end < len(buffer) and buffer[end] in ' \t\r\n,:}]'):
+                        pos = end
+                        return value
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                more = file.read(chunk_size)
+                eof = not more
+                buffer = buffer[pos:] + more
+                pos = 0
+
+        if next_char() != '{':
+            raise ValueError(f'{filepath} is not a JSON object')
+        pos += 1
+        while next_char() == '"':
+            key = decode()
+            if next_char() != ':':
+                raise ValueError(f'Malformed JSON in {filepath}')
+            pos += 1
+            if next_char() == '[':
+                break
+            value = decode()
+            if _is_scalar(value):
+                summary[key] = value
+    return summary
+
+def read_summary(filepath):
+    if os.path.getsize(filepath) <= FULL_LOAD_MAX_BYTES:
+        with open(filepath, 'r') as file:
+            json_data = json.load(file)
+        return {key: value for key, value in json_data.items() if _is_scalar(value)}
+    return read_summary_prefix(filepath)
+
+def _load_index(index_path):
+    try:
+        with open(index_path, 'r') as file:
+            index = json.load(file)
+    except (OSError, ValueError):
+        return {}
+    if index.get('version') != INDEX_VERSION:
+        return {}
+    return index.get('files', {})
+
+def _save_index(index_path, entries):
+    tmp_path = f'{index_path}.tmp'
+    with open(tmp_path, 'w') as file:
+        json.dump({'version': INDEX_VERSION, 'files': entries}, file)
+    os.replace(tmp_path, index_path)
+
+def index_results(directory, num_workers=8, use_cache=True):
+    """Return one row per result file in `directory`, with the filename fields
+    and all summary scalars of the result.
+
+    Summaries are cached in `directory`/.plot_index.json keyed on file size
+    and mtime, so only new or changed files are read on later calls. Those are
+    read in parallel with a thread pool.
+    """
+    index_path = os.path.join(directory, INDEX_FILENAME)
+    cached = _load_index(index_path) if use_cache else {}
+    entries = {}
+    stale = []
+    for entry in os.scandir(directory):
+        if not entry.is_file():
+            continue
+        file_info = extract_info_from_filename(entry.name)
+        if file_info is None:
+            continue
+        stat = entry.stat()
+        cached_entry = cached.get(entry.name)
+        if (cached_entry is not None and cached_entry['mtime_ns'] == stat.st_mtime_ns
+                and cached_entry['size'] == stat.st_size):
+            entries[entry.name] = cached_entry
+        else:
+            stale.append((entry.name, file_info, stat))
+
+    def load(item):
+        name, file_info, stat = item
+        try:
+            summary = read_summary(os.path.join(directory, name))
+        except (OSError, ValueError) as err:
+            print(f'Skipping {name}: {err}')
+            summary = None
+        return name, {
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'info': file_info,
+            'summary': summary,
+        }
+
+    if stale:
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            entries.update(executor.map(load, stale))
+    if use_cache and (stale or len(entries) != len(cached)):
+        try:
+            _save_index(index_path, entries)
+        except OSError as err:
+            print(f'Could not write {index_path}: {err}')
+
+    rows = []
+    for name, entry in sorted(entries.items()):
+        if entry['summary'] is not None:
+            rows.append({**entry['summary'], **entry['info'], 'file': name})
+    return rows
+
+def group_points(rows, metric, group_by=('backend', 'model'), error_metric=None, x='qps'):
+    """Group `rows` into {group: [(x, value, error)]} sorted by `x`, the QPS
+    of open-loop runs or the concurrency of closed-loop runs. Rows without `x`
+    or `metric` are skipped; for repeated runs of a group at the same `x` only
+    the latest one is kept."""
+    latest = {}
+    for row in rows:
+        if row.get(metric) is None or row.get(x) is None:
+            continue
+        key = (tuple(row.get(field) for field in group_by), row[x])
+        if key not in latest or row['date'] > latest[key]['date']:
+            latest[key] = row
+    data = defaultdict(list)
+    for (group, x_value), row in latest.items():
+        error = row.get(error_metric) if error_metric else None
+        data[group].append((x_value, row[metric], error))
+    return {group: sorted(points) for group, points in sorted(data.items(), key=lambda item: str(item[0]))}
+
+def _default_error_metric(metric):
+    for stat in ('median_', 'mean_'):
+        if metric.startswith(stat):
+            return 'std_' + metric[len(stat):]
+    return None
+
+def _metric_label(metric):
+    words = metric.split('_')
+    unit = METRIC_UNITS[words.pop()] if words[-1] in METRIC_UNITS else None
+    label = ' '.join(word.upper() if word in METRIC_ACRONYMS else word.capitalize() for word in words)
+    return f'{label} ({unit})' if unit else label
+
+def chart_filename(metric, x='qps'):
+    name = metric
+    if name.startswith('median_'):
+        name = name[len('median_'):]
+    if name.endswith('_ms'):
+        name = name[:-len('_ms')]
+    return f'{name}_vs_{x}_chart.png'
+
+def create_chart(rows, metric, filename, group_by=('backend', 'model'), error_metric=None, x='qps'):
+    if error_metric is None:
+        error_metric = _default_error_metric(metric)
+    data = group_points(rows, metric, group_by, error_metric, x)
+    if not data:
+        return False
+
     plt.figure(figsize=(12, 6))
-    
+
     colors = plt.cm.rainbow(np.linspace(0, 1, len(data)))
-    for (model, points), color in zip(data.items(), colors):
-        qps_values, median_values, std_values = zip(*points)
-        plt.errorbar(qps_values, median_values, yerr=std_values, fmt='o-', capsize=5, capthick=2, label=model, color=color)
-        plt.fill_between(qps_values, 
-                         np.array(median_values) - np.array(std_values),
-                         np.array(median_values) + np.array(std_values),
-                         alpha=0.2, color=color)
-
-    plt.xlabel('QPS (Queries Per Second)')
-    plt.ylabel(f'Median {metric.upper()} (ms)')
-    plt.title(f'Median {metric.upper()} vs QPS with Standard Deviation')
+    for (group, points), color in zip(data.items(), colors):
+        label = ' / '.join(str(value) for value in group)
+        x_values, values, errors = zip(*points)
+        if all(error is not None for error in errors):
+            plt.errorbar(x_values, values, yerr=errors, fmt='o-', capsize=5, capthick=2, label=label, color=color)
+            plt.fill_between(x_values,
+                             np.array(values) - np.array(errors),
+                             np.array(values) + np.array(errors),
+                             alpha=0.2, color=color)
+        else:
+            plt.plot(x_values, values, 'o-', label=label, color=color)
+
+    metric_label = _metric_label(metric)
+    title = f'{metric_label} vs {"QPS" if x == "qps" else "Concurrency"}'
+    if error_metric and any(error is not None for points in data.values() for _, _, error in points):
+        title += ' with Standard Deviation'
+    plt.xlabel(X_AXIS_LABELS[x])
+    plt.ylabel(metric_label)
+    plt.title(title)
     plt.grid(True)
-    plt.legend(title='Model', bbox_to_anchor=(1.05, 1), loc='upper left')
+    plt.legend(title=' / '.join(field.capitalize() for field in group_by),
+               bbox_to_anchor=(1.05, 1), loc='upper left')
     plt.tight_layout()
     plt.savefig(filename, dpi=300, bbox_inches='tight')
     plt.close()
+    return True
+
+def load_result(filepath):
+    with open(filepath, 'r') as file:
+        return json.load(file)
+
+def plot_time_series(filepath, filename):
+    """Plot the windowed in-flight requests, throughput and TTFT/ITL
+    percentiles saved by benchmark_serving for one run."""
+    time_series = load_result(filepath).get('time_series')
+    if not time_series:
+        return False
+    window_start = np.array(time_series['window_start'])
+
+    def values(key):
+        return np.array([np.nan if value is None else value for value in time_series[key]])
+
+    fig, axes = plt.subplots(3, 1, figsize=(12, 10), sharex=True)
+    axes[0].plot(window_start, values('in_flight_requests'), 'o-', label='In-flight requests')
+    axes[0].set_ylabel('Requests')
+    axes[1].plot(window_start, values('output_throughput'), 'o-', label='Output tokens/s')
+    axes[1].set_ylabel('Tokens/s')
+    for key, style in (('p50_ttft_ms', 'o-'), ('p99_ttft_ms', 'o--'), ('p50_itl_ms', 's-'), ('p99_itl_ms', 's--')):
+        axes[2].plot(window_start, values(key), style, label=_metric_label(key))
+    axes[2].set_ylabel('Latency (ms)')
+    axes[2].set_yscale('log')
+    axes[2].set_xlabel(f"Time since start (s), {time_series['window_s']:g}s windows")
+    for ax in axes:
+        ax.grid(True)
+        ax.legend(loc='upper left')
+    axes[0].set_title(f'Time Series of {os.path.basename(filepath)}')
+    fig.tight_layout()
+    fig.savefig(filename, dpi=300, bbox_inches='tight')
+    plt.close(fig)
+    return True
 
 def main():
-    directory = './'
-    data = read_json_files(directory)
-    if data['tpot'] and data['ttft']:
-        create_chart(data['tpot'], 'tpot', 'tpot_vs_qps_chart.png')
-        create_chart(data['ttft'], 'ttft', 'ttft_vs_qps_chart.png')
-        print("Charts have been saved as 'tpot_vs_qps_chart.png' and 'ttft_vs_qps_chart.png'")
+    parser = argparse.ArgumentParser(description='Plot benchmark_serving results against QPS or concurrency.')
+    parser.add_argument('--result-dir', default='./', help='Directory with the result JSON files.')
+    parser.add_argument('--metrics', nargs='+', default=DEFAULT_METRICS,
+                        help='Result keys to plot, e.g. p99_ttft_ms or output_throughput.')
+    parser.add_argument('--x-axis', choices=list(X_AXIS_LABELS), default='qps',
+                        help='Plot open-loop runs against QPS or closed-loop runs against concurrency.')
+    parser.add_argument('--group-by', nargs='+', default=['backend', 'model'],
+                        help='Result keys that identify one line in the charts, '
+                             'e.g. backend model arrival_process arrival_burstiness.')
+    parser.add_argument('--num-workers', type=int, default=8,
+                        help='Number of threads used to read new result files.')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Do not read or write the summary index in the result directory.')
+    parser.add_argument('--time-series', nargs='+', metavar='RESULT',
+                        help='Plot the time series of these result files instead of the QPS charts.')
+    args = parser.parse_args()
+
+    if args.time_series:
+        for filepath in args.time_series:
+            filename = os.path.splitext(os.path.basename(filepath))[0] + '_time_series.png'
+            if plot_time_series(filepath, filename):
+                print(f"Time series has been saved as '{filename}'")
+            else:
+                print(f"No time series found in {filepath}.")
+        return
+
+    rows = index_results(args.result_dir, args.num_workers, use_cache=not args.no_cache)
+    saved = []
+    for metric in args.metrics:
+        filename = chart_filename(metric, args.x_axis)
+        if create_chart(rows, metric, filename, tuple(args.group_by), x=args.x_axis):
+            saved.append(filename)
+    if saved:
+        print('Charts have been saved as ' + ', '.join(f"'{filename}'" for filename in saved))
     else:
         print("No valid data found in the specified directory.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,12 +1,9 @@
 TOTAL_SECONDS=120
 QPS_RATES=("1" "3" "5" "7" "9")
 
-for QPS in ${QPS_RATES[@]}; do
-    NUM_PROMPTS=$((TOTAL_SECONDS * QPS))
-    echo "===== RUNNING NUM_PROMPTS = $NUM_PROMPTS QPS = $QPS ====="
+echo "===== RUNNING QPS = ${QPS_RATES[@]} FOR $TOTAL_SECONDS SECONDS EACH ====="
 
-    uv run benchmarks/benchmark_serving.py \
-        --model $MODEL \
-        --dataset-name sonnet --sonnet-input-len 550 --sonnet-output-len 150 --dataset-path benchmarks/sonnet.txt \
-        --num-prompts $NUM_PROMPTS --request-rate $QPS --save-result
-done
\ No newline at end of file
+uv run benchmarks/benchmark_serving.py \
+    --model $MODEL \
+    --dataset-name sonnet --sonnet-input-len 550 --sonnet-output-len 150 --dataset-path benchmarks/sonnet.txt \
+    --request-rates ${QPS_RATES[@]} --sweep-duration $TOTAL_SECONDS --save-result